@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class DesksConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'desks'
+
+    def ready(self):
+        import desks.signals  # Import the signals module
@@ -0,0 +1,116 @@
+"""
+Background copying of a desk's categories and tasks into a new desk.
+
+start_clone() records a DeskCloneJob and queues run_clone_job() on django_q.
+The job copies categories, schedules and their moments in bulk, remaps their
+IDs, and copies tasks in batches, updating the job's progress and the
+target's task counters after each one.
+"""
+import logging
+
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from django.utils.text import slugify
+from django_q.tasks import async_task
+
+from todo.models import Category, Schedule, ScheduleMoment, Task, TaskCountChanges
+from .models import Desk, DeskCloneJob
+
+logger = logging.getLogger(__name__)
+
+# Tasks copied per INSERT; progress is saved after each batch
+CLONE_BATCH_SIZE = 1000
+
+
+def start_clone(source, user, name):
+    """
+    Record a clone job and queue it once the surrounding transaction commits.
+
+    Returns:
+        DeskCloneJob: The pending job
+    """
+    job = DeskCloneJob.objects.create(source=source, user=user, name=name)
+    transaction.on_commit(lambda: async_task('desks.cloning.run_clone_job', job.id))
+    return job
+
+
+def run_clone_job(job_id):
+    """Copy the job's source desk; a failed copy is removed and the error recorded"""
+    job = DeskCloneJob.objects.select_related('source', 'user').get(id=job_id)
+    if job.source is None:
+        _finish(job, 'failed', error="The source desk no longer exists")
+        return
+
+    tasks = Task.objects.filter(category__desk=job.source)
+    # Claim the job so a redelivered queue message cannot run it twice
+    if not DeskCloneJob.objects.filter(id=job.id, status='pending').update(status='running', total=tasks.count()):
+        return
+    target = None
+    try:
+        with transaction.atomic():
+            target = Desk(name=job.name, user=job.user)
+            target.save(slug_base=f"{slugify(job.name)}-{job.user_id}")
+            sources = list(Category.objects.filter(desk=job.source).order_by('id'))
+            copies = Category.objects.bulk_create([
+                Category(title=category.title, description=category.description, desk=target)
+                for category in sources
+            ])
+            category_ids = {old.id: new.id for old, new in zip(sources, copies)}
+            schedule_ids = _copy_schedules(job.source, target)
+            DeskCloneJob.objects.filter(id=job.id).update(target=target)
+
+        # Each batch commits on its own so progress is visible while copying
+        rows = tasks.order_by('id').values_list('title', 'description', 'category_id', 'schedule_id', 'is_active')
+        batch = []
+        for row in rows.iterator(chunk_size=CLONE_BATCH_SIZE):
+            batch.append(row)
+            if len(batch) == CLONE_BATCH_SIZE:
+                _copy_tasks(job, target, batch, category_ids, schedule_ids)
+                batch = []
+        if batch:
+            _copy_tasks(job, target, batch, category_ids, schedule_ids)
+    except Exception as e:
+        logger.error(f"Error cloning desk {job.source_id} for job {job.id}: {e}")
+        if target is not None and target.pk is not None:
+            target.delete()
+        _finish(job, 'failed', error=str(e))
+        raise
+    _finish(job, 'done')
+
+
+def _copy_schedules(source, target):
+    """Copy the source desk's schedules and moments; returns the schedule ID remap"""
+    sources = list(Schedule.objects.filter(desk=source).order_by('id'))
+    copies = Schedule.objects.bulk_create([Schedule(title=schedule.title, desk=target) for schedule in sources])
+    schedule_ids = {old.id: new.id for old, new in zip(sources, copies)}
+    ScheduleMoment.objects.bulk_create([
+        ScheduleMoment(schedule_id=schedule_ids[schedule_id], day_of_week=day_of_week, time_of_day=time_of_day)
+        for schedule_id, day_of_week, time_of_day in ScheduleMoment.objects.filter(
+            schedule__desk=source
+        ).order_by('id').values_list('schedule_id', 'day_of_week', 'time_of_day')
+    ])
+    return schedule_ids
+
+
+def _copy_tasks(job, target, rows, category_ids, schedule_ids):
+    with transaction.atomic():
+        Task.objects.bulk_create([
+            Task(
+                title=title,
+                description=description,
+                category_id=category_ids[category_id],
+                schedule_id=schedule_ids.get(schedule_id),
+                is_active=is_active,
+            )
+            for title, description, category_id, schedule_id, is_active in rows
+        ])
+        counts = TaskCountChanges()
+        for _, _, category_id, _, is_active in rows:
+            counts.add_tasks(target.pk, category_ids[category_id], is_active)
+        counts.apply()
+        DeskCloneJob.objects.filter(id=job.id).update(copied=F('copied') + len(rows))
+
+
+def _finish(job, status, error=''):
+    DeskCloneJob.objects.filter(id=job.id).update(status=status, error=error, finished_at=timezone.now())
@@ -0,0 +1,19 @@
+# Generated by Django 5.1.15 on 2026-10-18 16:42
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('desks', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='desk',
+            index=models.Index(fields=['-created_at', '-id'], name='desks_desk_created_38ee86_idx'),
+        ),
+    ]
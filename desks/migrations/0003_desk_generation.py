@@ -0,0 +1,18 @@
+# Generated by Django 5.1.15 on 2026-10-18 16:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('desks', '0002_desk_listing_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='desk',
+            name='generation',
+            field=models.PositiveBigIntegerField(default=0, editable=False),
+        ),
+    ]
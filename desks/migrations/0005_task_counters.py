@@ -0,0 +1,23 @@
+# Generated by Django 5.1.15 on 2026-10-18 17:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('desks', '0004_desk_clone_job'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='desk',
+            name='active_task_count',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='desk',
+            name='task_count',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+    ]
@@ -1,8 +1,36 @@
 import uuid
-from django.db import models
+from django.db import IntegrityError, models, transaction
+from django.db.models import Case, F, FilteredRelation, Q, Value, When
 from django.contrib.auth.models import User
 from django.utils.text import slugify
 
+# How many slugs Desk.save() tries before giving up on concurrent inserts
+SLUG_ALLOCATION_ATTEMPTS = 5
+
+# Fields only ever moved with F() updates, which save() must not overwrite
+COUNTER_FIELDS = ('generation', 'task_count', 'active_task_count')
+
+class DeskQuerySet(models.QuerySet):
+    def accessible_to(self, user):
+        """
+        Desks the user owns or has been shared, annotated with the user's
+        `permission` level ('owner', 'admin' or 'view'), in a single query.
+        """
+        return self.annotate(
+            viewer_share=FilteredRelation('user_shares', condition=Q(user_shares__user=user)),
+        ).filter(
+            Q(user=user) | Q(viewer_share__isnull=False)
+        ).annotate(
+            permission=Case(
+                When(user=user, then=Value('owner')),
+                default=F('viewer_share__permission'),
+            ),
+        )
+
+    def bump_generation(self):
+        """Move the change generation of every desk in the queryset forward"""
+        return self.update(generation=F('generation') + 1)
+
 class Desk(models.Model):
     name = models.CharField(max_length=100)
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='desks')
@@ -10,25 +38,58 @@ class Desk(models.Model):
     updated_at = models.DateTimeField(auto_now=True)
     slug = models.SlugField(max_length=100, unique=True, blank=True)
     share_token = models.UUIDField(default=uuid.uuid4, editable=False)
+    # Bumped on every write to the desk's tasks, categories, schedules or
+    # shares; cheap validator for cached pages and fragments
+    generation = models.PositiveBigIntegerField(default=0, editable=False)
+    # Tasks on the desk, kept in step with its categories' counters by
+    # every task write; reconcile_counters repairs drift
+    task_count = models.IntegerField(default=0, editable=False)
+    active_task_count = models.IntegerField(default=0, editable=False)
+
+    objects = DeskQuerySet.as_manager()
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # Keyset pagination of the desks list
+            models.Index(fields=['-created_at', '-id']),
+        ]
     
     def __str__(self):
         return self.name
     
-    def save(self, *args, **kwargs):
-        # Generate a slug if not provided
-        if not self.slug:
-            base_slug = slugify(self.name)
-            slug = base_slug
-            counter = 1
-            while Desk.objects.filter(slug=slug).exists():
-                slug = f"{base_slug}-{counter}"
-                counter += 1
-            self.slug = slug
-        
-        super().save(*args, **kwargs)
+    def save(self, *args, slug_base=None, **kwargs):
+        """
+        Save the desk, allocating a unique slug first if it has none.
+
+        Args:
+            slug_base: Slug to derive the generated one from; defaults to
+                the slugified desk name
+        """
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            # Never write back a generation or counters that may have moved
+            # on since loading
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in COUNTER_FIELDS
+            ]
+
+        if self.slug:
+            return super().save(*args, **kwargs)
+
+        from .utils import allocate_unique_slug
+        base_slug = slug_base or slugify(self.name) or 'desk'
+        for attempt in range(SLUG_ALLOCATION_ATTEMPTS):
+            self.slug = allocate_unique_slug(Desk, base_slug)
+            try:
+                with transaction.atomic():
+                    return super().save(*args, **kwargs)
+            except IntegrityError:
+                # Retry only when a concurrent save took the same slug
+                slug_taken = Desk.objects.filter(slug=self.slug).exists()
+                self.slug = ''
+                if not slug_taken or attempt == SLUG_ALLOCATION_ATTEMPTS - 1:
+                    raise
     
     def refresh_share_token(self):
         self.share_token = uuid.uuid4()
@@ -69,3 +130,29 @@ class DeskUserShare(models.Model):
     
     class Meta:
         unique_together = ['desk', 'user']
+
+
+class DeskCloneJob(models.Model):
+    """Progress of a background copy of a desk's categories and tasks into a new desk"""
+    STATUS_CHOICES = (
+        ('pending', 'Pending'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    )
+
+    # Unguessable, since the job is polled by ID
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    source = models.ForeignKey(Desk, on_delete=models.SET_NULL, null=True, related_name='clone_jobs')
+    target = models.ForeignKey(Desk, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='desk_clone_jobs')
+    name = models.CharField(max_length=100)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    total = models.PositiveIntegerField(default=0)
+    copied = models.PositiveIntegerField(default=0)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"Clone of {self.source} as '{self.name}' ({self.status})"
@@ -0,0 +1,24 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from .models import Desk, DeskUserShare
+from .utils import invalidate_desk_access, invalidate_user_desk_access
+
+@receiver([post_save, post_delete], sender=Desk)
+def desk_changed(sender, instance, created=False, **kwargs):
+    """
+    Invalidate cached access when a desk is edited, changes owner or is deleted.
+    """
+    invalidate_desk_access(instance.slug)
+    if kwargs['signal'] is post_save and not created:
+        Desk.objects.filter(pk=instance.pk).bump_generation()
+
+@receiver([post_save, post_delete], sender=DeskUserShare)
+def desk_share_changed(sender, instance, origin=None, **kwargs):
+    """
+    Invalidate the shared user's cached access when their share changes.
+    """
+    if isinstance(origin, Desk):
+        # Deleting the desk already invalidated every entry
+        return
+    invalidate_user_desk_access(instance.desk.slug, instance.user_id)
+    Desk.objects.filter(pk=instance.desk_id).bump_generation()
\ No newline at end of file
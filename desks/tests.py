@@ -1,3 +1,264 @@
-from django.test import TestCase
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.db import IntegrityError
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+from django.utils.module_loading import import_string
+
+from todo.models import Category, ScheduleMoment, Task
+from todo.testing import DESK_SIZES, QueryBudgetMixin, clear_caches, seed_desk
+from .cloning import run_clone_job, start_clone
+from .models import Desk, DeskCloneJob, SLUG_ALLOCATION_ATTEMPTS
+from .utils import resolve_desk_access
+
+
+class DeskQueryBudgetTests(QueryBudgetMixin, TestCase):
+    """Every desks URL runs the same, budgeted number of queries for any desk size"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('owner', password='password')
+        cls.viewer = User.objects.create_user('viewer', password='password')
+        cls.desks = {
+            size: seed_desk(cls.user, f"Desk {size}", size)
+            for size in DESK_SIZES
+        }
+        for desk in cls.desks.values():
+            desk.share_with_user(cls.viewer)
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def desk_url(self, name, size, **kwargs):
+        return reverse(name, kwargs={'desk_id': self.desks[size].id, **kwargs})
+
+    def test_desks_list(self):
+        def request(size):
+            response = self.client.get(reverse('desks_list'))
+            self.assertEqual(response.status_code, 200)
+        self.assertQueryBudget('desks_list', request)
+
+    def test_desks_create(self):
+        def request(size):
+            response = self.client.post(reverse('desks_create'), {'desk_name': f"Created {size}"})
+            self.assertEqual(response.status_code, 302)
+        self.assertQueryBudget('desks_create', request)
+
+    def test_desks_rename(self):
+        def request(size):
+            response = self.client.post(self.desk_url('desks_rename', size), {'new_name': 'Renamed'})
+            self.assertEqual(response.status_code, 302)
+        self.assertQueryBudget('desks_rename', request)
+
+    def test_desks_delete(self):
+        def request(size):
+            response = self.client.post(self.desk_url('desks_delete', size))
+            self.assertEqual(response.status_code, 302)
+        self.assertQueryBudget('desks_delete', request)
+
+    def test_desks_edit(self):
+        def request(size):
+            response = self.client.get(self.desk_url('desks_edit', size))
+            self.assertEqual(response.status_code, 200)
+        self.assertQueryBudget('desks_edit', request)
+
+    def test_desks_edit_save(self):
+        def request(size):
+            response = self.client.post(self.desk_url('desks_edit', size), {
+                'desk_name': 'Edited',
+                'desk_description': 'Edited by the budget test',
+            })
+            self.assertEqual(response.status_code, 302)
+        self.assertQueryBudget('desks_edit_save', request)
+
+    def test_refresh_desk_token(self):
+        def request(size):
+            response = self.client.post(self.desk_url('refresh_desk_token', size))
+            self.assertEqual(response.status_code, 302)
+        self.assertQueryBudget('refresh_desk_token', request)
+
+    def test_desks_clone(self):
+        def request(size):
+            response = self.client.post(self.desk_url('desks_clone', size), {'name': 'Team copy'})
+            self.assertEqual(response.status_code, 202)
+        self.assertQueryBudget('desks_clone', request)
+
+    def test_desks_clone_status(self):
+        jobs = {size: start_clone(desk, self.user, 'Team copy') for size, desk in self.desks.items()}
+
+        def request(size):
+            response = self.client.get(reverse('desks_clone_status', kwargs={'job_id': jobs[size].id}))
+            self.assertEqual(response.json()['status'], 'pending')
+        self.assertQueryBudget('desks_clone_status', request)
+
+    def test_share_desk(self):
+        def request(size):
+            response = self.client.get(self.desk_url('share_desk', size))
+            self.assertEqual(response.status_code, 200)
+        self.assertQueryBudget('share_desk', request)
+
+    def test_accept_desk_share(self):
+        stranger = User.objects.create_user('stranger', password='password')
+        self.client.force_login(stranger)
+
+        def request(size):
+            token = self.desks[size].share_token
+            response = self.client.get(reverse('accept_desk_share', kwargs={'token': token}))
+            self.assertEqual(response.status_code, 302)
+        self.assertQueryBudget('accept_desk_share', request)
+
+    def test_remove_shared_user(self):
+        def request(size):
+            response = self.client.post(self.desk_url('remove_shared_user', size, user_id=self.viewer.id))
+            self.assertEqual(response.status_code, 302)
+        self.assertQueryBudget('remove_shared_user', request)
+
+    def test_update_user_permission(self):
+        def request(size):
+            response = self.client.post(
+                self.desk_url('update_user_permission', size, user_id=self.viewer.id),
+                {'permission': 'admin'}
+            )
+            self.assertEqual(response.status_code, 302)
+        self.assertQueryBudget('update_user_permission', request)
+
+
+class DeskSlugTests(TestCase):
+    """Desk slugs are unique, with a numeric suffix on collisions"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('owner', password='password')
+
+    def create(self, name='Home'):
+        desk = Desk(name=name, user=self.user)
+        desk.save()
+        return desk
+
+    def test_same_base_gets_next_suffix(self):
+        self.assertEqual([self.create().slug for _ in range(3)], ['home', 'home-1', 'home-2'])
+        self.assertEqual(self.create('Home office').slug, 'home-office')
+
+    def test_retries_when_a_concurrent_save_takes_the_slug(self):
+        self.create()
+        allocate = mock.Mock(side_effect=['home', 'home-1'])
+        with mock.patch('desks.utils.allocate_unique_slug', allocate):
+            self.assertEqual(self.create().slug, 'home-1')
+        self.assertEqual(allocate.call_count, 2)
+
+    def test_gives_up_after_allocation_attempts(self):
+        self.create()
+        allocate = mock.Mock(return_value='home')
+        with mock.patch('desks.utils.allocate_unique_slug', allocate), self.assertRaises(IntegrityError):
+            self.create()
+        self.assertEqual(allocate.call_count, SLUG_ALLOCATION_ATTEMPTS)
+
+
+class DeskAccessCacheTests(TestCase):
+    """Cached desk access is dropped as soon as a share or the desk changes"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('owner', password='password')
+        cls.viewer = User.objects.create_user('viewer', password='password')
+        cls.desk = seed_desk(cls.user, 'Cached', 3)
+        cls.desk.share_with_user(cls.viewer)
+
+    def setUp(self):
+        clear_caches()
+        self.client.force_login(self.user)
+
+    def resolve(self, user):
+        desk, permission = resolve_desk_access(self.desk.slug, user)
+        return desk and desk.pk, permission
+
+    def assertCached(self, user, expected):
+        self.assertEqual(self.resolve(user), expected)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.resolve(user), expected)
+
+    def test_share_removal(self):
+        self.assertCached(self.viewer, (self.desk.pk, 'view'))
+        self.client.post(reverse('remove_shared_user', kwargs={'desk_id': self.desk.id, 'user_id': self.viewer.id}))
+        self.assertEqual(self.resolve(self.viewer), (None, None))
+
+        viewer = Client()
+        viewer.force_login(self.viewer)
+        self.assertEqual(viewer.get(reverse('tasks_list', kwargs={'desk_slug': self.desk.slug})).status_code, 404)
+
+    def test_permission_change(self):
+        self.assertCached(self.viewer, (self.desk.pk, 'view'))
+        self.client.post(
+            reverse('update_user_permission', kwargs={'desk_id': self.desk.id, 'user_id': self.viewer.id}),
+            {'permission': 'admin'}
+        )
+        self.assertEqual(self.resolve(self.viewer), (self.desk.pk, 'admin'))
+
+    def test_desk_deletion(self):
+        self.assertCached(self.user, (self.desk.pk, 'owner'))
+        self.assertCached(self.viewer, (self.desk.pk, 'view'))
+        self.client.post(reverse('desks_delete', kwargs={'desk_id': self.desk.id}))
+        self.assertEqual(self.resolve(self.user), (None, None))
+        self.assertEqual(self.resolve(self.viewer), (None, None))
+
+    @override_settings(DESK_ACCESS_CACHE_TIMEOUT=0)
+    def test_cache_can_be_disabled(self):
+        for _ in range(2):
+            with self.assertNumQueries(1):
+                self.assertEqual(self.resolve(self.viewer), (self.desk.pk, 'view'))
+
+
+def run_inline(func, *args, **kwargs):
+    return import_string(func)(*args)
+
+
+class DeskCloneTests(TestCase):
+    """Cloning copies categories and tasks into a new desk in the background"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('owner', password='password')
+        cls.member = User.objects.create_user('member', password='password')
+        cls.desk = seed_desk(cls.user, 'Template', 25)
+        cls.desk.share_with_user(cls.member)
+
+    @mock.patch('desks.cloning.CLONE_BATCH_SIZE', 10)
+    def test_copies_categories_and_tasks(self):
+        job = start_clone(self.desk, self.member, 'Team desk')
+        run_clone_job(job.id)
+
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.total, job.copied), ('done', 25, 25))
+        target = Desk.objects.get(name='Team desk')
+        self.assertEqual(target.user, self.member)
+        self.assertEqual(Category.objects.filter(desk=target).count(), 5)
+        copied = Task.objects.filter(category__desk=target)
+        self.assertEqual(copied.count(), 25)
+        self.assertEqual((target.task_count, target.active_task_count), (25, 9))
+        self.assertEqual(copied.filter(schedule__desk=target).count(), 12)
+        self.assertEqual(ScheduleMoment.objects.filter(schedule__desk=target).count(), 1)
+        self.assertEqual(
+            sorted(copied.values_list('title', 'category__title')),
+            sorted(Task.objects.filter(category__desk=self.desk).values_list('title', 'category__title'))
+        )
+
+    @mock.patch('desks.cloning.async_task', run_inline)
+    def test_clone_view_and_progress(self):
+        self.client.force_login(self.member)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('desks_clone', kwargs={'desk_id': self.desk.id}))
+        self.assertEqual(response.status_code, 202)
+
+        status = self.client.get(response.json()['status_url']).json()
+        self.assertEqual(status['status'], 'done')
+        self.assertEqual(status['copied'], 25)
+        target = DeskCloneJob.objects.get().target
+        self.assertEqual(target.name, 'Copy of Template')
+        self.assertEqual(status['desk_url'], reverse('tasks_list', kwargs={'desk_slug': target.slug}))
+
+    def test_clone_requires_access(self):
+        stranger = User.objects.create_user('stranger', password='password')
+        self.client.force_login(stranger)
+        response = self.client.post(reverse('desks_clone', kwargs={'desk_id': self.desk.id}))
+        self.assertEqual(response.status_code, 404)
@@ -10,6 +10,8 @@ urlpatterns = [
     path('<int:desk_id>/delete/', views.delete_desk, name='desks_delete'),
     path('<int:desk_id>/edit/', views.edit_desk, name='desks_edit'),
     path('<int:desk_id>/refresh-token/', views.refresh_desk_token, name='refresh_desk_token'),
+    path('<int:desk_id>/clone/', views.clone_desk, name='desks_clone'),
+    path('clone-jobs/<uuid:job_id>/', views.clone_job_status, name='desks_clone_status'),
     
     # Share-related URLs
     path('<int:desk_id>/share/', views.share_desk, name='share_desk'),
@@ -1,56 +1,139 @@
-from django.utils.text import slugify
-from .models import DeskUserShare
-
-def generate_unique_slug(base_name, user_id, model_class):
-    """Generate a unique slug based on name and user_id."""
-    base_slug = slugify(base_name)
-    slug = f"{base_slug}-{user_id}"
-    counter = 1
-    while model_class.objects.filter(slug=slug).exists():
-        slug = f"{base_slug}-{user_id}-{counter}"
-        counter += 1
-    return slug
-
-def get_user_desk_permissions(user, desk):
-    """
-    Get a user's permissions for a desk
-    Returns a dict with can_view, can_edit, is_admin permissions
-    """
-    # Owner has all permissions
-    if desk.user == user:
-        return {
-            'can_view': True,
-            'can_edit': True, 
-            'is_admin': True,
-            'is_owner': True
-        }
-    
-    # Get the user's share
+import re
+import uuid
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, IntegerField, Max, Q
+from django.db.models.functions import Cast, Substr
+from django.utils.dateparse import parse_datetime
+from .models import Desk
+
+def allocate_unique_slug(model_class, base_slug):
+    """
+    Return base_slug if it is free, otherwise base_slug-<n> with the next
+    unused suffix, using a single query over the slug index.
+
+    The result can still be taken by a concurrent insert, so callers must
+    retry on IntegrityError.
+    """
+    suffixed = Q(slug__regex=rf"^{re.escape(base_slug)}-[0-9]+$")
+    taken = model_class.objects.filter(
+        # Range on the slug index covering every "<base_slug>-..." value
+        Q(slug=base_slug) | Q(slug__gt=f"{base_slug}-", slug__lt=f"{base_slug}.")
+    ).aggregate(
+        base_taken=Count('id', filter=Q(slug=base_slug)),
+        max_suffix=Max(Cast(Substr('slug', len(base_slug) + 2), IntegerField()), filter=suffixed),
+    )
+    if not taken['base_taken'] and taken['max_suffix'] is None:
+        return base_slug
+    return f"{base_slug}-{(taken['max_suffix'] or 0) + 1}"
+
+def encode_desk_cursor(desk):
+    """Encode a desk's position in the desks list as a keyset cursor"""
+    return f"{desk.created_at.isoformat()}_{desk.id}"
+
+def decode_desk_cursor(value):
+    """Decode a keyset cursor into (created_at, id), or None if invalid"""
+    if not value:
+        return None
+    created_at, _, desk_id = value.rpartition('_')
     try:
-        share = DeskUserShare.objects.get(desk=desk, user=user)
-        permission = share.permission
-        
-        if permission == 'admin':
-            return {
-                'can_view': True,
-                'can_edit': True,
-                'is_admin': True,
-                'is_owner': False
-            }
-        elif permission == 'view':
-            return {
-                'can_view': True,
-                'can_edit': False,
-                'is_admin': False,
-                'is_owner': False
-            }
-    except DeskUserShare.DoesNotExist:
-        # No permissions
-        pass
-        
-    return {
-        'can_view': False,
-        'can_edit': False,
-        'is_admin': False,
-        'is_owner': False
-    }
\ No newline at end of file
+        created_at = parse_datetime(created_at)
+        desk_id = int(desk_id)
+    except ValueError:
+        return None
+    if created_at is None:
+        return None
+    return created_at, desk_id
+
+def _access_key(slug, user_id):
+    return f"desk-access:{user_id}:{slug}"
+
+def _access_generation_key(slug):
+    return f"desk-access-generation:{slug}"
+
+def _access_cache_keys(slug, user):
+    return [_access_key(slug, user.id), _access_generation_key(slug)]
+
+def _cached_access(cached, slug, user):
+    """
+    Read the result of a get_many() of _access_cache_keys().
+
+    Returns:
+        tuple: (generation or None, (desk, permission) or None on a miss)
+    """
+    generation = cached.get(_access_generation_key(slug))
+    entry = cached.get(_access_key(slug, user.id))
+    if generation is not None and entry is not None and entry[0] == generation:
+        return generation, entry[1:]
+    return generation, None
+
+def _accessible_desk(slug, user):
+    """Queryset of the desk with the user's permission annotated, if they can open it"""
+    return Desk.objects.accessible_to(user).filter(slug=slug)
+
+def _access_result(desk):
+    return desk, desk.permission if desk else None
+
+def resolve_desk_access(slug, user):
+    """
+    Resolve a desk by slug together with the user's permission level.
+
+    Results are cached across requests for DESK_ACCESS_CACHE_TIMEOUT
+    seconds. Entries are tagged with a per-slug generation which
+    invalidate_desk_access() replaces whenever the desk changes, and
+    invalidate_user_desk_access() drops a single user's entry when their
+    share changes. Invalidations only reach processes sharing the cache, so
+    several workers need a shared backend.
+
+    Returns:
+        tuple: (desk, permission), or (None, None) without access
+    """
+    if not user.is_authenticated:
+        return None, None
+    timeout = settings.DESK_ACCESS_CACHE_TIMEOUT
+    if not timeout:
+        return _access_result(_accessible_desk(slug, user).first())
+
+    generation, access = _cached_access(cache.get_many(_access_cache_keys(slug, user)), slug, user)
+    if access is not None:
+        return access
+    if generation is None:
+        # Start a generation before reading so a concurrent change replaces it
+        cache.add(_access_generation_key(slug), uuid.uuid4().hex, timeout)
+        generation = cache.get(_access_generation_key(slug))
+
+    access = _access_result(_accessible_desk(slug, user).first())
+    cache.set(_access_key(slug, user.id), (generation, *access), timeout)
+    return access
+
+async def aresolve_desk_access(slug, user):
+    """
+    Async version of resolve_desk_access(), sharing its cache entries.
+
+    Returns:
+        tuple: (desk, permission), or (None, None) without access
+    """
+    if not user.is_authenticated:
+        return None, None
+    timeout = settings.DESK_ACCESS_CACHE_TIMEOUT
+    if not timeout:
+        return _access_result(await _accessible_desk(slug, user).afirst())
+
+    generation, access = _cached_access(await cache.aget_many(_access_cache_keys(slug, user)), slug, user)
+    if access is not None:
+        return access
+    if generation is None:
+        await cache.aadd(_access_generation_key(slug), uuid.uuid4().hex, timeout)
+        generation = await cache.aget(_access_generation_key(slug))
+
+    access = _access_result(await _accessible_desk(slug, user).afirst())
+    await cache.aset(_access_key(slug, user.id), (generation, *access), timeout)
+    return access
+
+def invalidate_desk_access(slug):
+    """Drop every cached access entry for a desk"""
+    cache.set(_access_generation_key(slug), uuid.uuid4().hex, settings.DESK_ACCESS_CACHE_TIMEOUT)
+
+def invalidate_user_desk_access(slug, user_id):
+    """Drop one user's cached access entry for a desk"""
+    cache.delete(_access_key(slug, user_id))
\ No newline at end of file
@@ -3,27 +3,40 @@ from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.urls import reverse
 from django.contrib.auth.models import User
-from .models import Desk, DeskUserShare
-from .utils import generate_unique_slug
-from django.http import HttpResponseBadRequest
-from todo.models import Category, Task
+from .models import Desk, DeskUserShare, DeskCloneJob
+from .utils import encode_desk_cursor, decode_desk_cursor
+from .cloning import start_clone
+from django.db.models import Q
+from django.utils.text import slugify
+from django.http import HttpResponseBadRequest, JsonResponse
+from todo.models import Category
+
+# Number of desks per page of the desks list
+DESKS_PAGE_SIZE = 50
 
 @login_required
 def my_desks(request):
-    # Get desks owned by the user
-    owned_desks = Desk.objects.filter(user=request.user)
-    
-    # Get desks shared with the user via DeskUserShare
-    shared_desk_ids = DeskUserShare.objects.filter(user=request.user).values_list('desk_id', flat=True)
-    shared_desks = Desk.objects.filter(id__in=shared_desk_ids)
+    """List the desks the user owns or has been shared, a page at a time"""
+    # Owned and shared desks with their owner and the viewer's permission, in one query
+    desks = Desk.objects.accessible_to(request.user).select_related('user').order_by('-created_at', '-id')
+
+    # Keyset pagination: continue after the last desk of the previous page
+    after = decode_desk_cursor(request.GET.get('after'))
+    if after:
+        created_at, desk_id = after
+        desks = desks.filter(
+            Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=desk_id)
+        )
 
-    # Combine the querysets (owned + shared)
-    desks = owned_desks | shared_desks
+    desks = list(desks[:DESKS_PAGE_SIZE + 1])
+    next_cursor = None
+    if len(desks) > DESKS_PAGE_SIZE:
+        desks = desks[:DESKS_PAGE_SIZE]
+        next_cursor = encode_desk_cursor(desks[-1])
     
     return render(request, 'my-desks.html', {
-        'owned_desks': owned_desks,
-        'shared_desks': shared_desks,
-        'desks': desks
+        'desks': desks,
+        'next_cursor': next_cursor
     })
 
 @login_required
@@ -37,15 +50,9 @@ def create_desk(request):
             messages.error(request, "Desk name is required.")
             return redirect('desks_create')
 
-        # Generate a unique slug for the desk
-        slug = generate_unique_slug(desk_name, request.user.id, Desk)
-
-        # Create desk with a share token
-        desk = Desk.objects.create(
-            name=desk_name,
-            slug=slug,
-            user=request.user
-        )
+        # Create desk with a share token and a unique slug based on name and user
+        desk = Desk(name=desk_name, user=request.user)
+        desk.save(slug_base=f"{slugify(desk_name)}-{request.user.id}")
         
         messages.success(request, f"Desk '{desk_name}' created successfully.")
         
@@ -58,6 +65,34 @@ def create_desk(request):
         
     return render(request, 'create_desk.html')
 
+@login_required
+def clone_desk(request, desk_id):
+    """Queue a copy of a desk's categories and tasks and return the job handle"""
+    if request.method != 'POST':
+        return HttpResponseBadRequest("Invalid request method.")
+    source = get_object_or_404(Desk.objects.accessible_to(request.user), id=desk_id)
+    name = request.POST.get('name') or f"Copy of {source.name}"
+    job = start_clone(source, request.user, name[:Desk._meta.get_field('name').max_length])
+    return JsonResponse({
+        'job': str(job.id),
+        'status': job.status,
+        'status_url': reverse('desks_clone_status', kwargs={'job_id': job.id}),
+    }, status=202)
+
+@login_required
+def clone_job_status(request, job_id):
+    """Report the progress of one of the user's clone jobs"""
+    job = get_object_or_404(DeskCloneJob.objects.select_related('target'), id=job_id, user=request.user)
+    done = job.status == 'done' and job.target is not None
+    return JsonResponse({
+        'job': str(job.id),
+        'status': job.status,
+        'total': job.total,
+        'copied': job.copied,
+        'error': job.error,
+        'desk_url': reverse('tasks_list', kwargs={'desk_slug': job.target.slug}) if done else None,
+    })
+
 @login_required
 def rename_desk(request, desk_id):
     if request.method == 'POST':
@@ -98,7 +133,6 @@ def edit_desk(request, desk_id):
     
     # Get additional data for the template
     categories = Category.objects.filter(desk=desk)
-    tasks_count = Task.objects.filter(category__desk=desk).count()
     
     # Get users who have access to this desk
     shared_user_ids = DeskUserShare.objects.filter(desk=desk).values_list('user_id', flat=True)
@@ -107,7 +141,7 @@ def edit_desk(request, desk_id):
     return render(request, 'edit-desk.html', {
         'desk': desk,
         'categories': categories,
-        'tasks_count': tasks_count,
+        'tasks_count': desk.task_count,
         'shared_users': shared_users
     })
 
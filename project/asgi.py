@@ -14,3 +14,8 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'project.settings')
 
 application = get_asgi_application()
+
+# Run the event-driven scheduler inside the server process if so configured
+from todo.scheduler import start_embedded
+
+start_embedded()
@@ -0,0 +1,246 @@
+"""
+Per-view request instrumentation.
+
+RequestMetricsMiddleware records, for every resolved URL name, the wall time,
+SQL query count, SQL time and template render time of each request into
+in-process histograms. metrics_view exposes them in the Prometheus text
+format, or as JSON with ?format=json.
+
+Enable it with REQUEST_METRICS['enabled']. Template render time is only
+measured when TEMPLATES uses the DjangoTemplates backend from this module.
+Histograms live in process memory, so each worker reports its own.
+"""
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.contrib.admin.views.decorators import staff_member_required
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.http import HttpResponse, JsonResponse
+from django.template.backends import django as django_backend
+
+# Statistics of the request being handled in the current context, if any
+_current = ContextVar('request_metrics', default=None)
+
+DEFAULT_DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+DEFAULT_QUERY_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+# name -> (help text, bucket kind)
+METRICS = {
+    'request_duration_seconds': ('Wall time of the request', 'duration'),
+    'request_queries': ('SQL queries run by the request', 'queries'),
+    'request_sql_seconds': ('Time spent executing SQL', 'duration'),
+    'request_template_seconds': ('Time spent rendering templates', 'duration'),
+}
+
+
+class Histogram:
+    """Cumulative histogram with fixed upper bounds; the caller holds the lock"""
+
+    def __init__(self, buckets):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # Last slot is +Inf
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self):
+        """Yield (upper bound, cumulative count) pairs ending with +Inf"""
+        total = 0
+        for bound, count in zip(self.buckets + (float('inf'),), self.counts):
+            total += count
+            yield bound, total
+
+
+class Registry:
+    """Histograms of every metric, keyed by URL name"""
+
+    def __init__(self, duration_buckets=DEFAULT_DURATION_BUCKETS, query_buckets=DEFAULT_QUERY_BUCKETS):
+        self.buckets = {'duration': duration_buckets, 'queries': query_buckets}
+        self._lock = threading.Lock()
+        self._views = {}  # url name -> {metric name: Histogram}
+
+    def record(self, view, stats, duration):
+        values = {
+            'request_duration_seconds': duration,
+            'request_queries': stats.queries,
+            'request_sql_seconds': stats.sql_time,
+            'request_template_seconds': stats.template_time,
+        }
+        with self._lock:
+            histograms = self._views.get(view)
+            if histograms is None:
+                histograms = self._views[view] = {
+                    name: Histogram(self.buckets[kind]) for name, (_, kind) in METRICS.items()
+                }
+            for name, value in values.items():
+                histograms[name].observe(value)
+
+    def snapshot(self):
+        """Return {view: {metric: {'buckets': [(bound, cumulative)], 'sum', 'count'}}}"""
+        with self._lock:
+            return {
+                view: {
+                    name: {
+                        'buckets': list(histogram.cumulative()),
+                        'sum': histogram.sum,
+                        'count': histogram.count,
+                    }
+                    for name, histogram in histograms.items()
+                }
+                for view, histograms in self._views.items()
+            }
+
+    def reset(self):
+        with self._lock:
+            self._views.clear()
+
+
+registry = Registry()
+
+
+class RequestStats:
+    __slots__ = ('queries', 'sql_time', 'template_time')
+
+    def __init__(self):
+        self.queries = 0
+        self.sql_time = 0.0
+        self.template_time = 0.0
+
+
+def record_query(execute, sql, params, many, context):
+    """Database execute wrapper adding the query to the current request's stats"""
+    stats = _current.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats.sql_time += time.perf_counter() - started
+        stats.queries += 1
+
+
+def instrument_connection(connection, **kwargs):
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+class RequestMetricsMiddleware:
+    """Record per-view metrics of every request into the module registry"""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        config = getattr(settings, 'REQUEST_METRICS', {})
+        if not config.get('enabled', False):
+            raise MiddlewareNotUsed
+        registry.buckets = {
+            'duration': tuple(config.get('duration_buckets', DEFAULT_DURATION_BUCKETS)),
+            'queries': tuple(config.get('query_buckets', DEFAULT_QUERY_BUCKETS)),
+        }
+        # Connections are per thread, so hook every new one as well as any
+        # already open in this thread
+        connection_created.connect(instrument_connection, dispatch_uid='request_metrics')
+        for connection in connections.all(initialized_only=True):
+            instrument_connection(connection)
+
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        stats = RequestStats()
+        token = _current.set(stats)
+        started = time.perf_counter()
+        try:
+            return self.get_response(request)
+        finally:
+            self.finish(request, stats, started, token)
+
+    async def __acall__(self, request):
+        stats = RequestStats()
+        token = _current.set(stats)
+        started = time.perf_counter()
+        try:
+            return await self.get_response(request)
+        finally:
+            self.finish(request, stats, started, token)
+
+    def finish(self, request, stats, started, token):
+        duration = time.perf_counter() - started
+        _current.reset(token)
+        match = getattr(request, 'resolver_match', None)
+        view = match.view_name if match is not None else '<unresolved>'
+        registry.record(view, stats, duration)
+
+
+class DjangoTemplates(django_backend.DjangoTemplates):
+    """DjangoTemplates backend whose templates report their render time"""
+
+    def from_string(self, template_code):
+        return TimedTemplate(super().from_string(template_code))
+
+    def get_template(self, template_name):
+        return TimedTemplate(super().get_template(template_name))
+
+
+class TimedTemplate:
+    def __init__(self, template):
+        self.template = template
+
+    def __getattr__(self, name):
+        return getattr(self.template, name)
+
+    def render(self, context=None, request=None):
+        stats = _current.get()
+        if stats is None:
+            return self.template.render(context, request)
+        started = time.perf_counter()
+        try:
+            return self.template.render(context, request)
+        finally:
+            stats.template_time += time.perf_counter() - started
+
+
+def format_prometheus(snapshot):
+    lines = []
+    for name, (help_text, _) in METRICS.items():
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} histogram")
+        for view, histograms in sorted(snapshot.items()):
+            histogram = histograms[name]
+            label = view.replace('\\', '\\\\').replace('"', '\\"')
+            for bound, count in histogram['buckets']:
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                lines.append(f'{name}_bucket{{view="{label}",le="{le}"}} {count}')
+            lines.append(f'{name}_sum{{view="{label}"}} {histogram["sum"]}')
+            lines.append(f'{name}_count{{view="{label}"}} {histogram["count"]}')
+    return '\n'.join(lines) + '\n'
+
+
+@staff_member_required
+def metrics_view(request):
+    """Expose the collected metrics to staff, as Prometheus text or JSON"""
+    snapshot = registry.snapshot()
+    if request.GET.get('format') == 'json':
+        for histograms in snapshot.values():
+            for histogram in histograms.values():
+                histogram['buckets'] = [
+                    ['+Inf' if bound == float('inf') else bound, count]
+                    for bound, count in histogram['buckets']
+                ]
+        return JsonResponse(snapshot)
+    return HttpResponse(format_prometheus(snapshot), content_type='text/plain; version=0.0.4; charset=utf-8')
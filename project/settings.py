@@ -44,6 +44,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'project.metrics.RequestMetricsMiddleware',  # Outermost so it times the whole stack
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -57,7 +58,7 @@ ROOT_URLCONF = 'project.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'BACKEND': 'project.metrics.DjangoTemplates',  # Reports render time to the metrics middleware
         'DIRS': [BASE_DIR / 'project' / 'templates'],  # Add this line
         'APP_DIRS': True,
         'OPTIONS': {
@@ -86,6 +87,41 @@ DATABASES = {
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/5.1/topics/cache/
+# The local-memory cache is per process; use a shared backend (Redis,
+# Memcached) when running several workers so invalidations reach all of them.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    # Rendered desk fragments; FileBasedCache also works for local use, e.g.
+    # 'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+    # 'LOCATION': BASE_DIR / 'cache' / 'fragments',
+    'fragments': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'fragments',
+    },
+}
+
+# Seconds rendered desk fragments are kept; writes invalidate them earlier
+TASK_FRAGMENT_TIMEOUT = 600
+
+# Tasks per page of the desk, manage and status views; later pages load on demand
+TASK_PAGE_SIZE = 100
+
+# Results per page of the cross-desk task search
+TASK_SEARCH_PAGE_SIZE = 20
+
+# Seconds a resolved desk/permission pair stays cached across requests in the
+# default cache. Revoking access only invalidates the cache the revoking
+# process uses: with the per-process LocMemCache and several workers, a
+# removed share keeps working elsewhere for up to this long. Running more than
+# one worker requires a shared backend (Redis, Memcached), or 0 to disable.
+DESK_ACCESS_CACHE_TIMEOUT = 60
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
 
@@ -152,3 +188,47 @@ Q_CLUSTER = {
     'bulk': 10,
     'orm': 'default',
 }
+
+# Task scheduler settings
+# 'poll' activates scheduled tasks through a django_q job every minute.
+# 'event' leaves activation to the event-driven engine, run either with
+# `manage.py run_scheduler` or embedded in the server process.
+TASK_SCHEDULER = {
+    'mode': 'poll',
+    'embedded': False,  # Start the engine inside the ASGI/WSGI process
+    'resync_interval': 300,  # Seconds between full reloads of schedule moments
+    'catch_up': 3600,  # Seconds a moment missed by the poll may still fire late
+    'history_size': 10000,  # Scheduler runs kept for telemetry, about a week of polls
+}
+
+# Task completion analytics, rolled up from the task event log by a django_q job
+TASK_ANALYTICS = {
+    'on_time': 86400,  # Seconds after a scheduled activation a completion still counts as on time
+    'rollup_interval': 5,  # Minutes between rollup runs
+    'batch_size': 10000,  # Events folded into the rollups per transaction
+    'settle': 60,  # Seconds an event waits before it is folded, so none still committing is skipped
+    'hourly_retention': 14,  # Days of hourly rollups kept; daily rollups are kept for good
+}
+
+# Live task updates pushed over Server-Sent Events
+TASK_EVENTS = {
+    'backend': 'todo.pubsub.LocalPubSub',  # In-process; subscribers must share the process
+    'heartbeat': 15,  # Seconds between keep-alive comments on idle streams
+    # Under WSGI each open stream holds a worker thread; streams end after this
+    # many seconds and the browser reconnects. 0 answers 204 so clients poll.
+    'sync_timeout': 300,
+    # Seconds between the catch-up polls a desk page keeps making while its
+    # stream is open. LocalPubSub only reaches streams served by the process
+    # that made the change, so activations by the qcluster and writes handled
+    # by other workers arrive through these polls. 0 stops polling while
+    # streaming, which only suits a cross-process backend.
+    'stream_poll_interval': 5,
+}
+
+
+# Per-view request metrics, served to staff at /metrics/
+REQUEST_METRICS = {
+    'enabled': False,
+    'duration_buckets': (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),  # Seconds
+    'query_buckets': (1, 2, 5, 10, 20, 50, 100, 200, 500),
+}
\ No newline at end of file
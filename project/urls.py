@@ -17,10 +17,12 @@ Including another URLconf
 from django.contrib import admin
 from django.urls import path, include
 from todo import views as todo_views
+from project.metrics import metrics_view
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('accounts/', include('accounts.urls')),  # Include accounts URLs under /accounts/
     path('my-desks/', include('desks.urls')),  # Include desks URLs under /my-desks/
+    path('metrics/', metrics_view, name='metrics'),  # Before todo URLs, which match any slug
     path('', include('todo.urls')),  # Include todo URLs at the root level
 ]
@@ -14,3 +14,8 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'project.settings')
 
 application = get_wsgi_application()
+
+# Run the event-driven scheduler inside the server process if so configured
+from todo.scheduler import start_embedded
+
+start_embedded()
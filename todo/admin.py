@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Task, Category, Desk, UserProfile, Schedule, ScheduleMoment
+from .models import Task, Category, Desk, UserProfile, Schedule, ScheduleMoment, SchedulerRun
 
 class UserProfileAdmin(admin.ModelAdmin):
     list_display = ('user',)  # Removed 'mode' field
@@ -19,7 +19,23 @@ class ScheduleMomentInline(admin.TabularInline):
 @admin.register(Schedule)
 class ScheduleAdmin(admin.ModelAdmin):
     inlines = [ScheduleMomentInline]
-    list_display = ('title',)
+    list_display = ('title', 'desk')
+    list_select_related = ('desk',)
+    # Finds the schedules no desk owns yet
+    list_filter = (('desk', admin.EmptyFieldListFilter),)
+
+@admin.register(SchedulerRun)
+class SchedulerRunAdmin(admin.ModelAdmin):
+    list_display = ('started_at', 'trigger', 'duration', 'scanned', 'activated', 'skipped', 'mean_lag', 'max_lag')
+    list_filter = ('trigger',)
+    date_hierarchy = 'started_at'
+
+    # Runs are written by the scheduler only
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
 
 admin.site.register(UserProfile, UserProfileAdmin)
 admin.site.register(Desk, DeskAdmin)
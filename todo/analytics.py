@@ -0,0 +1,238 @@
+"""
+Task completion analytics, rolled up from the task event log.
+
+Every change of a task's active state appends a TaskEvent. The django_q job
+update_task_rollups() folds the events logged since its last run into
+HourlyTaskRollup and DailyTaskRollup rows, one batch per transaction,
+adding to the counts rather than recomputing them. desk_stats() reads only
+the rollups, so its cost grows with the days asked for and not with the
+number of events.
+
+A completion is paired with the activation it ends. When that activation
+came from the task's schedule, the completion counts as on time or late,
+towards the period the task came due in.
+"""
+import logging
+from collections import defaultdict
+from datetime import timedelta, timezone as dt_timezone
+from itertools import takewhile
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from .models import Category, DailyTaskRollup, HourlyTaskRollup, TaskEvent, TaskRollupCursor
+
+logger = logging.getLogger(__name__)
+
+# Counts held by each rollup row
+ROLLUP_FIELDS = ('activated', 'scheduled', 'completed', 'on_time', 'late', 'completion_seconds')
+
+# Defaults for the TASK_ANALYTICS settings
+ON_TIME_WINDOW = 86400
+ROLLUP_BATCH_SIZE = 10000
+ROLLUP_SETTLE = 60
+HOURLY_ROLLUP_RETENTION = 14
+
+# Longest ranges the stats endpoint serves
+MAX_STATS_DAYS = 366
+MAX_STATS_HOURS = 24 * 7
+
+
+def _setting(name, default):
+    return settings.TASK_ANALYTICS.get(name, default)
+
+
+def hour_of(moment):
+    """Start of the UTC hour a datetime falls in"""
+    return moment.astimezone(dt_timezone.utc).replace(minute=0, second=0, microsecond=0)
+
+
+def update_task_rollups(now=None, batch_size=None):
+    """
+    Fold the events logged since the last run into the hourly and daily
+    rollups. Events younger than TASK_ANALYTICS['settle'] seconds wait for
+    the next run, so writes still committing are not skipped.
+
+    Args:
+        now: Time of the run; defaults to now
+        batch_size: Events folded per transaction; defaults to
+            TASK_ANALYTICS['batch_size']
+
+    Returns:
+        int: Number of events folded
+    """
+    now = now or timezone.now()
+    batch_size = batch_size or _setting('batch_size', ROLLUP_BATCH_SIZE)
+    settled = now - timedelta(seconds=_setting('settle', ROLLUP_SETTLE))
+    folded = 0
+    while True:
+        with transaction.atomic():
+            # The locked cursor keeps concurrent runs from folding an event twice
+            cursor, _ = TaskRollupCursor.objects.select_for_update().get_or_create(pk=1)
+            events = list(TaskEvent.objects.filter(
+                id__gt=cursor.last_event_id
+            ).order_by('id').values_list('id', 'task_id', 'desk_id', 'category_id', 'kind', 'at')[:batch_size])
+            fetched = len(events)
+            # Stop at the first unsettled event: the cursor must not pass it
+            events = list(takewhile(lambda event: event[5] < settled, events))
+            if not events:
+                break
+            _fold(events, cursor.last_event_id, now)
+            cursor.last_event_id = events[-1][0]
+            cursor.save()
+        folded += len(events)
+        if len(events) < fetched or fetched < batch_size:
+            break
+    logger.info(f"Folded {folded} task events into the rollups")
+    return folded
+
+
+def _fold(events, last_event_id, now):
+    """Add a batch of events, in ID order, to the rollups"""
+    on_time_window = _setting('on_time', ON_TIME_WINDOW)
+    hourly_start = hour_of(now - timedelta(days=_setting('hourly_retention', HOURLY_ROLLUP_RETENTION)))
+    # (desk_id, category_id, hour or day) -> counts in ROLLUP_FIELDS order
+    hourly = defaultdict(lambda: [0] * len(ROLLUP_FIELDS))
+    daily = defaultdict(lambda: [0] * len(ROLLUP_FIELDS))
+
+    def add(desk_id, category_id, at, **counts):
+        for rollup, period in ((daily, timezone.localdate(at)), (hourly, hour_of(at))):
+            if rollup is hourly and period < hourly_start:
+                # A late completion of a task due before the pruned hours
+                continue
+            row = rollup[desk_id, category_id, period]
+            for index, field in enumerate(ROLLUP_FIELDS):
+                row[index] += counts.get(field, 0)
+
+    # Latest event of each task before this batch, for completions whose
+    # activation was folded by an earlier run
+    task_ids = {event[1] for event in events if event[4] == TaskEvent.COMPLETED}
+    previous = {
+        task_id: (kind, desk_id, category_id, at)
+        for task_id, desk_id, category_id, kind, at in TaskEvent.objects.filter(
+            id__in=TaskEvent.objects.filter(
+                task_id__in=task_ids, id__lte=last_event_id
+            ).values('task_id').annotate(last=Max('id')).values('last')
+        ).values_list('task_id', 'desk_id', 'category_id', 'kind', 'at')
+    } if task_ids and last_event_id else {}
+
+    for _, task_id, desk_id, category_id, kind, at in events:
+        if kind == TaskEvent.COMPLETED:
+            add(desk_id, category_id, at, completed=1)
+            activation = previous.get(task_id)
+            if activation is not None and activation[0] == TaskEvent.SCHEDULED:
+                _, due_desk_id, due_category_id, due_at = activation
+                seconds = max(int((at - due_at).total_seconds()), 0)
+                late = seconds > on_time_window
+                add(due_desk_id, due_category_id, due_at, on_time=int(not late), late=int(late), completion_seconds=seconds)
+        else:
+            add(desk_id, category_id, at, **{'scheduled' if kind == TaskEvent.SCHEDULED else 'activated': 1})
+        previous[task_id] = (kind, desk_id, category_id, at)
+
+    _add_to_rollups(HourlyTaskRollup, 'hour', hourly)
+    _add_to_rollups(DailyTaskRollup, 'day', daily)
+
+
+def _add_to_rollups(model, period_field, changes):
+    """Add counts to existing rollup rows and create the missing ones"""
+    if not changes:
+        return
+    existing = {
+        (row.desk_id, row.category_id, getattr(row, period_field)): row
+        for row in model.objects.filter(
+            desk_id__in={desk_id for desk_id, _, _ in changes},
+            **{f'{period_field}__in': {period for _, _, period in changes}}
+        )
+    }
+    created, updated = [], []
+    for key, counts in changes.items():
+        row = existing.get(key)
+        if row is None:
+            desk_id, category_id, period = key
+            created.append(model(desk_id=desk_id, category_id=category_id, **{
+                period_field: period, **dict(zip(ROLLUP_FIELDS, counts))
+            }))
+            continue
+        for field, count in zip(ROLLUP_FIELDS, counts):
+            setattr(row, field, getattr(row, field) + count)
+        updated.append(row)
+    model.objects.bulk_create(created)
+    model.objects.bulk_update(updated, ROLLUP_FIELDS)
+
+
+def prune_hourly_rollups():
+    """Remove hourly rollups older than TASK_ANALYTICS['hourly_retention'] days."""
+    cutoff = hour_of(timezone.now() - timedelta(days=_setting('hourly_retention', HOURLY_ROLLUP_RETENTION)))
+    deleted, _ = HourlyTaskRollup.objects.filter(hour__lt=cutoff).delete()
+    logger.info(f"Pruned {deleted} hourly task rollups")
+    return deleted
+
+
+def desk_stats(desk, days=30, hours=24, now=None):
+    """
+    Completion statistics of a desk, read from its rollups.
+
+    Args:
+        desk: The desk
+        days: Local days covered by the daily series and the totals,
+            today included
+        hours: UTC hours covered by the hourly series, the current one included
+        now: Time the ranges end at; defaults to now
+
+    Returns:
+        dict: 'days' and 'hours' series, 'categories' and 'totals' over the days
+    """
+    now = now or timezone.now()
+    today = timezone.localdate(now)
+    day_range = [today - timedelta(days=offset) for offset in range(days - 1, -1, -1)]
+    current_hour = hour_of(now)
+    hour_range = [current_hour - timedelta(hours=offset) for offset in range(hours - 1, -1, -1)]
+
+    by_day = defaultdict(lambda: [0] * len(ROLLUP_FIELDS))
+    by_category = defaultdict(lambda: [0] * len(ROLLUP_FIELDS))
+    for day, category_id, *counts in DailyTaskRollup.objects.filter(
+        desk_id=desk.pk, day__gte=day_range[0], day__lte=today
+    ).values_list('day', 'category_id', *ROLLUP_FIELDS):
+        _sum_into(by_day[day], counts)
+        _sum_into(by_category[category_id], counts)
+
+    by_hour = defaultdict(lambda: [0] * len(ROLLUP_FIELDS))
+    for hour, *counts in HourlyTaskRollup.objects.filter(
+        desk_id=desk.pk, hour__gte=hour_range[0], hour__lte=current_hour
+    ).values_list('hour', *ROLLUP_FIELDS):
+        _sum_into(by_hour[hour], counts)
+
+    totals = [0] * len(ROLLUP_FIELDS)
+    for counts in by_day.values():
+        _sum_into(totals, counts)
+    # Rollups of deleted categories have no title
+    titles = dict(Category.objects.filter(
+        desk=desk, id__in=list(by_category)
+    ).values_list('id', 'title')) if by_category else {}
+
+    return {
+        'days': [dict(_stats(by_day[day]), date=day.isoformat()) for day in day_range],
+        'hours': [dict(_stats(by_hour[hour]), hour=hour.isoformat()) for hour in hour_range],
+        'categories': [
+            dict(_stats(counts), id=category_id, title=titles.get(category_id))
+            for category_id, counts in sorted(by_category.items())
+        ],
+        'totals': _stats(totals),
+    }
+
+
+def _sum_into(total, counts):
+    for index, count in enumerate(counts):
+        total[index] += count
+
+
+def _stats(counts):
+    """Counts of one period or group, with the on-time rate and mean completion time"""
+    stats = dict(zip(ROLLUP_FIELDS, counts))
+    completion_seconds = stats.pop('completion_seconds')
+    finished = stats['on_time'] + stats['late']
+    stats['on_time_rate'] = round(stats['on_time'] / stats['scheduled'], 4) if stats['scheduled'] else None
+    stats['mean_completion_seconds'] = round(completion_seconds / finished) if finished else None
+    return stats
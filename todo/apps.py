@@ -6,6 +6,13 @@ class TodoConfig(AppConfig):
 
     def ready(self):
         import todo.signals  # Import the signals module
-        from todo.tasks import schedule_activate_scheduled_tasks
+        from todo.tasks import (
+            schedule_activate_scheduled_tasks, schedule_prune_deleted_tasks, schedule_prune_schedule_occurrences,
+            schedule_update_task_rollups, schedule_prune_hourly_rollups,
+        )
         schedule_activate_scheduled_tasks()
+        schedule_prune_deleted_tasks()
+        schedule_prune_schedule_occurrences()
+        schedule_update_task_rollups()
+        schedule_prune_hourly_rollups()
 
@@ -1,18 +1,103 @@
+import hashlib
 from functools import wraps
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.contrib.auth.views import redirect_to_login
 from django.http import Http404
-from .utils import get_desk_by_slug
+from django.utils.cache import get_conditional_response, patch_cache_control
+from desks.models import Desk
+from .utils import get_request_desk_access, aget_request_desk_access
 
 def get_desk(view_func):
     """
     Decorator that retrieves a desk by slug and passes it to the view.
-    Ensures the user has access to the desk.
+    Ensures the user has access to the desk and exposes their permission
+    level as request.desk_permission. Async views get an async wrapper
+    that resolves the desk with the async ORM and cache API.
     """
+    if iscoroutinefunction(view_func):
+        @wraps(view_func)
+        async def _async_wrapped_view(request, desk_slug, *args, **kwargs):
+            user = await request.auser()
+            if not user.is_authenticated:
+                return redirect_to_login(request.get_full_path())
+            desk, permission = await aget_request_desk_access(request, desk_slug)
+            if not desk:
+                raise Http404("Desk not found")
+            request.desk_permission = permission
+            return await view_func(request, desk, *args, **kwargs)
+        return _async_wrapped_view
+
     @wraps(view_func)
     def _wrapped_view(request, desk_slug, *args, **kwargs):
+        if not request.user.is_authenticated:
+            return redirect_to_login(request.get_full_path())
         # Get the desk and verify access in one step
-        desk = get_desk_by_slug(desk_slug, request.user)
+        desk, permission = get_request_desk_access(request, desk_slug)
         if not desk:
             raise Http404("Desk not found")
+        request.desk_permission = permission
         # Pass the desk to the view function
         return view_func(request, desk, *args, **kwargs)
-    return _wrapped_view
\ No newline at end of file
+    return _wrapped_view
+
+def desk_conditional(view_func):
+    """
+    Decorator that answers conditional GETs from the desk's change generation.
+    Apply it below get_desk. The current generation is read with a single
+    primary key lookup and set on the desk, since the desk itself may come
+    from the access cache. Async views get an async wrapper.
+    """
+    if iscoroutinefunction(view_func):
+        @wraps(view_func)
+        async def _async_wrapped_view(request, desk, *args, **kwargs):
+            generation = await Desk.objects.filter(pk=desk.pk).values_list('generation', flat=True).afirst()
+            if generation is None:
+                raise Http404("Desk not found")
+            desk.generation = generation
+
+            if request.method not in ('GET', 'HEAD'):
+                return await view_func(request, desk, *args, **kwargs)
+
+            user = await request.auser()
+            response = get_conditional_response(request, etag=_desk_etag(request, desk, user))
+            if response is None:
+                response = await view_func(request, desk, *args, **kwargs)
+            return _finish_conditional(response, _desk_etag(request, desk, user))
+        return _async_wrapped_view
+
+    @wraps(view_func)
+    def _wrapped_view(request, desk, *args, **kwargs):
+        generation = Desk.objects.filter(pk=desk.pk).values_list('generation', flat=True).first()
+        if generation is None:
+            raise Http404("Desk not found")
+        desk.generation = generation
+
+        if request.method not in ('GET', 'HEAD'):
+            return view_func(request, desk, *args, **kwargs)
+
+        response = get_conditional_response(request, etag=_desk_etag(request, desk, request.user))
+        if response is None:
+            response = view_func(request, desk, *args, **kwargs)
+        return _finish_conditional(response, _desk_etag(request, desk, request.user))
+    return _wrapped_view
+
+def _desk_etag(request, desk, user):
+    # Pages differ per user (navbar), per query string and per CSRF token,
+    # which is rotated with the session on every login. The token's secret
+    # is generated while rendering when the request had none, so the ETag
+    # of a response is computed again once its view has run.
+    variant = '\n'.join([
+        request.get_full_path(),
+        request.META.get('CSRF_COOKIE', ''),
+        request.COOKIES.get(settings.SESSION_COOKIE_NAME, ''),
+    ])
+    variant_hash = hashlib.md5(variant.encode(), usedforsecurity=False).hexdigest()[:12]
+    return f'"{desk.pk}-{desk.generation}-{user.pk}-{variant_hash}"'
+
+def _finish_conditional(response, etag):
+    if response.status_code == 200 and not response.has_header('ETag'):
+        response['ETag'] = etag
+    # Browsers may keep the page but must revalidate it every time
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
\ No newline at end of file
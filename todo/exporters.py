@@ -0,0 +1,111 @@
+"""
+Streaming export of a desk's categories, schedules, moments and tasks.
+
+Records are read with chunked iterators and rendered one line at a time, so
+memory stays flat however large the desk is. NDJSON carries every record
+type; CSV carries one row per task in the format todo.importers reads back.
+"""
+import csv
+import json
+from itertools import islice
+
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIRequest
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse
+
+from .models import Task, Category, Schedule, ScheduleMoment
+
+FORMATS = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+}
+
+# Rows fetched from the database per round trip
+EXPORT_CHUNK_SIZE = 2000
+
+CSV_COLUMNS = ['title', 'description', 'category', 'schedule', 'is_active', 'created_at', 'updated_at']
+
+
+def export_records(desk):
+    """Yield the desk and everything on it as dicts tagged with a 'type'"""
+    yield {
+        'type': 'desk',
+        'id': desk.id,
+        'name': desk.name,
+        'slug': desk.slug,
+        'created_at': desk.created_at,
+    }
+    for category in Category.objects.filter(desk=desk).order_by('id').values('id', 'title', 'description'):
+        yield dict(category, type='category')
+
+    schedules = Schedule.objects.filter(desk=desk)
+    for schedule in schedules.order_by('id').values('id', 'title'):
+        yield dict(schedule, type='schedule')
+    moments = ScheduleMoment.objects.filter(schedule__in=schedules.values('id')).order_by('schedule_id', 'id')
+    for moment in moments.values('id', 'schedule', 'day_of_week', 'time_of_day'):
+        yield dict(moment, type='moment')
+
+    tasks = Task.objects.filter(category__desk=desk).order_by('id').values(
+        'id', 'title', 'description', 'category', 'schedule', 'is_active', 'created_at', 'updated_at'
+    )
+    for task in tasks.iterator(chunk_size=EXPORT_CHUNK_SIZE):
+        yield dict(task, type='task')
+
+
+def render_ndjson(desk):
+    for record in export_records(desk):
+        yield json.dumps(record, cls=DjangoJSONEncoder) + '\n'
+
+
+class Echo:
+    """Pseudo-buffer handing each row csv.writer writes straight back"""
+
+    def write(self, value):
+        return value
+
+
+def render_csv(desk):
+    writer = csv.writer(Echo())
+    yield writer.writerow(CSV_COLUMNS)
+    tasks = Task.objects.filter(category__desk=desk).order_by('id').values_list(
+        'title', 'description', 'category__title', 'schedule__title', 'is_active', 'created_at', 'updated_at'
+    )
+    for title, description, category, schedule, is_active, created_at, updated_at in tasks.iterator(
+        chunk_size=EXPORT_CHUNK_SIZE
+    ):
+        yield writer.writerow([
+            title, description, category, schedule or '', int(is_active),
+            created_at.isoformat(), updated_at.isoformat(),
+        ])
+
+
+def render(desk, format):
+    """Return an iterator over the export's lines in the given format"""
+    if format == 'csv':
+        return render_csv(desk)
+    return render_ndjson(desk)
+
+
+async def _iterate_in_thread(iterator, batch_size=EXPORT_CHUNK_SIZE):
+    # Database access must stay in the request's sync thread, so lines are
+    # pulled from it in batches
+    pull = sync_to_async(lambda: list(islice(iterator, batch_size)))
+    while lines := await pull():
+        for line in lines:
+            yield line
+
+
+def export_response(request, desk, format):
+    """
+    Stream the desk's export as a download.
+
+    ASGI servers get an async iterator; handing them a sync one would make
+    Django buffer the whole export in memory first.
+    """
+    lines = render(desk, format)
+    if isinstance(request, ASGIRequest):
+        lines = _iterate_in_thread(lines)
+    response = StreamingHttpResponse(lines, content_type=f"{FORMATS[format]}; charset=utf-8")
+    response['Content-Disposition'] = f'attachment; filename="{desk.slug}.{format}"'
+    return response
@@ -11,6 +11,7 @@ class TaskForm(forms.ModelForm):
         super().__init__(*args, **kwargs)
         if desk:
             self.fields['category'].queryset = Category.objects.filter(desk=desk)
+            self.fields['schedule'].queryset = Schedule.objects.filter(desk=desk)
         # Make schedule field optional with a blank option
         self.fields['schedule'].required = False
         self.fields['schedule'].empty_label = "No Schedule"
@@ -0,0 +1,187 @@
+"""
+Bulk import of tasks into a desk from CSV or NDJSON.
+
+Each row has a title, an optional description, a category title and an
+optional schedule title. Rows are validated in a single streaming pass,
+categories and schedules are resolved with one query each, and the tasks
+are inserted with chunked bulk_create inside one transaction.
+"""
+import csv
+import json
+
+from django.db import transaction
+
+from .models import Task, Category, Schedule, TaskCountChanges
+
+FORMATS = ('csv', 'ndjson')
+
+# Tasks per INSERT statement
+IMPORT_CHUNK_SIZE = 1000
+
+# Errors listed in the result; the total is always reported
+MAX_REPORTED_ERRORS = 1000
+
+TITLE_MAX_LENGTH = Task._meta.get_field('title').max_length
+CATEGORY_TITLE_MAX_LENGTH = Category._meta.get_field('title').max_length
+
+
+class ImportFormatError(ValueError):
+    """The input cannot be read as the requested format"""
+
+
+def detect_format(name='', content_type=''):
+    """Guess the import format from a file name or content type, or None"""
+    name = (name or '').lower()
+    content_type = (content_type or '').lower()
+    if name.endswith(('.ndjson', '.jsonl')) or 'ndjson' in content_type or 'jsonl' in content_type:
+        return 'ndjson'
+    if name.endswith('.csv') or 'csv' in content_type:
+        return 'csv'
+    return None
+
+
+def read_rows(lines, format):
+    """
+    Yield (row number, row dict) pairs from an iterable of text lines.
+
+    Args:
+        lines: Iterable of text lines, e.g. an open text file
+        format: 'csv' (with a header row) or 'ndjson'
+    """
+    if format == 'csv':
+        reader = csv.DictReader(lines)
+        if not reader.fieldnames or 'title' not in reader.fieldnames:
+            raise ImportFormatError("CSV input needs a header row with at least a 'title' column")
+        for row in reader:
+            yield reader.line_num, row
+    elif format == 'ndjson':
+        for number, line in enumerate(lines, start=1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError:
+                row = None
+            # Unreadable lines are passed on for validation to report
+            yield number, row if isinstance(row, dict) else None
+    else:
+        raise ImportFormatError(f"Unknown format '{format}', expected one of {', '.join(FORMATS)}")
+
+
+def _clean(row):
+    """Return (title, description, category title, schedule title) or raise ValueError"""
+    if row is None:
+        raise ValueError("Row is not a JSON object")
+    title = str(row.get('title') or '').strip()
+    description = str(row.get('description') or '').strip()
+    category = str(row.get('category') or '').strip()
+    schedule = str(row.get('schedule') or '').strip() or None
+    if not title:
+        raise ValueError("Title is required")
+    if len(title) > TITLE_MAX_LENGTH:
+        raise ValueError(f"Title is longer than {TITLE_MAX_LENGTH} characters")
+    if not category:
+        raise ValueError("Category is required")
+    if len(category) > CATEGORY_TITLE_MAX_LENGTH:
+        raise ValueError(f"Category is longer than {CATEGORY_TITLE_MAX_LENGTH} characters")
+    return title, description, category, schedule
+
+
+def import_tasks(desk, rows, create_categories=False, skip_invalid=False, dry_run=False):
+    """
+    Validate and insert tasks into a desk.
+
+    Args:
+        desk: Desk the tasks are added to
+        rows: Iterable of (row number, row dict) pairs, see read_rows()
+        create_categories: Create categories missing from the desk instead
+            of rejecting their rows
+        skip_invalid: Insert the valid rows even when others have errors.
+            By default nothing is inserted if any row is invalid.
+        dry_run: Validate only
+
+    Returns:
+        dict: 'created' task count, 'error_count' and the first
+            MAX_REPORTED_ERRORS 'errors' as {'row', 'error'} dicts
+    """
+    errors = []
+    error_count = 0
+
+    def reject(number, message):
+        nonlocal error_count
+        error_count += 1
+        if len(errors) < MAX_REPORTED_ERRORS:
+            errors.append({'row': number, 'error': message})
+
+    # Streaming pass: keep only the cleaned values of valid rows
+    pending = []
+    category_titles = set()
+    schedule_titles = set()
+    for number, row in rows:
+        try:
+            title, description, category, schedule = _clean(row)
+        except ValueError as e:
+            reject(number, str(e))
+            continue
+        pending.append((number, title, description, category, schedule))
+        category_titles.add(category)
+        if schedule:
+            schedule_titles.add(schedule)
+
+    with transaction.atomic():
+        # Resolve every referenced category and schedule in one query each;
+        # the oldest wins when titles repeat
+        categories = {}
+        for category_id, title in Category.objects.filter(
+            desk=desk, title__in=category_titles
+        ).order_by('-id').values_list('id', 'title'):
+            categories[title] = category_id
+        schedules = {}
+        if schedule_titles:
+            for schedule_id, title in Schedule.objects.filter(
+                desk=desk, title__in=schedule_titles
+            ).order_by('-id').values_list('id', 'title'):
+                schedules[title] = schedule_id
+
+        missing_categories = set() if create_categories else category_titles - categories.keys()
+        valid = []
+        for number, title, description, category, schedule in pending:
+            if category in missing_categories:
+                reject(number, f"Category '{category}' does not exist on this desk")
+            elif schedule and schedule not in schedules:
+                reject(number, f"Schedule '{schedule}' does not exist")
+            else:
+                valid.append((title, description, category, schedule))
+
+        if dry_run or (error_count and not skip_invalid):
+            valid = []
+        new_categories = {category for _, _, category, _ in valid} - categories.keys()
+        if new_categories:
+            for category in Category.objects.bulk_create([
+                Category(title=title, description='', desk=desk) for title in sorted(new_categories)
+            ]):
+                categories[category.title] = category.id
+
+        for start in range(0, len(valid), IMPORT_CHUNK_SIZE):
+            Task.objects.bulk_create([
+                Task(
+                    title=title,
+                    description=description,
+                    category_id=categories[category],
+                    schedule_id=schedules.get(schedule),
+                )
+                for title, description, category, schedule in valid[start:start + IMPORT_CHUNK_SIZE]
+            ])
+        # Imported tasks start inactive
+        counts = TaskCountChanges()
+        for _, _, category, _ in valid:
+            counts.add_tasks(desk.pk, categories[category], False)
+        # bulk_create sends no post_save, so move the generation forward once
+        counts.apply(bump_generation=True)
+
+    errors.sort(key=lambda error: error['row'])
+    return {
+        'created': len(valid),
+        'error_count': error_count,
+        'errors': errors,
+    }
@@ -0,0 +1,148 @@
+import asyncio
+import json
+import threading
+import time
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.contrib.auth.decorators import login_required
+from django.core.handlers.asgi import ASGIHandler
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client, override_settings
+from django.urls import path
+from django.utils import timezone
+
+from todo import views
+from todo.decorators import desk_conditional, get_desk
+from .benchmark_views import Command as ViewsBenchmark, percentile
+
+
+@get_desk
+@desk_conditional
+@login_required
+def sync_tasks_status(request, desk):
+    """
+    get_tasks_status as a sync view: the sync decorators resolve the desk
+    through resolve_desk_access and every query runs on the sync ORM, in
+    the thread Django runs sync views in under ASGI
+    """
+    page, deleted, since, full, cursor = views.query_tasks_status(request, desk)
+    deleted = list(deleted) if deleted is not None else []
+    return views.render_tasks_status(request, page, deleted, since, full, cursor)
+
+
+urlpatterns = [
+    path('<slug:desk_slug>/async/', views.get_tasks_status),
+    path('<slug:desk_slug>/sync/', sync_tasks_status),
+]
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare the throughput of the task status endpoint served as a native async view '
+        'and as a sync view, with concurrent pollers against the in-process ASGI handler'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--desk', help='Slug of the desk to poll; defaults to the desk with the most tasks')
+        parser.add_argument('--concurrency', type=int, default=200, help='Requests in flight at once')
+        parser.add_argument('--requests', type=int, default=2000, help='Requests per variant')
+        parser.add_argument('--output', help='Write the JSON report to this file instead of stdout')
+
+    def handle(self, *args, **options):
+        if options['concurrency'] < 1 or options['requests'] < 1:
+            raise CommandError("--concurrency and --requests must be positive")
+        desk = ViewsBenchmark().get_desk(options['desk'])
+        client = Client()
+        client.force_login(desk.user)
+        cookie = f"{settings.SESSION_COOKIE_NAME}={client.cookies[settings.SESSION_COOKIE_NAME].value}"
+        # An up-to-date delta poll, the request every open desk page repeats
+        query = urlencode({'since': timezone.now().isoformat()})
+
+        results = {}
+        with override_settings(ROOT_URLCONF=__name__):
+            app = ASGIHandler()
+            for variant in ('sync', 'async'):
+                # A loop of its own, as under an ASGI server
+                results[variant] = asyncio.run(self.run_variant(
+                    app, f"/{desk.slug}/{variant}/", query, cookie,
+                    options['requests'], options['concurrency'],
+                ))
+
+        report = {
+            'desk': desk.slug,
+            'concurrency': options['concurrency'],
+            'requests': options['requests'],
+            'results': results,
+            'speedup': round(results['async']['requests_per_second'] / results['sync']['requests_per_second'], 2),
+        }
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as output_file:
+                output_file.write(output + '\n')
+            self.stderr.write(f"Report written to {options['output']}")
+        else:
+            self.stdout.write(output)
+
+    async def run_variant(self, app, url_path, query, cookie, total, concurrency):
+        """Send `total` requests with at most `concurrency` in flight and summarise them"""
+        limit = asyncio.Semaphore(concurrency)
+        timings = []
+        failures = 0
+        peak_threads = threading.active_count()
+
+        async def one():
+            nonlocal failures, peak_threads
+            async with limit:
+                started = time.perf_counter()
+                status = await self.request(app, url_path, query, cookie)
+                timings.append((time.perf_counter() - started) * 1000)
+                failures += status != 200
+                peak_threads = max(peak_threads, threading.active_count())
+
+        started = time.perf_counter()
+        await asyncio.gather(*(one() for _ in range(total)))
+        elapsed = time.perf_counter() - started
+        return {
+            'requests_per_second': round(total / elapsed, 1),
+            'p50_ms': round(percentile(timings, 50), 2),
+            'p95_ms': round(percentile(timings, 95), 2),
+            'p99_ms': round(percentile(timings, 99), 2),
+            'failures': failures,
+            'peak_threads': peak_threads,
+        }
+
+    async def request(self, app, url_path, query, cookie):
+        """Run one GET through the ASGI application and return its status code"""
+        scope = {
+            'type': 'http',
+            'asgi': {'version': '3.0'},
+            'http_version': '1.1',
+            'method': 'GET',
+            'scheme': 'http',
+            'path': url_path,
+            'raw_path': url_path.encode(),
+            'query_string': query.encode(),
+            'root_path': '',
+            'headers': [(b'host', b'localhost'), (b'cookie', cookie.encode())],
+            'client': ('127.0.0.1', 0),
+            'server': ('localhost', 80),
+        }
+        body_sent = False
+        status = None
+
+        async def receive():
+            nonlocal body_sent
+            if not body_sent:
+                body_sent = True
+                return {'type': 'http.request', 'body': b'', 'more_body': False}
+            # The client never disconnects; the handler cancels this wait
+            await asyncio.Future()
+
+        async def send(message):
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+
+        await app(scope, receive, send)
+        return status
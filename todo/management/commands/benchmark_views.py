@@ -0,0 +1,114 @@
+import json
+import math
+import time
+from datetime import timedelta
+
+from django.core.cache import caches
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from desks.models import Desk
+from todo.models import ScheduleMoment, Task
+from todo.utils import activate_scheduled_tasks
+
+
+def percentile(samples, pct):
+    """Nearest-rank percentile of a non-empty list of samples"""
+    ordered = sorted(samples)
+    rank = max(math.ceil(pct / 100 * len(ordered)), 1)
+    return ordered[rank - 1]
+
+
+class Command(BaseCommand):
+    help = 'Time the main views and a scheduler run, printing latency percentiles and query counts as JSON'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--desk', help='Slug of the desk to benchmark; defaults to the desk with the most tasks')
+        parser.add_argument('--iterations', type=int, default=20)
+        parser.add_argument('--cold', action='store_true', help='Clear every cache before each request')
+        parser.add_argument('--output', help='Write the JSON report to this file instead of stdout')
+
+    def handle(self, *args, **options):
+        desk = self.get_desk(options['desk'])
+        client = Client(HTTP_HOST='localhost')
+        client.force_login(desk.user)
+
+        since = (timezone.now() - timedelta(minutes=5)).isoformat()
+        views = {
+            'desk_view': lambda: client.get(reverse('tasks_list', args=[desk.slug])),
+            'manage_tasks': lambda: client.get(reverse('tasks_manage', args=[desk.slug])),
+            'get_tasks_status': lambda: client.get(reverse('tasks_status', args=[desk.slug])),
+            'get_tasks_status_delta': lambda: client.get(reverse('tasks_status', args=[desk.slug]), {'since': since}),
+            'my_desks': lambda: client.get(reverse('desks_list')),
+            'edit_desk': lambda: client.get(reverse('desks_edit', args=[desk.id])),
+        }
+
+        results = {}
+        for name, request in views.items():
+            results[name] = self.measure(request, options['iterations'], options['cold'])
+
+        moment_ids = list(ScheduleMoment.objects.filter(
+            schedule__desk=desk
+        ).values_list('id', flat=True))
+        results['activate_scheduled_tasks'] = self.measure(
+            lambda: self.activate_and_rollback(moment_ids), options['iterations'], options['cold']
+        )
+
+        report = {
+            'desk': desk.slug,
+            'tasks': Task.objects.filter(category__desk=desk).count(),
+            'iterations': options['iterations'],
+            'cold': options['cold'],
+            'results': results,
+        }
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as output_file:
+                output_file.write(output + '\n')
+            self.stderr.write(f"Report written to {options['output']}")
+        else:
+            self.stdout.write(output)
+
+    def get_desk(self, slug):
+        if slug:
+            try:
+                return Desk.objects.select_related('user').get(slug=slug)
+            except Desk.DoesNotExist:
+                raise CommandError(f"Desk '{slug}' does not exist")
+        desk = Desk.objects.select_related('user').order_by('-task_count').first()
+        if desk is None:
+            raise CommandError("No desks to benchmark, run seed_data first")
+        return desk
+
+    def measure(self, request, iterations, cold):
+        """Run request `iterations` times and summarise its latency and query count"""
+        timings = []
+        query_counts = []
+        for _ in range(iterations):
+            if cold:
+                for alias in settings.CACHES:
+                    caches[alias].clear()
+            with CaptureQueriesContext(connection) as queries:
+                started = time.perf_counter()
+                response = request()
+                timings.append((time.perf_counter() - started) * 1000)
+            if response is not None and response.status_code >= 400:
+                raise CommandError(f"Request failed with status {response.status_code}")
+            query_counts.append(len(queries))
+        return {
+            'p50_ms': round(percentile(timings, 50), 2),
+            'p95_ms': round(percentile(timings, 95), 2),
+            'p99_ms': round(percentile(timings, 99), 2),
+            'queries': max(query_counts),
+        }
+
+    def activate_and_rollback(self, moment_ids):
+        # Roll back so every iteration activates the same tasks
+        with transaction.atomic():
+            activate_scheduled_tasks(moment_ids=moment_ids)
+            transaction.set_rollback(True)
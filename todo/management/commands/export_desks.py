@@ -0,0 +1,35 @@
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from desks.models import Desk
+from todo.exporters import FORMATS, render
+
+
+class Command(BaseCommand):
+    help = 'Export desks with their categories, schedules and tasks to NDJSON or CSV files'
+
+    def add_arguments(self, parser):
+        parser.add_argument('desks', nargs='*', help='Slugs of the desks to export')
+        parser.add_argument('--all', action='store_true', help='Export every desk')
+        parser.add_argument('--format', choices=FORMATS, default='ndjson')
+        parser.add_argument('--output-dir', default='.', help='Directory the <slug>.<format> files are written to')
+
+    def handle(self, *args, **options):
+        if options['all']:
+            desks = Desk.objects.order_by('id')
+        elif options['desks']:
+            desks = Desk.objects.filter(slug__in=options['desks']).order_by('id')
+            missing = set(options['desks']) - set(desks.values_list('slug', flat=True))
+            if missing:
+                raise CommandError(f"Unknown desks: {', '.join(sorted(missing))}")
+        else:
+            raise CommandError("Name the desks to export or pass --all")
+
+        output_dir = Path(options['output_dir'])
+        output_dir.mkdir(parents=True, exist_ok=True)
+        for desk in desks.iterator():
+            path = output_dir / f"{desk.slug}.{options['format']}"
+            with open(path, 'w', encoding='utf-8', newline='') as output:
+                output.writelines(render(desk, options['format']))
+            self.stdout.write(f"Exported '{desk.slug}' to {path}")
@@ -0,0 +1,65 @@
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from desks.models import Desk
+from todo.importers import FORMATS, ImportFormatError, detect_format, import_tasks, read_rows
+
+
+class Command(BaseCommand):
+    help = 'Bulk import tasks into a desk from a CSV or NDJSON file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('desk', help='Slug of the desk to import into')
+        parser.add_argument('path', help="CSV or NDJSON file, or '-' for standard input")
+        parser.add_argument('--format', choices=FORMATS, help='Defaults to the file extension')
+        parser.add_argument('--create-categories', action='store_true',
+                            help='Create categories missing from the desk')
+        parser.add_argument('--skip-invalid', action='store_true',
+                            help='Import the valid rows even if others have errors')
+        parser.add_argument('--dry-run', action='store_true', help='Validate without importing')
+
+    def handle(self, *args, **options):
+        try:
+            desk = Desk.objects.get(slug=options['desk'])
+        except Desk.DoesNotExist:
+            raise CommandError(f"Desk '{options['desk']}' does not exist")
+
+        path = options['path']
+        format = options['format'] or detect_format(path)
+        if format is None:
+            raise CommandError("Cannot tell the format from the file name, pass --format")
+
+        started = time.perf_counter()
+        try:
+            source = sys.stdin if path == '-' else open(path, encoding='utf-8-sig', newline='')
+        except OSError as e:
+            raise CommandError(f"Cannot open {path}: {e}")
+        try:
+            result = import_tasks(
+                desk,
+                read_rows(source, format),
+                create_categories=options['create_categories'],
+                skip_invalid=options['skip_invalid'],
+                dry_run=options['dry_run'],
+            )
+        except ImportFormatError as e:
+            raise CommandError(str(e))
+        finally:
+            if source is not sys.stdin:
+                source.close()
+
+        for error in result['errors']:
+            self.stderr.write(f"Row {error['row']}: {error['error']}")
+        if result['error_count'] > len(result['errors']):
+            self.stderr.write(f"... and {result['error_count'] - len(result['errors'])} more errors")
+
+        elapsed = time.perf_counter() - started
+        if result['created'] or not result['error_count']:
+            self.stdout.write(self.style.SUCCESS(
+                f"Imported {result['created']} tasks into '{desk.slug}' "
+                f"with {result['error_count']} invalid rows in {elapsed:.1f}s"
+            ))
+        else:
+            raise CommandError(f"Nothing imported: {result['error_count']} invalid rows")
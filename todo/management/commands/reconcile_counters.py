@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from desks.models import Desk
+from todo.models import reconcile_task_counts
+
+
+class Command(BaseCommand):
+    help = 'Recount the tasks of categories and desks and repair stored task counters that drifted'
+
+    def add_arguments(self, parser):
+        parser.add_argument('desks', nargs='*', help='Slugs of the desks to check; every desk by default')
+        parser.add_argument('--dry-run', action='store_true', help='Report drifted counters without fixing them')
+
+    def handle(self, *args, **options):
+        desks = None
+        if options['desks']:
+            desks = Desk.objects.filter(slug__in=options['desks'])
+            missing = set(options['desks']) - set(desks.values_list('slug', flat=True))
+            if missing:
+                raise CommandError(f"Unknown desks: {', '.join(sorted(missing))}")
+
+        categories, desks = reconcile_task_counts(desks, dry_run=options['dry_run'])
+        verb = 'Found' if options['dry_run'] else 'Fixed'
+        self.stdout.write(f"{verb} drifted counters on {categories} categories and {desks} desks")
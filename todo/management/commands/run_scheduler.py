@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from todo import scheduler
+
+
+class Command(BaseCommand):
+    help = 'Run the event-driven task scheduler until interrupted'
+
+    def handle(self, *args, **options):
+        engine = scheduler.start(background=False)
+        self.stdout.write('Scheduler started, waiting for the next schedule moment...')
+        try:
+            engine.run()
+        except KeyboardInterrupt:
+            engine.stop()
+        self.stdout.write('Scheduler stopped.')
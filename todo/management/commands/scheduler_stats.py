@@ -0,0 +1,60 @@
+import json
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db.models import Avg, Count, Max, Sum
+from django.utils import timezone
+
+from todo.models import SchedulerRun
+
+
+class Command(BaseCommand):
+    help = 'Summarise recent scheduler runs: activations, scan cost and due-to-activation lag'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hours', type=float, default=24, help='Summarise runs started in the last N hours')
+        parser.add_argument('--runs', type=int, default=10, help='Number of most recent runs to list')
+        parser.add_argument('--json', action='store_true', help='Print the summary as JSON')
+
+    def handle(self, *args, **options):
+        since = timezone.now() - timedelta(hours=options['hours'])
+        window = SchedulerRun.objects.filter(started_at__gte=since)
+        summary = window.aggregate(
+            runs=Count('id'),
+            scanned=Sum('scanned'),
+            activated=Sum('activated'),
+            skipped=Sum('skipped'),
+            mean_duration=Avg('duration'),
+            max_duration=Max('duration'),
+            mean_lag=Avg('mean_lag'),
+            max_lag=Max('max_lag'),
+        )
+        recent = list(SchedulerRun.objects.values(
+            'started_at', 'trigger', 'duration', 'scanned', 'activated', 'skipped', 'mean_lag', 'max_lag'
+        )[:options['runs']])
+
+        if options['json']:
+            self.stdout.write(json.dumps({
+                'since': since.isoformat(),
+                'summary': summary,
+                'recent': [dict(run, started_at=run['started_at'].isoformat()) for run in recent],
+            }, indent=2))
+            return
+
+        self.stdout.write(f"Runs in the last {options['hours']:g} hours: {summary['runs']}")
+        if summary['runs']:
+            self.stdout.write(
+                f"  scanned {summary['scanned']}, activated {summary['activated']}, skipped {summary['skipped']}\n"
+                f"  duration mean {summary['mean_duration']:.3f}s, max {summary['max_duration']:.3f}s\n"
+                f"  lag mean {self.seconds(summary['mean_lag'])}, max {self.seconds(summary['max_lag'])}"
+            )
+        self.stdout.write(f"\nLast {len(recent)} runs:")
+        for run in recent:
+            self.stdout.write(
+                f"  {timezone.localtime(run['started_at']):%Y-%m-%d %H:%M:%S} {run['trigger']:<5} "
+                f"{run['duration']:.3f}s scanned={run['scanned']} activated={run['activated']} "
+                f"skipped={run['skipped']} max_lag={self.seconds(run['max_lag'])}"
+            )
+
+    def seconds(self, value):
+        return '-' if value is None else f"{value:.1f}s"
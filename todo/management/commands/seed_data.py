@@ -0,0 +1,158 @@
+import random
+import time
+import uuid
+from datetime import time as time_of_day
+from itertools import islice
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.utils import timezone
+
+from desks.models import Desk, DeskUserShare
+from todo.models import UserProfile, Category, Task, Schedule, ScheduleMoment, TaskCountChanges
+
+
+def batched(iterable, size):
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+class Command(BaseCommand):
+    help = 'Generate a synthetic dataset of users, desks, shares, categories, tasks and schedules'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=10)
+        parser.add_argument('--desks-per-user', type=int, default=3)
+        parser.add_argument('--shares-per-desk', type=int, default=2)
+        parser.add_argument('--categories-per-desk', type=int, default=5)
+        parser.add_argument('--tasks-per-desk', type=int, default=100)
+        parser.add_argument('--schedules-per-desk', type=int, default=3)
+        parser.add_argument('--moments-per-schedule', type=int, default=3)
+        parser.add_argument('--scheduled-ratio', type=float, default=0.5,
+                            help='Fraction of tasks attached to a schedule')
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--prefix', default=None,
+                            help='Prefix of generated usernames and slugs; random by default')
+        parser.add_argument('--password', default='password',
+                            help='Password of every generated user')
+        parser.add_argument('--seed', type=int, default=None, help='Random seed')
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        prefix = options['prefix'] or f"seed-{uuid.uuid4().hex[:6]}"
+        batch_size = options['batch_size']
+        started = time.perf_counter()
+
+        # Signals and Desk.save() are bypassed by bulk_create, so profiles
+        # and slugs are created here explicitly
+        with transaction.atomic():
+            password = make_password(options['password'])
+            users = User.objects.bulk_create([
+                User(username=f"{prefix}-user-{i}", password=password)
+                for i in range(options['users'])
+            ], batch_size=batch_size)
+            UserProfile.objects.bulk_create([UserProfile(user=user) for user in users], batch_size=batch_size)
+
+            desks = Desk.objects.bulk_create([
+                Desk(name=f"Desk {d} of {user.username}", user=user, slug=f"{prefix}-desk-{u}-{d}")
+                for u, user in enumerate(users)
+                for d in range(options['desks_per_user'])
+            ], batch_size=batch_size)
+
+            shares = []
+            for desk in desks:
+                others = [user for user in users if user.pk != desk.user_id]
+                for user in rng.sample(others, min(options['shares_per_desk'], len(others))):
+                    shares.append(DeskUserShare(desk=desk, user=user, permission=rng.choice(['view', 'admin'])))
+            DeskUserShare.objects.bulk_create(shares, batch_size=batch_size)
+
+            schedules_per_desk = options['schedules_per_desk']
+            schedules = Schedule.objects.bulk_create([
+                Schedule(title=f"Schedule {s}", desk=desk)
+                for desk in desks
+                for s in range(schedules_per_desk)
+            ], batch_size=batch_size)
+            ScheduleMoment.objects.bulk_create([
+                ScheduleMoment(
+                    schedule=schedule,
+                    day_of_week=rng.randrange(7),
+                    time_of_day=time_of_day(rng.randrange(24), rng.choice([0, 15, 30, 45])),
+                )
+                for schedule in schedules
+                for _ in range(options['moments_per_schedule'])
+            ], batch_size=batch_size)
+
+            categories_per_desk = options['categories_per_desk']
+            categories = Category.objects.bulk_create([
+                Category(title=f"Category {c}", description='', desk=desk)
+                for desk in desks
+                for c in range(categories_per_desk)
+            ], batch_size=batch_size)
+
+            task_count = 0
+            if categories:
+                counts = TaskCountChanges()
+                rows = self.generate_task_rows(
+                    rng, len(desks), categories, categories_per_desk, schedules, schedules_per_desk,
+                    options['tasks_per_desk'], options['scheduled_ratio'], counts
+                )
+                task_count = self.insert_tasks(rows, batch_size)
+                counts.apply()
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Created {len(users)} users, {len(desks)} desks, {len(shares)} shares, "
+            f"{len(categories)} categories, {task_count} tasks and {len(schedules)} schedules "
+            f"with prefix '{prefix}' in {time.perf_counter() - started:.1f}s"
+        ))
+
+    def generate_task_rows(self, rng, desk_count, categories, categories_per_desk, schedules,
+                           schedules_per_desk, tasks_per_desk, scheduled_ratio, counts):
+        """
+        Yield task rows lazily so only one batch is held in memory at a time,
+        adding each to the task counters
+        """
+        now = connection.ops.adapt_datetimefield_value(timezone.now())
+        for d in range(desk_count):
+            desk_categories = categories[d * categories_per_desk:(d + 1) * categories_per_desk]
+            schedule_ids = [schedule.id for schedule in schedules[d * schedules_per_desk:(d + 1) * schedules_per_desk]]
+            for i in range(tasks_per_desk):
+                scheduled = schedule_ids and rng.random() < scheduled_ratio
+                category = desk_categories[i % categories_per_desk]
+                schedule_id = rng.choice(schedule_ids) if scheduled else None
+                is_active = rng.random() < 0.5
+                counts.add_tasks(category.desk_id, category.id, is_active)
+                yield (
+                    f"Task {i}",
+                    f"Synthetic task {i}",
+                    category.id,
+                    schedule_id,
+                    is_active,
+                    0,
+                    now,
+                    now,
+                )
+
+    def insert_tasks(self, rows, batch_size):
+        """
+        Insert task rows with executemany; building a model instance per row
+        costs several times more than the INSERT itself at this volume.
+
+        Returns:
+            int: Number of tasks inserted
+        """
+        columns = ['title', 'description', 'category', 'schedule', 'is_active', 'version', 'created_at', 'updated_at']
+        quote = connection.ops.quote_name
+        sql = "INSERT INTO {} ({}) VALUES ({})".format(
+            quote(Task._meta.db_table),
+            ', '.join(quote(Task._meta.get_field(name).column) for name in columns),
+            ', '.join(['%s'] * len(columns)),
+        )
+        count = 0
+        with connection.cursor() as cursor:
+            for batch in batched(rows, batch_size):
+                cursor.executemany(sql, batch)
+                count += len(batch)
+        return count
@@ -0,0 +1,30 @@
+# Generated by Django 5.1.15 on 2026-10-18 16:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('todo', '0003_remove_schedule_day_of_week_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DeletedTask',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('task_id', models.BigIntegerField()),
+                ('desk_id', models.BigIntegerField()),
+                ('deleted_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='task',
+            index=models.Index(fields=['category', 'updated_at'], name='todo_task_categor_8bb0df_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='deletedtask',
+            index=models.Index(fields=['desk_id', 'deleted_at'], name='todo_delete_desk_id_a1c94f_idx'),
+        ),
+    ]
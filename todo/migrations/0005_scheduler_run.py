@@ -0,0 +1,31 @@
+# Generated by Django 5.1.15 on 2026-10-18 16:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('todo', '0004_task_changes_cursor'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SchedulerRun',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('started_at', models.DateTimeField()),
+                ('trigger', models.CharField(choices=[('poll', 'Poll'), ('event', 'Event')], max_length=5)),
+                ('duration', models.FloatField(help_text='Wall time in seconds')),
+                ('scanned', models.PositiveIntegerField(help_text='Candidate rows read')),
+                ('activated', models.PositiveIntegerField()),
+                ('skipped', models.PositiveIntegerField(help_text='Candidates already activated by someone else')),
+                ('mean_lag', models.FloatField(help_text='Mean seconds from due time to activation', null=True)),
+                ('max_lag', models.FloatField(help_text='Largest seconds from due time to activation', null=True)),
+            ],
+            options={
+                'ordering': ['-started_at'],
+                'indexes': [models.Index(fields=['started_at'], name='todo_schedu_started_c9693a_idx')],
+            },
+        ),
+    ]
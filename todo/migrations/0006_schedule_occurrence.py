@@ -0,0 +1,26 @@
+# Generated by Django 5.1.15 on 2026-10-18 16:58
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('todo', '0005_scheduler_run'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ScheduleOccurrence',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('week', models.DateField(help_text='Monday of the week the moment fired in')),
+                ('fired_at', models.DateTimeField(auto_now_add=True)),
+                ('moment', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='occurrences', to='todo.schedulemoment')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('moment', 'week'), name='unique_moment_week')],
+            },
+        ),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 5.1.15 on 2026-10-18 17:04
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def assign_schedules_to_desks(apps, schema_editor):
+    """
+    Give each schedule the desk of the tasks using it. A schedule shared by
+    tasks of several desks is copied, with its moments, for every other desk.
+    Schedules no task uses record no creator either, so they keep no desk
+    rather than being deleted; staff can attach them from the admin.
+    """
+    Schedule = apps.get_model('todo', 'Schedule')
+    ScheduleMoment = apps.get_model('todo', 'ScheduleMoment')
+    Task = apps.get_model('todo', 'Task')
+
+    desks_by_schedule = {}
+    for schedule_id, desk_id in Task.objects.filter(
+        schedule__isnull=False, category__desk__isnull=False
+    ).values_list('schedule_id', 'category__desk_id').distinct().order_by('schedule_id', 'category__desk_id'):
+        desks_by_schedule.setdefault(schedule_id, []).append(desk_id)
+
+    for schedule in Schedule.objects.filter(id__in=desks_by_schedule):
+        first_desk, *other_desks = desks_by_schedule[schedule.id]
+        schedule.desk_id = first_desk
+        schedule.save(update_fields=['desk'])
+        moments = list(ScheduleMoment.objects.filter(schedule=schedule))
+        for desk_id in other_desks:
+            copy = Schedule.objects.create(title=schedule.title, desk_id=desk_id)
+            ScheduleMoment.objects.bulk_create([
+                ScheduleMoment(schedule=copy, day_of_week=moment.day_of_week, time_of_day=moment.time_of_day)
+                for moment in moments
+            ])
+            Task.objects.filter(schedule=schedule, category__desk_id=desk_id).update(schedule=copy)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('desks', '0004_desk_clone_job'),
+        ('todo', '0006_schedule_occurrence'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='schedule',
+            name='desk',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='schedules', to='desks.desk'),
+        ),
+        migrations.RunPython(assign_schedules_to_desks, migrations.RunPython.noop),
+    ]
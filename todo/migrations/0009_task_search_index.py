@@ -0,0 +1,15 @@
+from django.db import migrations
+
+from todo import search_index
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('todo', '0008_task_version'),
+    ]
+
+    operations = [
+        # Full-text index of tasks, see todo.search_index
+        migrations.RunPython(search_index.create_index, search_index.drop_index),
+    ]
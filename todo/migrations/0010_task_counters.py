@@ -0,0 +1,49 @@
+# Generated by Django 5.1.15 on 2026-10-18 17:35
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from todo import search_index
+
+
+def count_tasks(apps, schema_editor):
+    """Fill the new counters of every category and desk with one UPDATE each"""
+    Category = apps.get_model('todo', 'Category')
+    Desk = apps.get_model('desks', 'Desk')
+    Task = apps.get_model('todo', 'Task')
+
+    for model, tasks in (
+        (Category, Task.objects.filter(category=OuterRef('pk')).values('category')),
+        (Desk, Task.objects.filter(category__desk=OuterRef('pk')).values('category__desk')),
+    ):
+        tasks = tasks.order_by()
+        model.objects.update(
+            task_count=Coalesce(Subquery(tasks.annotate(n=Count('id')).values('n')), 0),
+            active_task_count=Coalesce(Subquery(tasks.filter(is_active=True).annotate(n=Count('id')).values('n')), 0),
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('desks', '0005_task_counters'),
+        ('todo', '0009_task_search_index'),
+    ]
+
+    operations = [
+        # Remaking todo_category would break the search index triggers
+        migrations.RunPython(search_index.drop_triggers, search_index.create_triggers),
+        migrations.AddField(
+            model_name='category',
+            name='active_task_count',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='category',
+            name='task_count',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(search_index.create_triggers, search_index.drop_triggers),
+        migrations.RunPython(count_tasks, migrations.RunPython.noop),
+    ]
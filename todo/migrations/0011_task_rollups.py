@@ -0,0 +1,72 @@
+# Generated by Django 5.1.15 on 2026-10-18 17:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('todo', '0010_task_counters'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TaskRollupCursor',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('last_event_id', models.BigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='DailyTaskRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('desk_id', models.BigIntegerField()),
+                ('category_id', models.BigIntegerField()),
+                ('activated', models.PositiveIntegerField(default=0, help_text='Tasks activated by hand')),
+                ('scheduled', models.PositiveIntegerField(default=0, help_text='Tasks activated by their schedule')),
+                ('completed', models.PositiveIntegerField(default=0, help_text='Tasks completed in the period')),
+                ('on_time', models.PositiveIntegerField(default=0, help_text='Scheduled tasks completed within the on-time window')),
+                ('late', models.PositiveIntegerField(default=0, help_text='Scheduled tasks completed after the on-time window')),
+                ('completion_seconds', models.BigIntegerField(default=0, help_text='Due-to-completion time of on_time and late tasks')),
+                ('day', models.DateField()),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('desk_id', 'day', 'category_id'), name='unique_desk_day_category')],
+            },
+        ),
+        migrations.CreateModel(
+            name='HourlyTaskRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('desk_id', models.BigIntegerField()),
+                ('category_id', models.BigIntegerField()),
+                ('activated', models.PositiveIntegerField(default=0, help_text='Tasks activated by hand')),
+                ('scheduled', models.PositiveIntegerField(default=0, help_text='Tasks activated by their schedule')),
+                ('completed', models.PositiveIntegerField(default=0, help_text='Tasks completed in the period')),
+                ('on_time', models.PositiveIntegerField(default=0, help_text='Scheduled tasks completed within the on-time window')),
+                ('late', models.PositiveIntegerField(default=0, help_text='Scheduled tasks completed after the on-time window')),
+                ('completion_seconds', models.BigIntegerField(default=0, help_text='Due-to-completion time of on_time and late tasks')),
+                ('hour', models.DateTimeField()),
+            ],
+            options={
+                'indexes': [models.Index(fields=['hour'], name='todo_hourly_hour_b84ad3_idx')],
+                'constraints': [models.UniqueConstraint(fields=('desk_id', 'hour', 'category_id'), name='unique_desk_hour_category')],
+            },
+        ),
+        migrations.CreateModel(
+            name='TaskEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('task_id', models.BigIntegerField()),
+                ('desk_id', models.BigIntegerField()),
+                ('category_id', models.BigIntegerField()),
+                ('kind', models.PositiveSmallIntegerField(choices=[(1, 'Activated'), (2, 'Activated by schedule'), (3, 'Completed')])),
+                ('at', models.DateTimeField()),
+            ],
+            options={
+                'indexes': [models.Index(fields=['task_id'], name='todo_taskev_task_id_62fdab_idx')],
+            },
+        ),
+    ]
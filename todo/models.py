@@ -1,7 +1,13 @@
-from django.db import models
+from collections import defaultdict
+
+from django.db import models, transaction
+from django.db.models import Count, F, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
 from django.contrib.auth.models import User
-from desks.models import Desk
+from django.utils import timezone
+from desks.models import Desk, COUNTER_FIELDS
 from datetime import time
+from .pubsub import publish_task_deletions
 
 class UserProfile(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='profile')
@@ -18,16 +24,33 @@ class Category(models.Model):
     title = models.CharField(max_length=100)
     description = models.TextField()
     desk = models.ForeignKey(Desk, on_delete=models.CASCADE, related_name="categories", null=True, blank=True)
+    # Kept in step by every task write; reconcile_counters repairs drift.
+    # Plain integers so a drifted counter cannot make a write fail.
+    task_count = models.IntegerField(default=0, editable=False)
+    active_task_count = models.IntegerField(default=0, editable=False)
 
     def __str__(self):
         return self.title
 
+    def save(self, *args, **kwargs):
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            # Never write back counters that may have moved on since loading
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in COUNTER_FIELDS
+            ]
+        return super().save(*args, **kwargs)
+
 
 class Schedule(models.Model):
     """
     Represents a schedule with a title and multiple moments (day and time).
+    Schedules belong to a desk and can only be used by that desk's tasks.
+    Schedules created before desks owned them and never used by a task have
+    no desk until staff attach them to one.
     """
     title = models.CharField(max_length=100)
+    desk = models.ForeignKey(Desk, on_delete=models.CASCADE, related_name="schedules", null=True, blank=True)
 
     def __str__(self):
         return self.title
@@ -55,6 +78,39 @@ class ScheduleMoment(models.Model):
         return f"{self.schedule.title} - {self.get_day_of_week_display()} at {self.time_of_day}"
 
 
+class ScheduleOccurrence(models.Model):
+    """
+    Ledger entry recording that a moment has fired for a given week, so each
+    moment activates its tasks once per week however often the scheduler runs.
+    """
+    moment = models.ForeignKey(ScheduleMoment, on_delete=models.CASCADE, related_name="occurrences")
+    week = models.DateField(help_text="Monday of the week the moment fired in")
+    fired_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['moment', 'week'], name='unique_moment_week'),
+        ]
+
+    def __str__(self):
+        return f"{self.moment} fired for week of {self.week}"
+
+
+class TaskQuerySet(models.QuerySet):
+    def delete(self):
+        """
+        Delete the tasks and record their deletion for status pollers.
+
+        Done here rather than in a post_delete receiver so that category and
+        desk cascades can still remove their tasks in a single statement.
+        """
+        with transaction.atomic(using=self.db):
+            deleted_tasks = list(self.values_list('id', 'category__desk_id', 'category_id', 'is_active'))
+            result = super().delete()
+            record_task_deletions(deleted_tasks)
+        return result
+
+
 class Task(models.Model):
     """
     Represents a task that belongs to a category and a desk.
@@ -64,9 +120,330 @@ class Task(models.Model):
     category = models.ForeignKey(Category, on_delete=models.CASCADE, related_name="tasks")
     schedule = models.ForeignKey(Schedule, on_delete=models.SET_NULL, null=True, blank=True, related_name="tasks")
     is_active = models.BooleanField(default=False)
+    # Bumped whenever a toggle, a batch operation or the scheduler writes the
+    # task, so clients can detect conflicting writes
+    version = models.PositiveIntegerField(default=0)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = TaskQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # Serves the "changed since" lookups of the status endpoint
+            models.Index(fields=['category', 'updated_at']),
+        ]
+
     def __str__(self):
         return self.title
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        task = super().from_db(db, field_names, values)
+        # The counted state, for save() to move the counters from
+        task._counted = (task.__dict__.get('category_id'), task.__dict__.get('is_active'))
+        return task
+
+    def save(self, *args, **kwargs):
+        """
+        Save the task, moving its desk's generation and task counters along
+        and logging a change of its active state
+        """
+        adding = self._state.adding
+        counted = None if adding else getattr(self, '_counted', None)
+        update_fields = kwargs.get('update_fields')
+        with transaction.atomic():
+            result = super().save(*args, **kwargs)
+            counts = TaskCountChanges()
+            # The generation moves even when no counter does
+            counts.add(self.category.desk_id, self.category_id)
+            counted_fields_saved = update_fields is None or {'is_active', 'category', 'category_id'} & set(update_fields)
+            # Loaded without the counted fields, the change is unknown; reconcile_counters catches up
+            if counted_fields_saved and (counted is None or None not in counted):
+                if counted is not None:
+                    category_id, is_active = counted
+                    desk_id = self.category.desk_id if category_id == self.category_id else (
+                        Category.objects.filter(pk=category_id).values_list('desk_id', flat=True).first()
+                    )
+                    counts.add_tasks(desk_id, category_id, is_active, -1)
+                counts.add_tasks(self.category.desk_id, self.category_id, self.is_active)
+                if (adding or counted is not None) and self.is_active != (counted is not None and counted[1]):
+                    kind = TaskEvent.ACTIVATED if self.is_active else TaskEvent.COMPLETED
+                    record_task_events([(self.pk, self.category.desk_id, self.category_id, kind)])
+            counts.apply(bump_generation=True)
+        self._counted = (self.category_id, self.is_active)
+        return result
+
+    def delete(self, *args, **kwargs):
+        deleted_task = (self.id, self.category.desk_id, self.category_id, self.is_active)
+        with transaction.atomic():
+            result = super().delete(*args, **kwargs)
+            record_task_deletions([deleted_task])
+        return result
+
+
+class DeletedTask(models.Model):
+    """
+    Tombstone left behind by a deleted task so status pollers can drop it.
+    Plain IDs are stored because the task and its desk may already be gone.
+    """
+    task_id = models.BigIntegerField()
+    desk_id = models.BigIntegerField()
+    deleted_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['desk_id', 'deleted_at']),
+        ]
+
+    def __str__(self):
+        return f"Task {self.task_id} deleted at {self.deleted_at}"
+
+
+class SchedulerRun(models.Model):
+    """
+    Telemetry of one activate_scheduled_tasks run. Only the most recent
+    TASK_SCHEDULER['history_size'] runs are kept.
+    """
+    TRIGGER_CHOICES = [
+        ('poll', 'Poll'),
+        ('event', 'Event'),
+    ]
+
+    started_at = models.DateTimeField()
+    trigger = models.CharField(max_length=5, choices=TRIGGER_CHOICES)
+    duration = models.FloatField(help_text="Wall time in seconds")
+    scanned = models.PositiveIntegerField(help_text="Candidate rows read")
+    activated = models.PositiveIntegerField()
+    skipped = models.PositiveIntegerField(help_text="Candidates already activated by someone else")
+    mean_lag = models.FloatField(null=True, help_text="Mean seconds from due time to activation")
+    max_lag = models.FloatField(null=True, help_text="Largest seconds from due time to activation")
+
+    class Meta:
+        ordering = ['-started_at']
+        indexes = [
+            models.Index(fields=['started_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.get_trigger_display()} run at {self.started_at}: {self.activated} activated"
+
+
+class TaskEvent(models.Model):
+    """
+    Append-only log of task state changes, folded into the task rollups by
+    todo.analytics. Plain IDs keep rows small and outlive deleted tasks.
+    """
+    ACTIVATED = 1
+    SCHEDULED = 2
+    COMPLETED = 3
+    KIND_CHOICES = [
+        (ACTIVATED, 'Activated'),
+        (SCHEDULED, 'Activated by schedule'),
+        (COMPLETED, 'Completed'),
+    ]
+
+    task_id = models.BigIntegerField()
+    desk_id = models.BigIntegerField()
+    category_id = models.BigIntegerField()
+    kind = models.PositiveSmallIntegerField(choices=KIND_CHOICES)
+    at = models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            # Finds the activation a completion ends
+            models.Index(fields=['task_id']),
+        ]
+
+    def __str__(self):
+        return f"Task {self.task_id} {self.get_kind_display().lower()} at {self.at}"
+
+
+class TaskRollup(models.Model):
+    """
+    Task event counts of one category over one period. Completions of
+    scheduled tasks count towards the period the task came due in, so
+    on_time / scheduled is the share of due tasks completed on time.
+    """
+    desk_id = models.BigIntegerField()
+    category_id = models.BigIntegerField()
+    activated = models.PositiveIntegerField(default=0, help_text="Tasks activated by hand")
+    scheduled = models.PositiveIntegerField(default=0, help_text="Tasks activated by their schedule")
+    completed = models.PositiveIntegerField(default=0, help_text="Tasks completed in the period")
+    on_time = models.PositiveIntegerField(default=0, help_text="Scheduled tasks completed within the on-time window")
+    late = models.PositiveIntegerField(default=0, help_text="Scheduled tasks completed after the on-time window")
+    completion_seconds = models.BigIntegerField(default=0, help_text="Due-to-completion time of on_time and late tasks")
+
+    class Meta:
+        abstract = True
+
+
+class HourlyTaskRollup(TaskRollup):
+    """Task event counts per UTC hour, kept for TASK_ANALYTICS['hourly_retention'] days"""
+    hour = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['desk_id', 'hour', 'category_id'], name='unique_desk_hour_category'),
+        ]
+        indexes = [
+            # Serves pruning
+            models.Index(fields=['hour']),
+        ]
+
+    def __str__(self):
+        return f"Category {self.category_id} at {self.hour}"
+
+
+class DailyTaskRollup(TaskRollup):
+    """Task event counts per local day"""
+    day = models.DateField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['desk_id', 'day', 'category_id'], name='unique_desk_day_category'),
+        ]
+
+    def __str__(self):
+        return f"Category {self.category_id} on {self.day}"
+
+
+class TaskRollupCursor(models.Model):
+    """Single row holding the last TaskEvent folded into the rollups"""
+    last_event_id = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Rolled up through event {self.last_event_id}"
+
+
+def record_task_events(events, at=None):
+    """
+    Append task state changes to the event log in one INSERT.
+
+    Args:
+        events: (task_id, desk_id, category_id, kind) tuples, kind being
+            one of the TaskEvent kinds
+        at: Time of the changes; defaults to now
+    """
+    at = at or timezone.now()
+    TaskEvent.objects.bulk_create([
+        TaskEvent(task_id=task_id, desk_id=desk_id, category_id=category_id, kind=kind, at=at)
+        for task_id, desk_id, category_id, kind in events
+        if desk_id is not None
+    ])
+
+
+def record_task_deletions(deleted_tasks):
+    """
+    Leave tombstones, take the tasks off the task counters, move desk
+    generations forward and notify live subscribers for deleted tasks.
+
+    Args:
+        deleted_tasks: (task_id, desk_id, category_id, is_active) tuples
+    """
+    task_ids_by_desk = {}
+    counts = TaskCountChanges()
+    for task_id, desk_id, category_id, is_active in deleted_tasks:
+        counts.add_tasks(desk_id, category_id, is_active, -1)
+        if desk_id is not None:
+            task_ids_by_desk.setdefault(desk_id, []).append(task_id)
+    counts.apply(bump_generation=True)
+    if not task_ids_by_desk:
+        return
+
+    DeletedTask.objects.bulk_create([
+        DeletedTask(task_id=task_id, desk_id=desk_id)
+        for desk_id, task_ids in task_ids_by_desk.items()
+        for task_id in task_ids
+    ])
+    for desk_id, task_ids in task_ids_by_desk.items():
+        publish_task_deletions(desk_id, task_ids)
+
+
+class TaskCountChanges:
+    """
+    Changes to the stored task counters of categories and desks, collected
+    while tasks are written and applied with apply() in the same transaction.
+    """
+
+    def __init__(self):
+        # (desk_id, category_id) -> [total, active]
+        self.changes = defaultdict(lambda: [0, 0])
+
+    def add(self, desk_id, category_id, total=0, active=0):
+        change = self.changes[desk_id, category_id]
+        change[0] += total
+        change[1] += active
+
+    def add_tasks(self, desk_id, category_id, is_active, count=1):
+        """Count tasks created in a category, or removed with a negative count"""
+        self.add(desk_id, category_id, count, count if is_active else 0)
+
+    def apply(self, bump_generation=False):
+        """
+        Write the changes with one UPDATE per distinct change per table.
+
+        Args:
+            bump_generation: Also move the generation of every desk with
+                changed tasks forward, in the same UPDATE
+        """
+        desks = defaultdict(lambda: [0, 0])
+        for (desk_id, category_id), (total, active) in self.changes.items():
+            if desk_id is not None:
+                desks[desk_id][0] += total
+                desks[desk_id][1] += active
+        _apply_counts(Category, {
+            category_id: change for (_, category_id), change in self.changes.items()
+        })
+        _apply_counts(Desk, desks, bump_generation)
+        self.changes.clear()
+
+
+def _apply_counts(model, changes, bump_generation=False):
+    by_change = defaultdict(list)
+    for pk, (total, active) in changes.items():
+        if total or active or bump_generation:
+            by_change[total, active].append(pk)
+    for (total, active), pks in by_change.items():
+        fields = {
+            'task_count': F('task_count') + total,
+            'active_task_count': F('active_task_count') + active,
+        }
+        if bump_generation:
+            fields['generation'] = F('generation') + 1
+        model.objects.filter(pk__in=pks).update(**fields)
+
+
+def reconcile_task_counts(desks=None, dry_run=False):
+    """
+    Recount the tasks of categories and desks and fix the stored counters
+    that drifted.
+
+    Args:
+        desks: Queryset of the desks to check; every desk when None
+        dry_run: Only count the drifted rows
+
+    Returns:
+        tuple: Numbers of drifted categories and desks
+    """
+    categories = Category.objects.all() if desks is None else Category.objects.filter(desk__in=desks)
+    desks = Desk.objects.all() if desks is None else desks
+    drifted = []
+    with transaction.atomic():
+        for model, queryset, tasks in (
+            (Category, categories, Task.objects.filter(category=OuterRef('pk')).values('category')),
+            (Desk, desks, Task.objects.filter(category__desk=OuterRef('pk')).values('category__desk')),
+        ):
+            tasks = tasks.order_by()
+            rows = list(queryset.annotate(
+                actual_total=Coalesce(Subquery(tasks.annotate(n=Count('id')).values('n')), 0),
+                actual_active=Coalesce(Subquery(tasks.filter(is_active=True).annotate(n=Count('id')).values('n')), 0),
+            ).filter(
+                ~Q(task_count=F('actual_total')) | ~Q(active_task_count=F('actual_active'))
+            ).values_list('pk', 'actual_total', 'actual_active'))
+            if not dry_run:
+                for pk, total, active in rows:
+                    model.objects.filter(pk=pk).update(task_count=total, active_task_count=active)
+            drifted.append(len(rows))
+    return tuple(drifted)
@@ -0,0 +1,154 @@
+"""
+Batched task mutations for a desk.
+
+apply_task_operations() checks a list of operations against the desk's
+tasks and applies them in one transaction: a bulk UPDATE for every changed
+task and a bulk DELETE, with the task counters moved to match and state
+changes logged. Operations run in order, so a later operation on the
+same task sees the effect of an earlier one. Each gets its own result, and
+an invalid operation does not stop the others.
+"""
+import json
+
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Task, Category, TaskCountChanges, TaskEvent, record_task_events
+from .pubsub import publish_task_changes
+
+OPERATIONS = ('set', 'move', 'delete')
+
+# Most operations accepted in one request
+MAX_BATCH_OPERATIONS = 500
+
+
+class BatchFormatError(Exception):
+    """The request body is not a list of operations"""
+
+
+def parse_operations(body):
+    """
+    Decode a JSON request body of the form {"operations": [...]}.
+
+    Raises:
+        BatchFormatError: The body is malformed or holds too many operations
+    """
+    try:
+        data = json.loads(body)
+    except (ValueError, UnicodeDecodeError):
+        raise BatchFormatError("Request body is not valid JSON")
+    operations = data.get('operations') if isinstance(data, dict) else None
+    if not isinstance(operations, list):
+        raise BatchFormatError("Expected an object with an 'operations' list")
+    if len(operations) > MAX_BATCH_OPERATIONS:
+        raise BatchFormatError(f"At most {MAX_BATCH_OPERATIONS} operations are accepted per request")
+    return operations
+
+
+def _is_id(value):
+    # JSON true/false decode to bools, which are ints in Python
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+def apply_task_operations(desk, operations):
+    """
+    Apply operations to the desk's tasks in one transaction.
+
+    Each operation names the task by 'id' and may give the 'version' the
+    task must still be at:
+        {"op": "set", "id": 1, "is_active": true}
+        {"op": "move", "id": 1, "category": 2}
+        {"op": "delete", "id": 1}
+
+    Returns:
+        list: One dict per operation with the task 'id' and 'ok', plus its
+            new 'is_active', 'category' and 'version', 'deleted', or an 'error'
+    """
+    task_ids = {op.get('id') for op in operations if isinstance(op, dict) and _is_id(op.get('id'))}
+    category_ids = {
+        op.get('category') for op in operations
+        if isinstance(op, dict) and op.get('op') == 'move' and _is_id(op.get('category'))
+    }
+
+    with transaction.atomic():
+        tasks = {
+            task.id: task
+            for task in Task.objects.select_for_update().filter(
+                id__in=task_ids, category__desk=desk
+            ).only('id', 'title', 'is_active', 'category_id', 'version')
+        } if task_ids else {}
+        categories = set(Category.objects.filter(
+            desk=desk, id__in=category_ids
+        ).values_list('id', flat=True)) if category_ids else set()
+
+        counted = {task.id: (task.category_id, task.is_active) for task in tasks.values()}
+        changed = {}
+        deleted = set()
+        results = [_apply(operation, tasks, categories, changed, deleted) for operation in operations]
+
+        if changed:
+            now = timezone.now()
+            counts = TaskCountChanges()
+            for task in changed.values():
+                task.updated_at = now
+                counts.add_tasks(desk.pk, *counted[task.id], -1)
+                counts.add_tasks(desk.pk, task.category_id, task.is_active)
+            Task.objects.bulk_update(changed.values(), ['is_active', 'category', 'version', 'updated_at'])
+            counts.apply(bump_generation=True)
+            record_task_events([
+                (task.id, desk.pk, task.category_id, TaskEvent.ACTIVATED if task.is_active else TaskEvent.COMPLETED)
+                for task in changed.values()
+                if task.is_active != counted[task.id][1]
+            ], at=now)
+            publish_task_changes(desk.pk, [
+                {
+                    'id': task.id,
+                    'title': task.title,
+                    'is_active': task.is_active,
+                    'category__id': task.category_id,
+                    'version': task.version,
+                }
+                for task in changed.values()
+            ])
+        if deleted:
+            # Leaves tombstones, uncounts the tasks and notifies subscribers
+            Task.objects.filter(id__in=deleted).delete()
+    return results
+
+
+def _apply(operation, tasks, categories, changed, deleted):
+    """Apply one operation to the loaded tasks and return its result"""
+    if not isinstance(operation, dict):
+        return {'id': None, 'ok': False, 'error': "Operation must be an object"}
+    task_id = operation.get('id')
+    result = {'id': task_id, 'ok': False}
+    kind = operation.get('op')
+    if kind not in OPERATIONS:
+        return dict(result, error=f"Unknown operation, expected one of {', '.join(OPERATIONS)}")
+    task = tasks.get(task_id) if _is_id(task_id) else None
+    if task is None or task_id in deleted:
+        return dict(result, error="Task not found")
+    version = operation.get('version')
+    if version is not None and version != task.version:
+        return dict(
+            result, error="Task was changed by someone else", conflict=True,
+            is_active=task.is_active, category=task.category_id, version=task.version,
+        )
+
+    if kind == 'delete':
+        deleted.add(task_id)
+        changed.pop(task_id, None)
+        return dict(result, ok=True, deleted=True)
+    if kind == 'set':
+        is_active = operation.get('is_active')
+        if not isinstance(is_active, bool):
+            return dict(result, error="'is_active' must be true or false")
+        task.is_active = is_active
+    else:
+        category_id = operation.get('category')
+        if not _is_id(category_id) or category_id not in categories:
+            return dict(result, error="Category not found")
+        task.category_id = category_id
+    task.version += 1
+    changed[task_id] = task
+    return dict(result, ok=True, is_active=task.is_active, category=task.category_id, version=task.version)
\ No newline at end of file
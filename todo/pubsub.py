@@ -0,0 +1,147 @@
+"""
+Publish/subscribe channel for live task state changes.
+
+Task saves, deletions and scheduler activations publish to a per-desk
+channel; the Server-Sent Events endpoint subscribes to it. The backend is
+configured with TASK_EVENTS['backend']. LocalPubSub only reaches subscribers
+in the same process, so the scheduler must run embedded in the server for
+its activations to be pushed; desk pages keep polling every
+TASK_EVENTS['stream_poll_interval'] seconds to pick up the rest.
+"""
+import asyncio
+import logging
+import queue
+import threading
+
+from django.conf import settings
+from django.db import transaction
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+_pubsub = None
+
+
+def get_pubsub():
+    """Return the configured pub/sub backend, creating it on first use"""
+    global _pubsub
+    if _pubsub is None:
+        _pubsub = import_string(settings.TASK_EVENTS['backend'])()
+    return _pubsub
+
+
+def desk_channel(desk_id):
+    return f"desk:{desk_id}"
+
+
+def publish_task_changes(desk_id, tasks):
+    """
+    Publish task state to the desk's subscribers once the transaction commits.
+
+    Args:
+        desk_id: ID of the desk the tasks belong to
+        tasks: Dicts with the same keys as the status endpoint returns
+    """
+    tasks = list(tasks)
+    if tasks:
+        transaction.on_commit(lambda: _publish_all(desk_id, tasks))
+
+
+def publish_task_deletions(desk_id, task_ids):
+    """Publish deleted task IDs to the desk's subscribers once the transaction commits"""
+    messages = [{'id': task_id, 'deleted': True} for task_id in task_ids]
+    if messages:
+        transaction.on_commit(lambda: _publish_all(desk_id, messages))
+
+
+def _publish_all(desk_id, messages):
+    pubsub = get_pubsub()
+    channel = desk_channel(desk_id)
+    for message in messages:
+        try:
+            pubsub.publish(channel, message)
+        except Exception as e:
+            logger.error(f"Error publishing to {channel}: {e}")
+
+
+class LocalPubSub:
+    """
+    In-memory backend delivering messages to asyncio subscribers.
+
+    publish() may be called from any thread; each message is handed to the
+    subscriber's event loop with call_soon_threadsafe.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscriptions = {}  # channel -> set of Subscription
+
+    def publish(self, channel, message):
+        with self._lock:
+            subscriptions = list(self._subscriptions.get(channel, ()))
+        for subscription in subscriptions:
+            subscription.deliver(message)
+
+    def subscribe(self, channel, blocking=False):
+        """
+        Subscribe from a running event loop, or from a plain thread with
+        blocking=True; close() the result when done
+        """
+        subscription = (BlockingSubscription if blocking else Subscription)(self, channel)
+        with self._lock:
+            self._subscriptions.setdefault(channel, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscriptions = self._subscriptions.get(subscription.channel)
+            if subscriptions is not None:
+                subscriptions.discard(subscription)
+                if not subscriptions:
+                    del self._subscriptions[subscription.channel]
+
+    def subscriber_count(self, channel):
+        with self._lock:
+            return len(self._subscriptions.get(channel, ()))
+
+
+class Subscription:
+    """A single subscriber's queue, bound to the event loop that created it"""
+
+    def __init__(self, pubsub, channel):
+        self.pubsub = pubsub
+        self.channel = channel
+        self._loop = asyncio.get_running_loop()
+        self._queue = asyncio.Queue()
+
+    def deliver(self, message):
+        try:
+            self._loop.call_soon_threadsafe(self._queue.put_nowait, message)
+        except RuntimeError:
+            # The subscriber's loop is gone
+            self.close()
+
+    async def get(self):
+        return await self._queue.get()
+
+    def close(self):
+        self.pubsub.unsubscribe(self)
+
+
+class BlockingSubscription:
+    """A single subscriber's queue, read by a thread that blocks on get()"""
+
+    def __init__(self, pubsub, channel):
+        self.pubsub = pubsub
+        self.channel = channel
+        self._queue = queue.SimpleQueue()
+
+    def deliver(self, message):
+        self._queue.put(message)
+
+    def get(self, timeout=None):
+        """Wait for the next message; raises queue.Empty after timeout seconds"""
+        return self._queue.get(timeout=timeout)
+
+    def close(self):
+        self.pubsub.unsubscribe(self)
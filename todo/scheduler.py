@@ -0,0 +1,227 @@
+"""
+Event-driven scheduler that sleeps until the next due ScheduleMoment.
+
+Instead of rescanning tasks every minute, the engine keeps a heap of
+(next fire time, moment id) pairs and wakes exactly when the earliest moment
+comes due. ScheduleMoment signals keep the heap in sync within the process;
+a periodic resync picks up changes made by other processes.
+"""
+import heapq
+import logging
+import threading
+import time
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.utils import timezone
+
+from .models import ScheduleMoment
+from .utils import activate_scheduled_tasks
+
+logger = logging.getLogger(__name__)
+
+# The engine running in this process, if any
+_engine = None
+
+
+def get_engine():
+    """Return the engine running in this process, or None"""
+    return _engine
+
+
+def start(background=True):
+    """
+    Create the process-wide engine and optionally run it in a daemon thread.
+
+    Args:
+        background: Start the engine loop in a daemon thread when True.
+            Otherwise the caller is expected to call engine.run() itself.
+
+    Returns:
+        ScheduleEngine: The process-wide engine
+    """
+    global _engine
+    if _engine is None:
+        _engine = ScheduleEngine()
+        if background:
+            threading.Thread(target=_engine.run, name='task-scheduler', daemon=True).start()
+    return _engine
+
+
+def start_embedded():
+    """
+    Start the engine in a background thread of the server process when
+    TASK_SCHEDULER runs in 'event' mode with 'embedded' set. Called by the
+    ASGI and WSGI entry points once Django is set up.
+
+    Returns:
+        ScheduleEngine: The process-wide engine, or None when not embedded
+    """
+    if settings.TASK_SCHEDULER.get('mode') == 'event' and settings.TASK_SCHEDULER.get('embedded'):
+        return start()
+    return None
+
+
+def next_fire_time(day_of_week, time_of_day, after):
+    """Return the first local datetime after `after` on the given weekday and time"""
+    after = timezone.localtime(after)
+    days_ahead = (day_of_week - after.weekday()) % 7
+    fire_at = timezone.make_aware(datetime.combine(after.date() + timedelta(days=days_ahead), time_of_day))
+    if fire_at <= after:
+        fire_at = timezone.make_aware(datetime.combine(after.date() + timedelta(days=days_ahead + 7), time_of_day))
+    return fire_at
+
+
+class ScheduleEngine:
+    """
+    Min-heap of upcoming ScheduleMoment firings.
+
+    Heap entries are never removed in place: rescheduled or deleted moments
+    leave stale entries behind which are skipped when they reach the top.
+    """
+
+    def __init__(self, resync_interval=None):
+        if resync_interval is None:
+            resync_interval = settings.TASK_SCHEDULER.get('resync_interval', 300)
+        self.resync_interval = resync_interval
+        self._heap = []
+        self._fire_times = {}  # moment_id -> currently scheduled fire time
+        self._synced_at = None  # Monotonic time of the last load()
+        self._cond = threading.Condition()
+        self._stopped = False
+
+    def load(self, now=None):
+        """Rebuild the heap from every ScheduleMoment in the database"""
+        now = now or timezone.now()
+        moments = ScheduleMoment.objects.values_list('id', 'day_of_week', 'time_of_day')
+        fire_times = {
+            moment_id: next_fire_time(day_of_week, time_of_day, now)
+            for moment_id, day_of_week, time_of_day in moments.iterator()
+        }
+        heap = [(fire_at, moment_id) for moment_id, fire_at in fire_times.items()]
+        heapq.heapify(heap)
+        with self._cond:
+            self._heap = heap
+            self._fire_times = fire_times
+            self._synced_at = time.monotonic()
+            self._cond.notify()
+        logger.info(f"Scheduler loaded {len(heap)} schedule moments")
+
+    def schedule(self, moment, now=None):
+        """Add a moment or move it to its new fire time"""
+        fire_at = next_fire_time(moment.day_of_week, moment.time_of_day, now or timezone.now())
+        with self._cond:
+            self._fire_times[moment.id] = fire_at
+            heapq.heappush(self._heap, (fire_at, moment.id))
+            self._cond.notify()
+
+    def reschedule(self, moment_id, now=None):
+        """Schedule a moment as stored in the database, or drop it if it is gone"""
+        moment = ScheduleMoment.objects.filter(id=moment_id).only('id', 'day_of_week', 'time_of_day').first()
+        if moment is None:
+            self.discard(moment_id)
+        else:
+            self.schedule(moment, now)
+
+    def discard(self, moment_id):
+        """Stop firing a moment; its heap entry is dropped lazily"""
+        with self._cond:
+            self._fire_times.pop(moment_id, None)
+
+    def next_fire_time(self):
+        """Return the earliest pending fire time, or None when nothing is scheduled"""
+        with self._cond:
+            return self._peek()
+
+    def pop_due(self, now=None):
+        """
+        Remove every moment due at or before `now` and reschedule it a week later.
+
+        Returns:
+            list: IDs of the moments that came due
+        """
+        now = now or timezone.now()
+        due = []
+        with self._cond:
+            while self._peek() is not None and self._heap[0][0] <= now:
+                fire_at, moment_id = heapq.heappop(self._heap)
+                due.append(moment_id)
+                next_at = fire_at + timedelta(days=7)
+                self._fire_times[moment_id] = next_at
+                heapq.heappush(self._heap, (next_at, moment_id))
+        return due
+
+    def wake(self):
+        """Interrupt the current sleep so the engine re-evaluates its heap"""
+        with self._cond:
+            self._cond.notify()
+
+    def stop(self):
+        with self._cond:
+            self._stopped = True
+            self._cond.notify()
+
+    def run(self):
+        """Sleep until the next due moment, activate its tasks, repeat until stopped"""
+        self.load()
+        # Moments that came due while no engine was running; the occurrence
+        # ledger keeps any already fired from firing twice
+        self.catch_up()
+        while True:
+            if self.tick():
+                continue
+
+            with self._cond:
+                if self._stopped:
+                    break
+                timeout = self.resync_interval - (time.monotonic() - self._synced_at)
+                next_at = self._peek()
+                if next_at is not None:
+                    timeout = min(timeout, (next_at - timezone.now()).total_seconds())
+                if timeout > 0:
+                    self._cond.wait(timeout)
+
+    def tick(self, now=None):
+        """
+        Fire the moments due by `now`, reloading the heap first when the
+        resync interval has passed.
+
+        Returns:
+            list: IDs of the moments fired
+        """
+        now = now or timezone.now()
+        # Pop before reloading: load() only schedules moments after `now`,
+        # so a moment due since the last wake-up would be pushed back a week
+        due = self.pop_due(now)
+        if self._synced_at is None or time.monotonic() - self._synced_at >= self.resync_interval:
+            close_old_connections()
+            self.load(now)
+        if due:
+            self.fire(due)
+        return due
+
+    def catch_up(self):
+        """Activate the tasks of every moment missed within TASK_SCHEDULER['catch_up']"""
+        close_old_connections()
+        try:
+            activate_scheduled_tasks()
+        except Exception as e:
+            logger.error(f"Error catching up on missed schedule moments: {e}")
+
+    def fire(self, moment_ids):
+        """Activate the tasks scheduled by the given moments"""
+        close_old_connections()
+        try:
+            activate_scheduled_tasks(moment_ids=moment_ids)
+        except Exception as e:
+            logger.error(f"Error firing schedule moments {moment_ids}: {e}")
+
+    def _peek(self):
+        # Drop stale entries left behind by schedule() and discard()
+        while self._heap:
+            fire_at, moment_id = self._heap[0]
+            if self._fire_times.get(moment_id) == fire_at:
+                return fire_at
+            heapq.heappop(self._heap)
+        return None
@@ -0,0 +1,170 @@
+"""
+Full-text search of tasks across every desk a user can open.
+
+On SQLite, search_tasks() queries the FTS5 index todo_task_fts, which is
+kept in step by triggers (see todo.search_index). Each row carries a
+'desk<id>' token, so restricting a search to the user's desks is part of the
+MATCH itself. Other databases fall back to case-insensitive substring
+filters.
+
+Either way only as many matches as the pages can show are fetched, best
+first, and are then ranked by the field each word was found in. The index
+picks them by bm25 with RANK_WEIGHTS as column weights: a word in a heavier
+field outscores any number of occurrences in a lighter one, so the title
+and category matches are the ones kept. That costs a scan of each word's
+whole doclist, tens of milliseconds for a word found in most tasks, but
+fetching the newest matches instead would drop older title matches once a
+query has more matches than the pages hold. The fallback scores each match
+by the same weights in SQL.
+"""
+import re
+import unicodedata
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Case, Q, Value, When
+
+from desks.models import Desk
+from .models import Task
+
+# Words of a query; quotes and FTS5 operators in user input are dropped
+TERM_RE = re.compile(r'\w+')
+
+# Words searched per query; the rest are ignored
+MAX_SEARCH_TERMS = 8
+
+# Deepest page served; only as many matches as the pages hold are ranked
+MAX_SEARCH_PAGE = 50
+
+# Score of a word found in each field; the best field holding it counts
+RANK_WEIGHTS = {'title': 10, 'category': 4, 'description': 1}
+
+
+def parse_search_terms(query):
+    """Split a query into at most MAX_SEARCH_TERMS lower-cased words without accents"""
+    return _words(query or '')[:MAX_SEARCH_TERMS]
+
+
+def search_tasks(user, query, page=1, page_size=None):
+    """
+    Find tasks of the user's desks whose title, description or category
+    title contain every word of the query. The last word also matches as a
+    prefix, for search as you type.
+
+    Matches rank by the fields their words are found in (title, then
+    category, then description), newest first among equals. At most
+    MAX_SEARCH_PAGE * page_size matches are served, the best ranked ones.
+
+    Args:
+        user: User whose owned and shared desks are searched
+        query: Search text as typed
+        page: 1-based page number, at most MAX_SEARCH_PAGE
+        page_size: Results per page; defaults to settings.TASK_SEARCH_PAGE_SIZE
+
+    Returns:
+        tuple: (list of result dicts, whether a next page exists)
+    """
+    terms = parse_search_terms(query)
+    page_size = page_size or settings.TASK_SEARCH_PAGE_SIZE
+    if not terms or not 1 <= page <= MAX_SEARCH_PAGE:
+        return [], False
+
+    limit = MAX_SEARCH_PAGE * page_size
+    if _uses_index():
+        desk_ids = list(Desk.objects.accessible_to(user).values_list('id', flat=True))
+        if not desk_ids:
+            return [], False
+        candidates = _match_index(terms, desk_ids, limit)
+    else:
+        candidates = _match_fallback(terms, user, limit)
+
+    ranked = sorted(candidates, key=lambda row: (-_score(terms, row[1], row[2]), -row[0]))
+    offset = (page - 1) * page_size
+    task_ids = [row[0] for row in ranked[offset:offset + page_size]]
+    has_next = len(ranked) > offset + page_size
+    rows = {
+        row['id']: row
+        for row in Task.objects.filter(id__in=task_ids).values(
+            'id', 'title', 'description', 'is_active',
+            'category__title', 'category__desk__name', 'category__desk__slug',
+        )
+    } if task_ids else {}
+    # A task deleted between the two queries is simply left out
+    return [rows[task_id] for task_id in task_ids if task_id in rows], has_next
+
+
+def _uses_index():
+    return connection.vendor == 'sqlite'
+
+
+def _words(text):
+    # Folded like the index's unicode61 tokenizer folds them
+    text = unicodedata.normalize('NFKD', text.lower())
+    return TERM_RE.findall(''.join(char for char in text if not unicodedata.combining(char)))
+
+
+def _score(terms, title, category):
+    """Sum over the terms of the weight of the best field holding each"""
+    fields = (
+        (RANK_WEIGHTS['title'], _words(title)),
+        (RANK_WEIGHTS['category'], _words(category or '')),
+    )
+    score = 0
+    for position, term in enumerate(terms):
+        prefix = position == len(terms) - 1
+        # A candidate holds every term, so one in neither field is in the description
+        score += next((
+            weight for weight, words in fields
+            if any(word == term or prefix and word.startswith(term) for word in words)
+        ), RANK_WEIGHTS['description'])
+    return score
+
+
+def _match_expression(terms, desk_ids):
+    """FTS5 query matching every term within the given desks"""
+    desks = ' OR '.join(f'desk{desk_id}' for desk_id in desk_ids)
+    # Terms are \w+ words, safe to quote as phrases. Only the last one is a
+    # prefix: prefixes longer than the indexed ones are slow on common words.
+    phrases = ' '.join(f'"{term}"' for term in terms) + '*'
+    return f'{{desk}} : ({desks}) AND {{title description category}} : ({phrases})'
+
+
+def _match_index(terms, desk_ids, limit):
+    """(id, title, category title) of the `limit` best matches by weighted bm25"""
+    with connection.cursor() as cursor:
+        # Columns in index order; the desk tokens do not count towards rank
+        cursor.execute(
+            """
+            SELECT rowid, title, category FROM todo_task_fts
+            WHERE todo_task_fts MATCH %s
+            ORDER BY bm25(todo_task_fts, %s, %s, %s, 0), rowid DESC
+            LIMIT %s
+            """,
+            [
+                _match_expression(terms, desk_ids),
+                RANK_WEIGHTS['title'], RANK_WEIGHTS['description'], RANK_WEIGHTS['category'],
+                limit,
+            ],
+        )
+        return cursor.fetchall()
+
+
+def _match_fallback(terms, user, limit):
+    """(id, title, category title) of the `limit` best matches, without the index"""
+    tasks = Task.objects.filter(category__desk__in=Desk.objects.accessible_to(user).values('id'))
+    for term in terms:
+        tasks = tasks.filter(
+            Q(title__icontains=term) | Q(description__icontains=term) | Q(category__title__icontains=term)
+        )
+    # Substring approximation of _score, so that the cut keeps the best matches
+    score = sum(
+        Case(
+            When(title__icontains=term, then=Value(RANK_WEIGHTS['title'])),
+            When(category__title__icontains=term, then=Value(RANK_WEIGHTS['category'])),
+            default=Value(RANK_WEIGHTS['description']),
+        )
+        for term in terms
+    )
+    return list(
+        tasks.annotate(score=score).order_by('-score', '-id').values_list('id', 'title', 'category__title')[:limit]
+    )
@@ -0,0 +1,92 @@
+"""
+The SQLite FTS5 index searched by todo.search, and its triggers.
+
+The index holds each task's title, description and category title under the
+task's ID as rowid, plus a 'desk<id>' token so a search can be limited to the
+user's desks inside the index itself. Triggers keep it in step with every
+write, including bulk and raw SQL ones.
+
+SQLite remakes a table for most schema changes, which drops the triggers on
+it and fails on triggers naming it. Migrations altering todo_task or
+todo_category run drop_triggers() first and create_triggers() after.
+"""
+
+CREATE_TABLE = """
+    CREATE VIRTUAL TABLE todo_task_fts USING fts5(
+        title, description, category, desk,
+        tokenize = 'unicode61 remove_diacritics 2',
+        prefix = '2 3 4'
+    )
+"""
+
+FILL_TABLE = """
+    INSERT INTO todo_task_fts (rowid, title, description, category, desk)
+    SELECT t.id, t.title, t.description, c.title, 'desk' || c.desk_id
+    FROM todo_task t JOIN todo_category c ON c.id = t.category_id
+"""
+
+TRIGGERS = {
+    'todo_task_fts_insert': """
+        CREATE TRIGGER todo_task_fts_insert AFTER INSERT ON todo_task BEGIN
+            INSERT INTO todo_task_fts (rowid, title, description, category, desk)
+            SELECT new.id, new.title, new.description, c.title, 'desk' || c.desk_id
+            FROM todo_category c WHERE c.id = new.category_id;
+        END
+    """,
+    # Toggles only touch is_active and version, and skip the index entirely
+    'todo_task_fts_update': """
+        CREATE TRIGGER todo_task_fts_update AFTER UPDATE OF title, description, category_id ON todo_task
+        WHEN old.title IS NOT new.title
+            OR old.description IS NOT new.description
+            OR old.category_id IS NOT new.category_id
+        BEGIN
+            DELETE FROM todo_task_fts WHERE rowid = old.id;
+            INSERT INTO todo_task_fts (rowid, title, description, category, desk)
+            SELECT new.id, new.title, new.description, c.title, 'desk' || c.desk_id
+            FROM todo_category c WHERE c.id = new.category_id;
+        END
+    """,
+    'todo_task_fts_delete': """
+        CREATE TRIGGER todo_task_fts_delete AFTER DELETE ON todo_task BEGIN
+            DELETE FROM todo_task_fts WHERE rowid = old.id;
+        END
+    """,
+    'todo_category_fts_update': """
+        CREATE TRIGGER todo_category_fts_update AFTER UPDATE OF title, desk_id ON todo_category
+        WHEN old.title IS NOT new.title OR old.desk_id IS NOT new.desk_id
+        BEGIN
+            UPDATE todo_task_fts SET category = new.title, desk = 'desk' || new.desk_id
+            WHERE rowid IN (SELECT id FROM todo_task WHERE category_id = new.id);
+        END
+    """,
+}
+
+
+def create_index(apps, schema_editor):
+    """Build and fill the index on SQLite; other databases search without one"""
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute(CREATE_TABLE)
+    schema_editor.execute(FILL_TABLE)
+    create_triggers(apps, schema_editor)
+
+
+def drop_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    drop_triggers(apps, schema_editor)
+    schema_editor.execute("DROP TABLE IF EXISTS todo_task_fts")
+
+
+def create_triggers(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for statement in TRIGGERS.values():
+        schema_editor.execute(statement)
+
+
+def drop_triggers(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for name in TRIGGERS:
+        schema_editor.execute(f"DROP TRIGGER IF EXISTS {name}")
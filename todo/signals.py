@@ -1,7 +1,13 @@
-from django.db.models.signals import post_save
+from django.db import connection, transaction
+from django.db.models import F, Subquery
+from django.db.models.signals import post_save, pre_delete, post_delete
 from django.contrib.auth.models import User
 from django.dispatch import receiver
-from .models import UserProfile
+from django.utils import timezone
+from .models import UserProfile, Schedule, ScheduleMoment, Task, Category, DeletedTask
+from desks.models import Desk
+from .scheduler import get_engine
+from .pubsub import publish_task_changes, publish_task_deletions
 
 @receiver(post_save, sender=User)
 def create_user_profile(sender, instance, created, **kwargs):
@@ -10,4 +16,77 @@ def create_user_profile(sender, instance, created, **kwargs):
     """
     if created:
         UserProfile.objects.create(user=instance)
-        # Rest of the function stays the same (desk and category creation)
\ No newline at end of file
+        # Rest of the function stays the same (desk and category creation)
+
+@receiver(post_save, sender=ScheduleMoment)
+def reschedule_moment(sender, instance, **kwargs):
+    """Keep the in-process scheduler heap in sync with edited moments."""
+    engine = get_engine()
+    if engine is not None:
+        # The saved instance may still hold the raw form strings, so the
+        # engine reads the committed row instead
+        moment_id = instance.id
+        transaction.on_commit(lambda: engine.reschedule(moment_id))
+
+@receiver(post_delete, sender=ScheduleMoment)
+def unschedule_moment(sender, instance, **kwargs):
+    """Drop deleted moments from the in-process scheduler heap."""
+    engine = get_engine()
+    if engine is not None:
+        engine.discard(instance.id)
+
+@receiver(post_save, sender=Task)
+def publish_task_state(sender, instance, **kwargs):
+    """Push the saved task's state to live desk subscribers."""
+    # Task.save() has moved the desk's generation forward
+    desk_id = instance.category.desk_id
+    if desk_id is not None:
+        publish_task_changes(desk_id, [{
+            'id': instance.id,
+            'title': instance.title,
+            'is_active': instance.is_active,
+            'category__id': instance.category_id,
+            'version': instance.version,
+        }])
+
+@receiver(pre_delete, sender=Category)
+def record_deleted_category_tasks(sender, instance, origin=None, **kwargs):
+    """Leave tombstones for every task removed along with a category and uncount them."""
+    if instance.desk_id is None or isinstance(origin, Desk):
+        # Pollers of a deleted desk get a 404 rather than a delta
+        return
+    task_ids = list(Task.objects.filter(category=instance).values_list('id', flat=True))
+    # A single INSERT ... SELECT however many tasks the category holds
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"INSERT INTO {DeletedTask._meta.db_table} (task_id, desk_id, deleted_at) "
+            f"SELECT id, %s, %s FROM {Task._meta.db_table} WHERE category_id = %s",
+            [instance.desk_id, connection.ops.adapt_datetimefield_value(timezone.now()), instance.pk]
+        )
+    publish_task_deletions(instance.desk_id, task_ids)
+    # The cascade deletes the tasks in bulk; take their count off the desk
+    counted = Category.objects.filter(pk=instance.pk)
+    Desk.objects.filter(pk=instance.desk_id).update(
+        task_count=F('task_count') - Subquery(counted.values('task_count')),
+        active_task_count=F('active_task_count') - Subquery(counted.values('active_task_count')),
+    )
+
+@receiver([post_save, post_delete], sender=Category)
+def category_changed(sender, instance, origin=None, **kwargs):
+    """Move the desk's change generation forward when a category changes."""
+    if instance.desk_id is not None and not isinstance(origin, Desk):
+        Desk.objects.filter(pk=instance.desk_id).bump_generation()
+
+@receiver([post_save, post_delete], sender=Schedule)
+@receiver([post_save, post_delete], sender=ScheduleMoment)
+def schedule_changed(sender, instance, origin=None, **kwargs):
+    """Move the owning desk's change generation forward when a schedule changes."""
+    if isinstance(origin, Desk):
+        return
+    if sender is ScheduleMoment:
+        if isinstance(origin, Schedule):
+            # Deleting the schedule bumps once for all of its moments
+            return
+        Desk.objects.filter(schedules=instance.schedule_id).bump_generation()
+    elif instance.desk_id is not None:
+        Desk.objects.filter(pk=instance.desk_id).bump_generation()
\ No newline at end of file
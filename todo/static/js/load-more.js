@@ -0,0 +1,60 @@
+/**
+ * "Load more" for paged task lists
+ *
+ * A page ends with a .load-more item whose button carries the next page's
+ * URL. The server answers with the following items and, while more remain,
+ * a new .load-more item. Items marked data-auto-load fetch themselves once
+ * they scroll into view.
+ */
+document.addEventListener('DOMContentLoaded', function() {
+    const observer = window.IntersectionObserver
+        ? new IntersectionObserver(entries => {
+            entries.forEach(entry => {
+                if (entry.isIntersecting) {
+                    observer.unobserve(entry.target);
+                    loadMore(entry.target);
+                }
+            });
+        })
+        : null;
+    
+    function watch(root) {
+        if (!observer) return;
+        root.querySelectorAll('.load-more[data-auto-load]').forEach(item => observer.observe(item));
+    }
+    
+    function loadMore(item) {
+        const button = item.querySelector('[data-next-url]');
+        if (!button || button.disabled) return;
+        button.disabled = true;
+        
+        fetch(button.dataset.nextUrl, { credentials: 'same-origin' })
+            .then(response => {
+                if (!response.ok) {
+                    throw new Error(`Server returned ${response.status}`);
+                }
+                return response.text();
+            })
+            .then(html => {
+                const list = item.parentNode;
+                item.insertAdjacentHTML('beforebegin', html);
+                item.remove();
+                watch(list);
+                // Let the live updater track the new tasks
+                document.dispatchEvent(new CustomEvent('tasks:loaded'));
+            })
+            .catch(error => {
+                console.error('Error loading more tasks:', error);
+                button.disabled = false;
+            });
+    }
+    
+    document.addEventListener('click', function(event) {
+        const button = event.target.closest('.load-more [data-next-url]');
+        if (!button) return;
+        event.preventDefault();
+        loadMore(button.closest('.load-more'));
+    });
+    
+    watch(document);
+});
\ No newline at end of file
@@ -4,6 +4,12 @@
 document.addEventListener('DOMContentLoaded', function() {
     // Configuration
     const POLL_INTERVAL = 5000; // 5 seconds
+    // Polls kept up while the event stream is open: the stream only carries
+    // changes made by the server process holding it
+    const container = document.querySelector('.tasks-container');
+    const STREAM_POLL_INTERVAL = container
+        ? Number(container.dataset.streamPollInterval || 0) * 1000
+        : POLL_INTERVAL;
     
     // Get desk slug from URL
     const pathParts = window.location.pathname.split('/').filter(p => p);
@@ -57,39 +63,133 @@ document.addEventListener('DOMContentLoaded', function() {
         return match ? match[1] : null;
     }
     
+    // Compare a task's state from the server with what the page shows
+    function applyTaskState(task) {
+        const taskId = task.id.toString();
+        
+        // Only care about tasks we're tracking
+        if (taskId in taskStates) {
+            // Check if state changed
+            if (taskStates[taskId] !== task.is_active) {
+                console.log(`Task ${taskId} state changed to ${task.is_active ? 'active' : 'inactive'}`);
+                
+                // Update our tracking
+                taskStates[taskId] = task.is_active;
+                
+                // Force page refresh for now
+                window.location.reload();
+            }
+        }
+    }
+    
+    // Cursor returned by the server; only changes after it are fetched
+    let cursor = null;
+    
     // Check for task updates
     function checkForUpdates() {
-        fetch(`/${deskSlug}/tasks/status/`)
+        const url = cursor
+            ? `/${deskSlug}/tasks/status/?since=${encodeURIComponent(cursor)}`
+            : `/${deskSlug}/tasks/status/`;
+        fetchStatusPage(url, null);
+    }
+    
+    // Follow the pages of one update; the first page's cursor covers them all
+    function fetchStatusPage(url, updateCursor) {
+        fetch(url)
             .then(response => response.json())
             .then(data => {
-                console.log(`Received ${data.count} tasks at ${data.timestamp}`);
+                console.log(`Received ${data.count} changed tasks at ${data.timestamp}`);
+                updateCursor = updateCursor || data.cursor;
+                
+                // Reload if a task we're showing was deleted
+                if (data.deleted.some(taskId => taskId.toString() in taskStates)) {
+                    window.location.reload();
+                    return;
+                }
                 
                 // Process each task
-                data.tasks.forEach(task => {
-                    const taskId = task.id.toString();
-                    
-                    // Only care about tasks we're tracking
-                    if (taskId in taskStates) {
-                        // Check if state changed
-                        if (taskStates[taskId] !== task.is_active) {
-                            console.log(`Task ${taskId} state changed to ${task.is_active ? 'active' : 'inactive'}`);
-                            
-                            // Update our tracking
-                            taskStates[taskId] = task.is_active;
-                            
-                            // Force page refresh for now
-                            window.location.reload();
-                        }
-                    }
-                });
+                data.tasks.forEach(applyTaskState);
+                
+                if (data.next) {
+                    fetchStatusPage(data.next, updateCursor);
+                } else {
+                    cursor = updateCursor;
+                }
             })
             .catch(error => {
                 console.error('Error checking task status:', error);
             });
     }
     
+    // Poll on a timer, alongside the event stream or instead of it
+    let pollTimer = null;
+    let pollInterval = null;
+    
+    function pollEvery(interval) {
+        // Keep the faster timer if one is already running
+        if (pollTimer && pollInterval <= interval) return;
+        clearInterval(pollTimer);
+        pollInterval = interval;
+        pollTimer = setInterval(checkForUpdates, interval);
+    }
+    
+    // Fall back to polling when the event stream is unavailable
+    function startPolling() {
+        console.log('Falling back to polling every', POLL_INTERVAL, 'ms');
+        pollEvery(POLL_INTERVAL);
+        checkForUpdates(); // Check immediately
+    }
+    
+    // Listen for pushed task changes
+    function startEventStream() {
+        if (!window.EventSource) {
+            startPolling();
+            return;
+        }
+        
+        const source = new EventSource(`/${deskSlug}/tasks/events/`);
+        let opened = false;
+        
+        source.onopen = function() {
+            opened = true;
+            // Catch up on anything missed before (re)connecting
+            checkForUpdates();
+            // Changes made outside this server process are not streamed
+            if (STREAM_POLL_INTERVAL > 0) {
+                pollEvery(STREAM_POLL_INTERVAL);
+            }
+        };
+        
+        source.onmessage = function(event) {
+            const task = JSON.parse(event.data);
+            if (task.deleted) {
+                if (task.id.toString() in taskStates) {
+                    window.location.reload();
+                }
+                return;
+            }
+            applyTaskState(task);
+        };
+        
+        source.onerror = function() {
+            // Never connected: the server cannot stream, so poll instead.
+            // Otherwise the browser reconnects on its own.
+            if (!opened) {
+                source.close();
+                startPolling();
+            }
+        };
+    }
+    
+    // Pick up tasks added by "load more"
+    document.addEventListener('tasks:loaded', collectInitialTaskStates);
+    
+    // Tasks toggled on this page are already up to date
+    document.addEventListener('task:toggled', function(event) {
+        taskStates[event.detail.taskId] = event.detail.isActive;
+    });
+    
     // Start the process
     collectInitialTaskStates();
-    setInterval(checkForUpdates, POLL_INTERVAL);
-    checkForUpdates(); // Check immediately
+    startEventStream();
 });
\ No newline at end of file
@@ -45,16 +45,44 @@ function extractTaskText(button) {
     return tempDiv.textContent.trim();
 }
 
+// Clicks within this many milliseconds are sent together in one request
+const BATCH_DELAY = 150;
+let pendingToggles = [];
+let batchTimer = null;
+
 function toggleTaskStatus(form, taskText, listItem) {
-    const url = form.getAttribute('action');
-    const csrfToken = form.querySelector('input[name="csrfmiddlewaretoken"]').value;
+    pendingToggles.push({ form, taskText, listItem });
+    clearTimeout(batchTimer);
+    batchTimer = setTimeout(sendPendingToggles, BATCH_DELAY);
+}
+
+function sendPendingToggles() {
+    const toggles = pendingToggles;
+    pendingToggles = [];
+    batchTimer = null;
+    
+    // Cached task lists carry no token of their own; use the page's one
+    const csrfToken = document.querySelector('input[name="csrfmiddlewaretoken"]').value;
+    const operations = toggles.map(({ form, listItem }) => {
+        const operation = {
+            op: 'set',
+            id: Number(form.getAttribute('action').match(/toggle-task-status\/(\d+)/)[1]),
+            is_active: !listItem.classList.contains('task-item'),
+        };
+        // Send the version shown so a change made elsewhere is not overwritten
+        if (form.dataset.version) {
+            operation.version = Number(form.dataset.version);
+        }
+        return operation;
+    });
     
-    fetch(url, {
+    fetch(document.querySelector('.tasks-container').dataset.batchUrl, {
         method: 'POST',
         headers: {
             'X-CSRFToken': csrfToken,
-            'Content-Type': 'application/x-www-form-urlencoded',
+            'Content-Type': 'application/json',
         },
+        body: JSON.stringify({ operations: operations }),
         credentials: 'same-origin'
     })
     .then(response => {
@@ -64,25 +92,56 @@ function toggleTaskStatus(form, taskText, listItem) {
         return response.json();
     })
     .then(data => {
-        if (data.success) {
-            moveTask(listItem, taskText, url, csrfToken, data.is_active);
-            showNotification(data.message, 'success');
-        } else {
-            // Restore the item if there was an issue
-            listItem.style.opacity = '1';
-            listItem.querySelector('button').disabled = false;
-            showNotification('Could not update task status', 'error');
+        data.results.forEach((result, i) => applyToggleResult(toggles[i], result, csrfToken));
+        const updated = data.results.filter(result => result.ok);
+        if (updated.length === 1) {
+            showNotification(`Task marked as ${updated[0].is_active ? 'active' : 'completed'}.`, 'success');
+        } else if (updated.length > 1) {
+            showNotification(`${updated.length} tasks updated.`, 'success');
         }
     })
     .catch(error => {
         console.error('Error:', error);
-        listItem.style.opacity = '1';
-        listItem.querySelector('button').disabled = false;
+        toggles.forEach(({ listItem }) => restoreTask(listItem));
         showNotification('Error updating task status', 'error');
     });
 }
 
-function moveTask(listItem, taskText, url, csrfToken, isActive) {
+function applyToggleResult({ form, taskText, listItem }, result, csrfToken) {
+    const url = form.getAttribute('action');
+    const isShownActive = listItem.classList.contains('task-item');
+    if (result.ok) {
+        moveTask(listItem, taskText, url, csrfToken, result.is_active, result.version);
+    } else if (result.conflict) {
+        // Show the state the other writer left
+        if (result.is_active !== isShownActive) {
+            moveTask(listItem, taskText, url, csrfToken, result.is_active, result.version);
+        } else {
+            form.dataset.version = result.version;
+            restoreTask(listItem);
+        }
+        showNotification(result.error, 'error');
+    } else {
+        // Restore the item if there was an issue
+        restoreTask(listItem);
+        showNotification('Could not update task status', 'error');
+    }
+}
+
+function restoreTask(listItem) {
+    listItem.style.opacity = '1';
+    listItem.querySelector('button').disabled = false;
+}
+
+function moveTask(listItem, taskText, url, csrfToken, isActive, version) {
+    // Let the live updater know this change came from us
+    const match = url.match(/toggle-task-status\/(\d+)/);
+    if (match) {
+        document.dispatchEvent(new CustomEvent('task:toggled', {
+            detail: { taskId: match[1], isActive: isActive }
+        }));
+    }
+    
     // Apply animation to existing item
     listItem.style.transition = 'opacity 0.3s ease, transform 0.3s ease';
     listItem.style.opacity = '0';
@@ -96,7 +155,7 @@ function moveTask(listItem, taskText, url, csrfToken, isActive) {
     
     // Set HTML with clean task text
     newItem.innerHTML = `
-        <form method="post" action="${url}">
+        <form method="post" action="${url}" data-version="${version}">
             <input type="hidden" name="csrfmiddlewaretoken" value="${csrfToken}">
             <button type="submit" class="list-btn ${isActive ? 'active' : 'inactive'}">
                 ${taskText}
@@ -114,13 +173,9 @@ function moveTask(listItem, taskText, url, csrfToken, isActive) {
     setTimeout(() => {
         listItem.remove();
         
-        if (isActive) {
-            const activeList = document.querySelector('.task-list');
-            activeList.appendChild(newItem);
-        } else {
-            const inactiveList = document.querySelector('.task-list-horizontal');
-            inactiveList.appendChild(newItem);
-        }
+        // Keep any "load more" item last
+        const list = document.querySelector(isActive ? '.task-list' : '.task-list-horizontal');
+        list.insertBefore(newItem, list.querySelector(':scope > .load-more'));
         
         // Trigger reflow to ensure animation works
         newItem.offsetHeight;
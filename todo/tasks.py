@@ -1,8 +1,14 @@
+from django.conf import settings
 from django_q.tasks import schedule
 from django_q.models import Schedule
 from .utils import activate_scheduled_tasks
 
 def schedule_activate_scheduled_tasks():
+    if settings.TASK_SCHEDULER.get('mode', 'poll') == 'event':
+        # The event-driven engine activates tasks, so drop the minute poll
+        Schedule.objects.filter(name='Activate Scheduled Tasks').delete()
+        return
+
     if not Schedule.objects.filter(name='Activate Scheduled Tasks').exists():
         schedule(
             'todo.utils.activate_scheduled_tasks',
@@ -10,4 +16,41 @@ def schedule_activate_scheduled_tasks():
             schedule_type=Schedule.MINUTES,
             minutes=1,
             repeats=-1  # Infinite repeats
-        )
\ No newline at end of file
+        )
+
+def schedule_prune_deleted_tasks():
+    if not Schedule.objects.filter(name='Prune Deleted Tasks').exists():
+        schedule(
+            'todo.utils.prune_deleted_tasks',
+            name='Prune Deleted Tasks',
+            schedule_type=Schedule.DAILY,
+            repeats=-1  # Infinite repeats
+        )
+
+def schedule_prune_schedule_occurrences():
+    if not Schedule.objects.filter(name='Prune Schedule Occurrences').exists():
+        schedule(
+            'todo.utils.prune_schedule_occurrences',
+            name='Prune Schedule Occurrences',
+            schedule_type=Schedule.DAILY,
+            repeats=-1  # Infinite repeats
+        )
+
+def schedule_update_task_rollups():
+    if not Schedule.objects.filter(name='Update Task Rollups').exists():
+        schedule(
+            'todo.analytics.update_task_rollups',
+            name='Update Task Rollups',
+            schedule_type=Schedule.MINUTES,
+            minutes=settings.TASK_ANALYTICS.get('rollup_interval', 5),
+            repeats=-1  # Infinite repeats
+        )
+
+def schedule_prune_hourly_rollups():
+    if not Schedule.objects.filter(name='Prune Hourly Task Rollups').exists():
+        schedule(
+            'todo.analytics.prune_hourly_rollups',
+            name='Prune Hourly Task Rollups',
+            schedule_type=Schedule.DAILY,
+            repeats=-1  # Infinite repeats
+        )
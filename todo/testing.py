@@ -0,0 +1,110 @@
+"""
+Helpers for the query-budget regression tests.
+
+Every view is requested against desks of DESK_SIZES tasks. Its query count
+must be the same for every size and must not exceed the count recorded for
+it in query_budgets.json. Run the tests with UPDATE_QUERY_BUDGETS=1 to
+record new counts after an intentional change.
+"""
+import json
+import os
+from datetime import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from desks.models import Desk
+from .models import Category, Task, Schedule, ScheduleMoment, TaskCountChanges
+
+# Task counts of the seeded desks; query counts must not depend on them
+DESK_SIZES = (10, 1000, 10000)
+
+BUDGETS_PATH = settings.BASE_DIR / 'query_budgets.json'
+
+
+def seed_desk(user, name, task_count, category_count=5):
+    """Create a desk with categories, a schedule and task_count tasks in bulk"""
+    desk = Desk.objects.create(name=name, user=user)
+    categories = Category.objects.bulk_create([
+        Category(title=f"Category {i}", description='', desk=desk)
+        for i in range(category_count)
+    ])
+    schedule = Schedule.objects.create(title=f"{name} schedule", desk=desk)
+    ScheduleMoment.objects.create(schedule=schedule, day_of_week=0, time_of_day=time(9, 0))
+    Task.objects.bulk_create([
+        Task(
+            title=f"Task {i}",
+            description=f"Description {i}",
+            category=categories[i % category_count],
+            schedule=schedule if i % 2 else None,
+            is_active=i % 3 == 0,
+        )
+        for i in range(task_count)
+    ], batch_size=1000)
+    counts = TaskCountChanges()
+    for i in range(task_count):
+        counts.add_tasks(desk.pk, categories[i % category_count].pk, i % 3 == 0)
+    counts.apply()
+    return desk
+
+
+def clear_caches():
+    """Empty every configured cache so each request is measured cold"""
+    for alias in settings.CACHES:
+        caches[alias].clear()
+
+
+def load_budgets():
+    try:
+        with open(BUDGETS_PATH) as budgets_file:
+            return json.load(budgets_file)
+    except FileNotFoundError:
+        return {}
+
+
+def save_budget(name, count):
+    budgets = load_budgets()
+    budgets[name] = count
+    with open(BUDGETS_PATH, 'w') as budgets_file:
+        json.dump(budgets, budgets_file, indent=2, sort_keys=True)
+        budgets_file.write('\n')
+
+
+class QueryBudgetMixin:
+    """TestCase mixin asserting per-view query budgets"""
+
+    def assertQueryBudget(self, name, make_request, sizes=DESK_SIZES):
+        """
+        Call make_request(size) for every desk size with cold caches and
+        check the number of queries it runs.
+
+        Args:
+            name: Key of the budget in query_budgets.json
+            make_request: Callable issuing the request for a desk size
+            sizes: Desk sizes to measure
+        """
+        counts = {}
+        for size in sizes:
+            clear_caches()
+            with CaptureQueriesContext(connection) as queries:
+                make_request(size)
+            counts[size] = len(queries)
+
+        self.assertEqual(
+            len(set(counts.values())), 1,
+            f"{name}: query count grows with desk size {counts}"
+        )
+        count = counts[sizes[0]]
+
+        if os.environ.get('UPDATE_QUERY_BUDGETS'):
+            save_budget(name, count)
+            return
+
+        budget = load_budgets().get(name)
+        self.assertIsNotNone(
+            budget,
+            f"{name}: no query budget recorded, run with UPDATE_QUERY_BUDGETS=1"
+        )
+        self.assertLessEqual(count, budget, f"{name}: {count} queries, budget is {budget}")
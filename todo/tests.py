@@ -1,3 +1,1280 @@
-from django.test import TestCase
+import io
+import json
+import queue
+import re
+from datetime import time, timedelta
+from unittest import mock
+from urllib.parse import urlencode
 
-# Create your tests here.
+from asgiref.sync import async_to_sync, iscoroutinefunction
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from desks.models import Desk
+from project.metrics import registry
+from . import scheduler, search, views
+from .analytics import update_task_rollups
+from .models import (
+    Category, DailyTaskRollup, DeletedTask, HourlyTaskRollup, Task, TaskEvent, Schedule, ScheduleMoment,
+    ScheduleOccurrence, SchedulerRun, reconcile_task_counts,
+)
+from .pubsub import LocalPubSub, desk_channel, get_pubsub
+from .testing import DESK_SIZES, QueryBudgetMixin, clear_caches, seed_desk
+from .utils import activate_scheduled_tasks, activate_tasks, claim_due_moments
+
+
+class TodoQueryBudgetTests(QueryBudgetMixin, TestCase):
+    """Every todo URL runs the same, budgeted number of queries for any desk size"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('owner', password='password')
+        cls.desks = {
+            size: seed_desk(cls.user, f"Desk {size}", size)
+            for size in DESK_SIZES
+        }
+        cls.tasks = {
+            size: Task.objects.filter(category__desk=desk).order_by('id').first()
+            for size, desk in cls.desks.items()
+        }
+        cls.categories = {
+            size: Category.objects.filter(desk=desk).order_by('id').first()
+            for size, desk in cls.desks.items()
+        }
+        cls.schedules = {
+            size: Schedule.objects.get(desk=desk)
+            for size, desk in cls.desks.items()
+        }
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def desk_url(self, name, size, **kwargs):
+        return reverse(name, kwargs={'desk_slug': self.desks[size].slug, **kwargs})
+
+    def test_home(self):
+        self.assertQueryBudget('home', lambda size: self.client.get(reverse('home')))
+
+    def test_tasks_list(self):
+        def request(size):
+            response = self.client.get(self.desk_url('tasks_list', size))
+            self.assertEqual(response.status_code, 200)
+        self.assertQueryBudget('tasks_list', request)
+
+    def test_tasks_list_page(self):
+        def request(size):
+            response = self.client.get(
+                self.desk_url('tasks_list', size), {'state': 'inactive', 'after': self.tasks[size].id}
+            )
+            self.assertEqual(response.status_code, 200)
+        self.assertQueryBudget('tasks_list_page', request)
+
+    def test_tasks_list_not_modified(self):
+        def request(size):
+            url = self.desk_url('tasks_list', size)
+            etag = self.client.get(url)['ETag']
+            with self.assertNumQueries(3):
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 304)
+        for size in DESK_SIZES:
+            request(size)
+
+    def test_tasks_manage(self):
+        def request(size):
+            response = self.client.get(self.desk_url('tasks_manage', size))
+            self.assertEqual(response.status_code, 200)
+        self.assertQueryBudget('tasks_manage', request)
+
+    def test_tasks_manage_page(self):
+        def request(size):
+            response = self.client.get(self.desk_url('tasks_manage', size), {'after': self.tasks[size].id})
+            self.assertEqual(response.status_code, 200)
+        self.assertQueryBudget('tasks_manage_page', request)
+
+    def test_tasks_manage_create_task(self):
+        def request(size):
+            response = self.client.post(self.desk_url('tasks_manage', size), {
+                'title': 'New task',
+                'description': 'Created by the budget test',
+                'category': self.categories[size].id,
+            })
+            self.assertEqual(response.status_code, 302)
+        self.assertQueryBudget('tasks_manage_create_task', request)
+
+    def test_tasks_add(self):
+        def request(size):
+            response = self.client.post(self.desk_url('tasks_add', size), {
+                'title': 'Added task',
+                'description': 'Created by the budget test',
+                'category': self.categories[size].id,
+            })
+            self.assertEqual(response.status_code, 302)
+        self.assertQueryBudget('tasks_add', request)
+
+    def test_tasks_delete(self):
+        def request(size):
+            response = self.client.post(self.desk_url('tasks_delete', size, task_id=self.tasks[size].id))
+            self.assertEqual(response.status_code, 302)
+        self.assertQueryBudget('tasks_delete', request)
+
+    def test_tasks_toggle(self):
+        def request(size):
+            response = self.client.post(self.desk_url('tasks_toggle', size, task_id=self.tasks[size].id))
+            self.assertEqual(response.status_code, 200)
+        self.assertQueryBudget('tasks_toggle', request)
+
+    def test_tasks_batch(self):
+        def request(size):
+            tasks = Task.objects.filter(category__desk=self.desks[size]).order_by('id')[1:4]
+            operations = [{'op': 'set', 'id': task.id, 'is_active': True} for task in tasks]
+            operations.append({'op': 'move', 'id': tasks[0].id, 'category': self.categories[size].id})
+            operations.append({'op': 'delete', 'id': tasks[1].id})
+            response = self.client.post(
+                self.desk_url('tasks_batch', size),
+                json.dumps({'operations': operations}),
+                content_type='application/json'
+            )
+            self.assertTrue(response.json()['success'])
+        self.assertQueryBudget('tasks_batch', request)
+
+    def test_tasks_search(self):
+        def request(size):
+            response = self.client.get(reverse('tasks_search'), {'q': f"Task {size - 1}"})
+            self.assertTrue(response.json()['results'])
+        self.assertQueryBudget('tasks_search', request)
+
+    def test_tasks_status(self):
+        def request(size):
+            response = self.client.get(self.desk_url('tasks_status', size))
+            self.assertEqual(response.json()['count'], min(size, settings.TASK_PAGE_SIZE))
+        self.assertQueryBudget('tasks_status', request)
+
+    def test_tasks_status_page(self):
+        def request(size):
+            response = self.client.get(self.desk_url('tasks_status', size), {'after': self.tasks[size].id})
+            self.assertEqual(response.json()['count'], min(size - 1, settings.TASK_PAGE_SIZE))
+        self.assertQueryBudget('tasks_status_page', request)
+
+    def test_tasks_status_delta(self):
+        since = (timezone.now() - timedelta(minutes=5)).isoformat()
+
+        def request(size):
+            response = self.client.get(self.desk_url('tasks_status', size), {'since': since})
+            self.assertFalse(response.json()['full'])
+        self.assertQueryBudget('tasks_status_delta', request)
+
+    def test_tasks_events(self):
+        def request(size):
+            response = async_to_sync(self.async_client.get)(self.desk_url('tasks_events', size))
+            self.assertEqual(response['Content-Type'], 'text/event-stream')
+        self.async_client.force_login(self.user)
+        self.assertQueryBudget('tasks_events', request)
+
+    def test_tasks_import(self):
+        def request(size):
+            rows = '\n'.join(f"Imported {i},,Category {i % 2},Desk {size} schedule" for i in range(20))
+            response = self.client.post(
+                self.desk_url('tasks_import', size),
+                'title,description,category,schedule\n' + rows,
+                content_type='text/csv'
+            )
+            self.assertEqual(response.json()['created'], 20)
+        self.assertQueryBudget('tasks_import', request)
+
+    def test_desk_export(self):
+        def request(size):
+            response = self.client.get(self.desk_url('desk_export', size))
+            lines = b''.join(response.streaming_content).splitlines()
+            self.assertEqual(sum(b'"type": "task"' in line for line in lines), size)
+        self.assertQueryBudget('desk_export', request)
+
+    def test_desk_export_csv(self):
+        def request(size):
+            response = self.client.get(self.desk_url('desk_export', size), {'format': 'csv'})
+            self.assertEqual(len(b''.join(response.streaming_content).splitlines()), size + 1)
+        self.assertQueryBudget('desk_export_csv', request)
+
+    def test_desk_stats(self):
+        def request(size):
+            response = self.client.get(self.desk_url('desk_stats', size))
+            self.assertEqual(len(response.json()['days']), 30)
+        self.assertQueryBudget('desk_stats', request)
+
+    def test_schedule_delete(self):
+        def request(size):
+            response = self.client.post(
+                self.desk_url('schedule_delete', size, schedule_id=self.schedules[size].id),
+                HTTP_REFERER=self.desk_url('tasks_manage', size)
+            )
+            self.assertEqual(response.status_code, 302)
+        self.assertQueryBudget('schedule_delete', request)
+
+    def test_schedule_edit(self):
+        def request(size):
+            schedule = self.schedules[size]
+            moment = schedule.moments.get()
+            response = self.client.post(
+                self.desk_url('schedule_edit', size, schedule_id=schedule.id),
+                {
+                    'title': 'Renamed schedule',
+                    'moments_count': 2,
+                    'moment_id_0': moment.id,
+                    'day_of_week_0': 1,
+                    'time_of_day_0': '10:00',
+                    'day_of_week_1': 2,
+                    'time_of_day_1': '11:00',
+                },
+                HTTP_REFERER=self.desk_url('tasks_manage', size)
+            )
+            self.assertEqual(response.status_code, 302)
+        self.assertQueryBudget('schedule_edit', request)
+
+    def test_categories_manage(self):
+        def request(size):
+            response = self.client.get(self.desk_url('categories_manage', size))
+            self.assertEqual(response.status_code, 200)
+        self.assertQueryBudget('categories_manage', request)
+
+    def test_categories_add(self):
+        def request(size):
+            response = self.client.post(self.desk_url('categories_add', size), {
+                'title': 'New category',
+                'description': 'Created by the budget test',
+            })
+            self.assertEqual(response.status_code, 302)
+        self.assertQueryBudget('categories_add', request)
+
+    def test_categories_delete(self):
+        def request(size):
+            response = self.client.post(
+                self.desk_url('categories_delete', size, category_id=self.categories[size].id)
+            )
+            self.assertEqual(response.status_code, 302)
+        self.assertQueryBudget('categories_delete', request)
+
+    def test_user_profile(self):
+        def request(size):
+            response = self.client.get(reverse('user_profile'))
+            self.assertEqual(response.status_code, 200)
+        self.assertQueryBudget('user_profile', request)
+
+
+class AsyncViewTests(TestCase):
+    """The status and toggle views run natively async under the async client"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('owner', password='password')
+        cls.stranger = User.objects.create_user('stranger', password='password')
+        cls.desk = seed_desk(cls.user, 'Async', 5)
+        cls.task = Task.objects.filter(category__desk=cls.desk, is_active=False).first()
+
+    def setUp(self):
+        clear_caches()
+
+    def test_views_are_coroutines(self):
+        self.assertTrue(iscoroutinefunction(views.get_tasks_status))
+        self.assertTrue(iscoroutinefunction(views.toggle_task_status_manual))
+
+    async def test_status_and_not_modified(self):
+        await self.async_client.aforce_login(self.user)
+        url = reverse('tasks_status', kwargs={'desk_slug': self.desk.slug})
+        response = await self.async_client.get(url)
+        self.assertEqual(response.json()['count'], 5)
+
+        since = response.json()['cursor']
+        first = await self.async_client.get(url, {'since': since})
+        second = await self.async_client.get(url, {'since': since}, headers={'If-None-Match': first['ETag']})
+        self.assertEqual(second.status_code, 304)
+
+    async def test_toggle(self):
+        await self.async_client.aforce_login(self.user)
+        url = reverse('tasks_toggle', kwargs={'desk_slug': self.desk.slug, 'task_id': self.task.id})
+        response = await self.async_client.post(url)
+        self.assertEqual(response.json()['is_active'], True)
+        self.assertTrue((await Task.objects.aget(id=self.task.id)).is_active)
+
+    async def test_requires_access(self):
+        url = reverse('tasks_status', kwargs={'desk_slug': self.desk.slug})
+        response = await self.async_client.get(url)
+        self.assertEqual(response.status_code, 302)
+
+        await self.async_client.aforce_login(self.stranger)
+        response = await self.async_client.get(url)
+        self.assertEqual(response.status_code, 404)
+
+
+class TaskEventStreamTests(TestCase):
+    """Task changes reach event stream subscribers under both WSGI and ASGI"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('owner', password='password')
+        cls.desk = seed_desk(cls.user, 'Streamed', 5)
+        cls.task = Task.objects.filter(category__desk=cls.desk, is_active=False).first()
+        cls.url = reverse('tasks_events', kwargs={'desk_slug': cls.desk.slug})
+
+    def setUp(self):
+        clear_caches()
+
+    def test_sync_client_reads_first_event(self):
+        self.client.force_login(self.user)
+        response = self.client.get(self.url)
+        stream = iter(response.streaming_content)
+        self.assertEqual(next(stream), b'retry: 5000\n\n')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('tasks_toggle', kwargs={'desk_slug': self.desk.slug, 'task_id': self.task.id}))
+        event = json.loads(next(stream).decode().removeprefix('data: '))
+        self.assertEqual((event['id'], event['is_active']), (self.task.id, True))
+        response.close()
+        self.assertEqual(get_pubsub().subscriber_count(desk_channel(self.desk.id)), 0)
+
+    @override_settings(TASK_EVENTS={'backend': 'todo.pubsub.LocalPubSub', 'heartbeat': 0.01, 'sync_timeout': 0.05})
+    def test_sync_stream_ends_after_timeout(self):
+        self.client.force_login(self.user)
+        chunks = list(self.client.get(self.url).streaming_content)
+        self.assertEqual(chunks[0], b'retry: 5000\n\n')
+        self.assertTrue(set(chunks[1:]) <= {b': keep-alive\n\n'})
+
+    @override_settings(TASK_EVENTS={'backend': 'todo.pubsub.LocalPubSub', 'sync_timeout': 0})
+    def test_sync_streams_can_be_disabled(self):
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get(self.url).status_code, 204)
+
+    def test_activation_in_another_process_reaches_page_by_polling(self):
+        self.client.force_login(self.user)
+        page = self.client.get(reverse('tasks_list', kwargs={'desk_slug': self.desk.slug}))
+        self.assertContains(page, 'data-stream-poll-interval="5"')
+        status_url = reverse('tasks_status', kwargs={'desk_slug': self.desk.slug})
+        cursor = self.client.get(status_url).json()['cursor']
+        subscription = get_pubsub().subscribe(desk_channel(self.desk.id), blocking=True)
+        self.addCleanup(subscription.close)
+
+        # The qcluster process publishes to a LocalPubSub of its own
+        moment_ids = list(ScheduleMoment.objects.filter(schedule__desk=self.desk).values_list('id', flat=True))
+        with mock.patch('todo.pubsub.get_pubsub', return_value=LocalPubSub()), \
+                self.captureOnCommitCallbacks(execute=True):
+            activated = activate_scheduled_tasks(moment_ids=moment_ids)
+        self.assertTrue(activated)
+        with self.assertRaises(queue.Empty):
+            subscription.get(timeout=0)
+
+        # The page's catch-up poll picks the activations up
+        changed = self.client.get(status_url, {'since': cursor}).json()
+        self.assertLessEqual(set(activated), {task['id'] for task in changed['tasks'] if task['is_active']})
+
+    async def test_async_client_reads_first_event(self):
+        await self.async_client.aforce_login(self.user)
+        response = await self.async_client.get(self.url)
+        stream = response.streaming_content
+        self.assertEqual(await anext(stream), b'retry: 5000\n\n')
+        get_pubsub().publish(desk_channel(self.desk.id), {'id': self.task.id, 'is_active': True})
+        event = json.loads((await anext(stream)).decode().removeprefix('data: '))
+        self.assertEqual((event['id'], event['is_active']), (self.task.id, True))
+        await stream.aclose()
+
+
+class TaskToggleTests(TestCase):
+    """Toggling is one conditional UPDATE that bumps the task's version"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('owner', password='password')
+        cls.desk = seed_desk(cls.user, 'Toggle', 3)
+        cls.other = seed_desk(cls.user, 'Other', 1)
+        cls.task = Task.objects.filter(category__desk=cls.desk, is_active=False).first()
+
+    def setUp(self):
+        self.client.force_login(self.user)
+        self.url = reverse('tasks_toggle', kwargs={'desk_slug': self.desk.slug, 'task_id': self.task.id})
+
+    def test_toggle_bumps_version(self):
+        data = self.client.post(self.url).json()
+        self.assertEqual((data['is_active'], data['version']), (True, 1))
+        data = self.client.post(self.url, {'version': 1}).json()
+        self.assertEqual((data['is_active'], data['version']), (False, 2))
+        self.task.refresh_from_db()
+        self.assertEqual((self.task.is_active, self.task.version), (False, 2))
+
+    def test_set_state(self):
+        for _ in range(2):
+            self.assertTrue(self.client.post(self.url, {'is_active': '1'}).json()['is_active'])
+        self.assertFalse(self.client.post(self.url, {'is_active': '0'}).json()['is_active'])
+
+    def test_stale_version_conflicts(self):
+        self.client.post(self.url)
+        response = self.client.post(self.url, {'version': 0})
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual((response.json()['is_active'], response.json()['version']), (True, 1))
+        self.task.refresh_from_db()
+        self.assertEqual((self.task.is_active, self.task.version), (True, 1))
+
+    def test_task_of_other_desk_not_found(self):
+        task = Task.objects.filter(category__desk=self.other).get()
+        url = reverse('tasks_toggle', kwargs={'desk_slug': self.desk.slug, 'task_id': task.id})
+        self.assertEqual(self.client.post(url).status_code, 404)
+
+    def test_scheduler_bumps_version(self):
+        moment = ScheduleMoment.objects.get(schedule__desk=self.desk)
+        activate_scheduled_tasks(moment_ids=[moment.id])
+        self.task.refresh_from_db()
+        self.assertEqual((self.task.is_active, self.task.version), (True, 1))
+
+
+class TaskBatchTests(TestCase):
+    """The batch endpoint applies many operations in one request"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('owner', password='password')
+        cls.desk = seed_desk(cls.user, 'Batch', 6)
+        cls.other = seed_desk(cls.user, 'Other', 1)
+        cls.tasks = list(Task.objects.filter(category__desk=cls.desk).order_by('id'))
+        cls.categories = list(Category.objects.filter(desk=cls.desk).order_by('id'))
+
+    def setUp(self):
+        self.client.force_login(self.user)
+        self.url = reverse('tasks_batch', kwargs={'desk_slug': self.desk.slug})
+
+    def post(self, operations):
+        return self.client.post(self.url, json.dumps({'operations': operations}), content_type='application/json')
+
+    def test_applies_operations_in_order(self):
+        first, second, third = self.tasks[:3]
+        response = self.post([
+            {'op': 'set', 'id': first.id, 'is_active': False},
+            {'op': 'set', 'id': second.id, 'is_active': True, 'version': 0},
+            {'op': 'move', 'id': second.id, 'category': self.categories[4].id},
+            {'op': 'delete', 'id': third.id},
+        ])
+        data = response.json()
+        self.assertTrue(data['success'])
+        self.assertEqual([result['version'] for result in data['results'][:3]], [1, 1, 2])
+
+        second.refresh_from_db()
+        self.assertEqual((second.is_active, second.category_id, second.version), (True, self.categories[4].id, 2))
+        self.assertFalse(Task.objects.filter(id=third.id).exists())
+        self.assertTrue(DeletedTask.objects.filter(task_id=third.id, desk_id=self.desk.id).exists())
+
+    def test_reports_failed_operations(self):
+        foreign = Task.objects.get(category__desk=self.other)
+        foreign_category = Category.objects.filter(desk=self.other).first()
+        task = self.tasks[0]
+        data = self.post([
+            {'op': 'set', 'id': foreign.id, 'is_active': True},
+            {'op': 'move', 'id': task.id, 'category': foreign_category.id},
+            {'op': 'set', 'id': task.id, 'is_active': 'yes'},
+            {'op': 'rename', 'id': task.id},
+            {'op': 'set', 'id': task.id, 'is_active': False, 'version': 5},
+            {'op': 'set', 'id': task.id, 'is_active': False},
+        ]).json()
+        self.assertFalse(data['success'])
+        self.assertEqual([result['ok'] for result in data['results']], [False] * 5 + [True])
+        self.assertTrue(data['results'][4]['conflict'])
+        self.assertEqual(Task.objects.get(id=foreign.id).is_active, foreign.is_active)
+        self.assertEqual(Task.objects.get(id=task.id).category_id, task.category_id)
+
+    def test_rejects_malformed_body(self):
+        self.assertEqual(self.client.post(self.url, 'nope', content_type='application/json').status_code, 400)
+        self.assertEqual(self.post({'op': 'delete'}).status_code, 400)
+
+
+class TaskCounterTests(TestCase):
+    """Stored task counters follow every kind of task write"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('owner', password='password')
+        # 6 tasks, 2 active, spread over 5 categories
+        cls.desk = seed_desk(cls.user, 'Counted', 6)
+        cls.categories = list(Category.objects.filter(desk=cls.desk).order_by('id'))
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def assertCounts(self, total, active, category=None):
+        obj = Category.objects.get(pk=category.pk) if category else Desk.objects.get(pk=self.desk.pk)
+        self.assertEqual((obj.task_count, obj.active_task_count), (total, active))
+
+    def test_seeded_counts(self):
+        self.assertCounts(6, 2)
+        self.assertCounts(2, 1, self.categories[0])
+        self.assertEqual(reconcile_task_counts(), (0, 0))
+
+    def test_save_and_delete(self):
+        task = Task.objects.create(title='New', description='', category=self.categories[1], is_active=True)
+        self.assertCounts(7, 3)
+        task = Task.objects.get(pk=task.pk)
+        task.category = self.categories[2]
+        task.is_active = False
+        task.save()
+        self.assertCounts(7, 2)
+        self.assertCounts(2, 0, self.categories[2])
+        task.delete()
+        Task.objects.filter(category=self.categories[0]).delete()
+        self.assertCounts(4, 1)
+        self.assertCounts(0, 0, self.categories[0])
+
+    def test_toggle_and_batch(self):
+        task = Task.objects.filter(category=self.categories[1]).get()
+        url = reverse('tasks_toggle', kwargs={'desk_slug': self.desk.slug, 'task_id': task.id})
+        self.client.post(url)
+        self.assertCounts(6, 3)
+        # Setting the current state writes nothing
+        self.assertEqual(self.client.post(url, {'is_active': '1'}).json()['version'], 1)
+        self.assertCounts(6, 3)
+
+        self.client.post(
+            reverse('tasks_batch', kwargs={'desk_slug': self.desk.slug}),
+            json.dumps({'operations': [
+                {'op': 'move', 'id': task.id, 'category': self.categories[4].id},
+                {'op': 'set', 'id': task.id, 'is_active': False},
+                {'op': 'delete', 'id': Task.objects.filter(category=self.categories[3]).get().id},
+            ]}),
+            content_type='application/json'
+        )
+        self.assertCounts(5, 1)
+        self.assertCounts(2, 0, self.categories[4])
+        self.assertCounts(0, 0, self.categories[3])
+
+    def test_scheduler_and_category_delete(self):
+        activate_scheduled_tasks(moment_ids=list(ScheduleMoment.objects.filter(
+            schedule__desk=self.desk
+        ).values_list('id', flat=True)))
+        active = Task.objects.filter(category__desk=self.desk, is_active=True).count()
+        self.assertCounts(6, active)
+        self.categories[0].delete()
+        self.assertCounts(4, Task.objects.filter(category__desk=self.desk, is_active=True).count())
+
+    def test_reconcile_command(self):
+        Category.objects.filter(pk=self.categories[0].pk).update(task_count=40)
+        Desk.objects.filter(pk=self.desk.pk).update(active_task_count=0)
+        out = io.StringIO()
+        call_command('reconcile_counters', self.desk.slug, '--dry-run', stdout=out)
+        self.assertIn('Found drifted counters on 1 categories and 1 desks', out.getvalue())
+        self.assertCounts(40, 1, self.categories[0])
+        call_command('reconcile_counters', stdout=out)
+        self.assertCounts(2, 1, self.categories[0])
+        self.assertCounts(6, 2)
+
+
+class TaskAnalyticsTests(TestCase):
+    """State changes are logged and folded into the rollups the stats endpoint reads"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('owner', password='password')
+        cls.desk = seed_desk(cls.user, 'Analysed', 10)
+        cls.moment = Schedule.objects.get(desk=cls.desk).moments.get()
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def fold(self):
+        # Past the settle delay of the events just logged
+        return update_task_rollups(now=timezone.now() + timedelta(minutes=5))
+
+    def totals(self, model=DailyTaskRollup):
+        rows = model.objects.filter(desk_id=self.desk.pk)
+        return {field: sum(getattr(row, field) for row in rows) for field in ('scheduled', 'completed', 'on_time', 'late')}
+
+    def test_logs_state_changes(self):
+        task = Task.objects.create(title='New', description='', category=Category.objects.filter(desk=self.desk).first())
+        task.is_active = True
+        task.save()
+        self.client.post(reverse('tasks_toggle', kwargs={'desk_slug': self.desk.slug, 'task_id': task.id}))
+        activated = activate_scheduled_tasks(moment_ids=[self.moment.id])
+        self.assertEqual(
+            list(TaskEvent.objects.filter(task_id=task.id).values_list('kind', flat=True)),
+            [TaskEvent.ACTIVATED, TaskEvent.COMPLETED]
+        )
+        self.assertEqual(TaskEvent.objects.filter(kind=TaskEvent.SCHEDULED).count(), len(activated))
+
+    def test_folds_events_incrementally(self):
+        activated = activate_scheduled_tasks(moment_ids=[self.moment.id])
+        self.assertEqual(self.fold(), len(activated))
+        self.assertEqual(self.fold(), 0)
+        self.assertEqual(self.totals(), {'scheduled': len(activated), 'completed': 0, 'on_time': 0, 'late': 0})
+
+        # Paired with activations folded by the earlier run
+        self.client.post(
+            reverse('tasks_batch', kwargs={'desk_slug': self.desk.slug}),
+            json.dumps({'operations': [{'op': 'set', 'id': task_id, 'is_active': False} for task_id in activated[:2]]}),
+            content_type='application/json'
+        )
+        self.assertEqual(self.fold(), 2)
+        self.assertEqual(self.totals(), {'scheduled': len(activated), 'completed': 2, 'on_time': 2, 'late': 0})
+        self.assertEqual(self.totals(HourlyTaskRollup), self.totals())
+
+    def test_late_completion_counts_towards_due_day(self):
+        category = Category.objects.filter(desk=self.desk).first()
+        due_at = timezone.now() - timedelta(days=3)
+        for kind, at in ((TaskEvent.SCHEDULED, due_at), (TaskEvent.COMPLETED, due_at + timedelta(days=2))):
+            TaskEvent.objects.create(task_id=1, desk_id=self.desk.pk, category_id=category.pk, kind=kind, at=at)
+        self.fold()
+        due_day = DailyTaskRollup.objects.get(day=timezone.localdate(due_at))
+        self.assertEqual((due_day.scheduled, due_day.late, due_day.completion_seconds), (1, 1, 2 * 86400))
+        self.assertEqual(DailyTaskRollup.objects.get(day=timezone.localdate(due_at + timedelta(days=2))).completed, 1)
+
+    def test_stats_endpoint(self):
+        activated = activate_scheduled_tasks(moment_ids=[self.moment.id])
+        self.client.post(reverse('tasks_toggle', kwargs={'desk_slug': self.desk.slug, 'task_id': activated[0]}))
+        self.fold()
+
+        url = reverse('desk_stats', kwargs={'desk_slug': self.desk.slug})
+        stats = self.client.get(url, {'days': 7, 'hours': 3}).json()
+        self.assertEqual((len(stats['days']), len(stats['hours'])), (7, 3))
+        self.assertEqual(stats['days'][-1]['date'], timezone.localdate().isoformat())
+        self.assertEqual(stats['totals']['scheduled'], len(activated))
+        self.assertEqual(stats['totals']['on_time'], 1)
+        self.assertEqual(stats['totals']['on_time_rate'], round(1 / len(activated), 4))
+        self.assertEqual(
+            {category['title'] for category in stats['categories']},
+            set(Category.objects.filter(tasks__id__in=activated).values_list('title', flat=True))
+        )
+        self.assertEqual(self.client.get(url, {'days': 0}).status_code, 400)
+        self.assertEqual(self.client.get(url, {'hours': 'x'}).status_code, 400)
+
+
+class TaskSearchTests(TestCase):
+    """Search ranks matching tasks from every desk the user can open"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('owner', password='password')
+        cls.stranger = User.objects.create_user('stranger', password='password')
+        cls.desk = seed_desk(cls.user, 'Home', 0)
+        cls.shared = seed_desk(cls.stranger, 'Shared', 0)
+        cls.shared.share_with_user(cls.user)
+        cls.private = seed_desk(cls.stranger, 'Private', 0)
+        cls.category = Category.objects.filter(desk=cls.desk).first()
+        Category.objects.filter(id=cls.category.id).update(title='Household')
+        cls.milk = Task.objects.create(title='Buy milk', description='At the corner shop', category=cls.category)
+        cls.note = Task.objects.create(title='Groceries', description='Bread and milk', category=cls.category)
+        cls.shared_milk = Task.objects.create(
+            title='Milk the goats', description='', category=Category.objects.filter(desk=cls.shared).first()
+        )
+        Task.objects.create(title='Buy milk', description='', category=Category.objects.filter(desk=cls.private).first())
+
+    def setUp(self):
+        self.client.force_login(self.user)
+        self.url = reverse('tasks_search')
+
+    def search(self, query, **params):
+        return self.client.get(self.url, {'q': query, **params}).json()
+
+    def ids(self, query):
+        return [result['id'] for result in self.search(query)['results']]
+
+    def test_ranks_results_across_accessible_desks(self):
+        data = self.search('milk')
+        self.assertEqual(
+            [result['id'] for result in data['results']],
+            [self.shared_milk.id, self.milk.id, self.note.id]
+        )
+        self.assertEqual(data['results'][0]['url'], reverse('tasks_list', kwargs={'desk_slug': self.shared.slug}))
+        self.assertEqual(data['results'][1]['desk'], 'Home')
+
+    def test_matches_every_word_and_prefixes(self):
+        self.assertEqual(self.ids('buy mil'), [self.milk.id])
+        self.assertEqual(self.ids('corner'), [self.milk.id])
+        self.assertEqual(set(self.ids('household')), {self.milk.id, self.note.id})
+        # FTS5 syntax in the query is treated as plain words
+        self.assertEqual(self.ids('"milk" OR NOT ('), [])
+
+    def test_index_follows_writes(self):
+        self.milk.title = 'Buy oat drink'
+        self.milk.save()
+        Category.objects.filter(id=self.category.id).update(title='Errands')
+        self.note.delete()
+        self.assertEqual(self.ids('milk'), [self.shared_milk.id])
+        self.assertEqual(self.ids('oat'), [self.milk.id])
+        self.assertEqual(self.ids('errands'), [self.milk.id])
+
+    def test_pages_results(self):
+        with override_settings(TASK_SEARCH_PAGE_SIZE=2):
+            first = self.search('milk')
+            second = self.client.get(first['next']).json()
+        self.assertEqual(len(first['results']), 2)
+        self.assertEqual([result['id'] for result in second['results']], [self.note.id])
+        self.assertIsNone(second['next'])
+        self.assertEqual(self.client.get(self.url, {'q': 'milk', 'page': 'x'}).status_code, 400)
+
+    def test_fallback_without_index(self):
+        with mock.patch('todo.search._uses_index', return_value=False):
+            self.assertEqual(self.ids('buy mil'), [self.milk.id])
+            self.assertEqual(self.ids('milk'), [self.shared_milk.id, self.milk.id, self.note.id])
+
+    @override_settings(TASK_SEARCH_PAGE_SIZE=1)
+    def test_best_matches_survive_the_cap(self):
+        # More newer description matches than the pages can hold
+        Task.objects.bulk_create([
+            Task(title=f'Note {number}', description='Milk again', category=self.category)
+            for number in range(search.MAX_SEARCH_PAGE)
+        ])
+        for uses_index in (True, False):
+            with self.subTest(uses_index=uses_index), \
+                    mock.patch('todo.search._uses_index', return_value=uses_index):
+                self.assertEqual(self.ids('milk'), [self.shared_milk.id])
+                self.assertEqual([row['id'] for row in self.search('milk', page=2)['results']], [self.milk.id])
+                self.assertIsNone(self.search('milk', page=search.MAX_SEARCH_PAGE)['next'])
+
+
+@override_settings(REQUEST_METRICS={'enabled': True})
+class RequestMetricsTests(TestCase):
+    """The metrics middleware records each view and serves the histograms to staff"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('owner', password='password')
+        cls.staff = User.objects.create_user('staff', password='password', is_staff=True)
+        cls.desk = seed_desk(cls.user, 'Metrics desk', 10)
+
+    def setUp(self):
+        registry.reset()
+
+    def test_records_view_metrics(self):
+        self.client.force_login(self.user)
+        self.client.get(reverse('tasks_list', kwargs={'desk_slug': self.desk.slug}))
+
+        self.client.force_login(self.staff)
+        metrics = self.client.get(reverse('metrics'), {'format': 'json'}).json()
+        tasks_list = metrics['tasks_list']
+        self.assertEqual(tasks_list['request_duration_seconds']['count'], 1)
+        self.assertGreater(tasks_list['request_queries']['sum'], 0)
+        self.assertGreater(tasks_list['request_sql_seconds']['sum'], 0)
+        self.assertGreater(tasks_list['request_template_seconds']['sum'], 0)
+
+    def test_prometheus_format(self):
+        self.client.force_login(self.staff)
+        self.client.get(reverse('user_profile'))
+        response = self.client.get(reverse('metrics'))
+        self.assertEqual(response['Content-Type'], 'text/plain; version=0.0.4; charset=utf-8')
+        content = response.content.decode()
+        self.assertIn('# TYPE request_duration_seconds histogram', content)
+        self.assertIn('request_queries_count{view="user_profile"} 1', content)
+        self.assertIn('request_queries_bucket{view="user_profile",le="+Inf"} 1', content)
+
+    def test_staff_only(self):
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('metrics'))
+        self.assertEqual(response.status_code, 302)
+
+
+class DeskGenerationTests(TestCase):
+    """Desk writes retire the ETag and the cached task fragments of the desk page"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('owner', password='password')
+        cls.desk = seed_desk(cls.user, 'Cached', 4)
+        cls.task, cls.other = Task.objects.filter(category__desk=cls.desk).order_by('id')[:2]
+        cls.category = cls.other.category
+        cls.schedule = Schedule.objects.get(desk=cls.desk)
+
+    def setUp(self):
+        # Rendered fragments are keyed by desk ID, which other tests reuse
+        clear_caches()
+        self.client.force_login(self.user)
+        self.url = reverse('tasks_list', kwargs={'desk_slug': self.desk.slug})
+
+    def assertChangeRefreshes(self, change, title):
+        etag = self.client.get(self.url)['ETag']
+        # A queryset update moves no generation, so the page stays cached
+        Task.objects.filter(id=self.task.id).update(title=title)
+        self.assertNotContains(self.client.get(self.url), title)
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        change()
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertContains(response, title)
+
+    def test_task_save(self):
+        self.other.description = 'Edited'
+        self.assertChangeRefreshes(self.other.save, 'After task save')
+
+    def test_task_toggle(self):
+        url = reverse('tasks_toggle', kwargs={'desk_slug': self.desk.slug, 'task_id': self.other.id})
+        self.assertChangeRefreshes(lambda: self.client.post(url), 'After toggle')
+
+    def test_category_save(self):
+        self.category.title = 'Renamed'
+        self.assertChangeRefreshes(self.category.save, 'After category save')
+
+    def test_schedule_save(self):
+        self.schedule.title = 'Renamed'
+        self.assertChangeRefreshes(self.schedule.save, 'After schedule save')
+
+    def test_schedule_moment_create(self):
+        self.assertChangeRefreshes(
+            lambda: ScheduleMoment.objects.create(schedule=self.schedule, day_of_week=2, time_of_day=time(7, 0)),
+            'After moment create'
+        )
+
+    def test_new_login_retires_etag(self):
+        # The cached page would carry the CSRF token of the previous login
+        credentials = {'username': 'owner', 'password': 'password'}
+        self.client.post(reverse('login'), credentials)
+        response = self.client.get(self.url)
+        self.assertContains(response, 'csrfmiddlewaretoken')
+        self.client.post(reverse('login'), credentials)
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 200)
+
+    def test_csrf_cookie_change_retires_etag(self):
+        etag = self.client.get(self.url)['ETag']
+        self.client.cookies[settings.CSRF_COOKIE_NAME] = 'x' * 32
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+
+@override_settings(TASK_PAGE_SIZE=4)
+class TaskPaginationTests(TestCase):
+    """Task lists are served in keyset pages that together cover every task once"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('owner', password='password')
+        cls.desk = seed_desk(cls.user, 'Paged', 10)
+        cls.tasks = Task.objects.filter(category__desk=cls.desk)
+
+    def setUp(self):
+        # Rendered fragments are keyed by desk ID, which other tests reuse
+        clear_caches()
+        self.client.force_login(self.user)
+
+    def follow_pages(self, url, params, item):
+        """Collect the task IDs of every page by following the "load more" URLs"""
+        ids = []
+        response = self.client.get(url, params)
+        while True:
+            page = response.content.decode()
+            ids += [int(task_id) for task_id in re.findall(item, page)]
+            next_url = re.search(r'data-next-url="([^"]+)"', page)
+            if not next_url:
+                return ids
+            response = self.client.get(next_url.group(1).replace('&amp;', '&'))
+
+    def test_desk_view_pages(self):
+        url = reverse('tasks_list', kwargs={'desk_slug': self.desk.slug})
+        response = self.client.get(url)
+        self.assertEqual(len(response.context['inactive_tasks'].object_list), 4)
+        self.assertContains(response, 'data-auto-load')
+
+        ids = self.follow_pages(url, {'state': 'inactive', 'after': 0}, r'toggle-task-status/(\d+)/')
+        self.assertEqual(ids, list(self.tasks.filter(is_active=False).order_by('id').values_list('id', flat=True)))
+
+    def test_manage_pages(self):
+        url = reverse('tasks_manage', kwargs={'desk_slug': self.desk.slug})
+        self.assertEqual(len(self.client.get(url).context['tasks'].object_list), 4)
+
+        ids = self.follow_pages(url, {'after': 0}, r'delete-task/(\d+)/')
+        self.assertEqual(ids, list(self.tasks.order_by('id').values_list('id', flat=True)))
+
+    def test_status_pages(self):
+        url = reverse('tasks_status', kwargs={'desk_slug': self.desk.slug})
+        since = (timezone.now() - timedelta(minutes=5)).isoformat()
+        data = self.client.get(url, {'since': since}).json()
+        ids = [task['id'] for task in data['tasks']]
+        while data['next']:
+            self.assertIn('since=', data['next'])
+            data = self.client.get(data['next']).json()
+            self.assertEqual(data['deleted'], [])
+            ids += [task['id'] for task in data['tasks']]
+        self.assertEqual(ids, list(self.tasks.order_by('id').values_list('id', flat=True)))
+
+
+class ScheduleScopeTests(TestCase):
+    """Schedules belong to a desk and are only visible through it"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('owner', password='password')
+        cls.desk = seed_desk(cls.user, 'Mine', 4)
+        cls.other = seed_desk(cls.user, 'Other', 4)
+        cls.schedule = Schedule.objects.get(desk=cls.desk)
+        cls.foreign = Schedule.objects.get(desk=cls.other)
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def test_manage_lists_only_desk_schedules(self):
+        response = self.client.get(reverse('tasks_manage', kwargs={'desk_slug': self.desk.slug}))
+        self.assertEqual(list(response.context['schedules']), [self.schedule])
+
+    def test_other_desk_schedule_not_found(self):
+        url = reverse('schedule_delete', kwargs={'desk_slug': self.desk.slug, 'schedule_id': self.foreign.id})
+        self.assertEqual(self.client.post(url).status_code, 404)
+        self.assertTrue(Schedule.objects.filter(id=self.foreign.id).exists())
+
+    def test_created_schedule_belongs_to_desk(self):
+        self.client.post(reverse('tasks_manage', kwargs={'desk_slug': self.desk.slug}), {
+            'form_type': 'schedule_form',
+            'title': 'Weekly',
+            'moments-TOTAL_FORMS': 1,
+            'moments-INITIAL_FORMS': 0,
+            'moments-0-day_of_week': 3,
+            'moments-0-time_of_day': '08:00',
+        })
+        self.assertEqual(Schedule.objects.get(title='Weekly').desk, self.desk)
+
+    def test_schedule_change_bumps_only_its_desk(self):
+        generations = dict(Desk.objects.values_list('id', 'generation'))
+        self.schedule.title = 'Renamed'
+        self.schedule.save()
+        after = dict(Desk.objects.values_list('id', 'generation'))
+        self.assertGreater(after[self.desk.id], generations[self.desk.id])
+        self.assertEqual(after[self.other.id], generations[self.other.id])
+
+    def test_unattached_schedule_is_kept_out_of_desks(self):
+        generations = dict(Desk.objects.values_list('id', 'generation'))
+        unattached = Schedule.objects.create(title='From before desks')
+        ScheduleMoment.objects.create(schedule=unattached, day_of_week=1, time_of_day=time(8, 0))
+        self.assertEqual(dict(Desk.objects.values_list('id', 'generation')), generations)
+        response = self.client.get(reverse('tasks_manage', kwargs={'desk_slug': self.desk.slug}))
+        self.assertNotIn(unattached, response.context['schedules'])
+
+
+class ScheduleEngineTests(TestCase):
+    """The event-driven engine keeps its heap of moments in step with the database"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('owner', password='password')
+        cls.desk = seed_desk(cls.user, 'Engine desk', 4)
+        cls.schedule = Schedule.objects.get(desk=cls.desk)
+        cls.moment = cls.schedule.moments.get()
+
+    def setUp(self):
+        self.engine = scheduler.ScheduleEngine(resync_interval=300)
+        for target, value in (
+            ('todo.scheduler._engine', self.engine),
+            # The test's connection holds its transaction
+            ('todo.scheduler.close_old_connections', lambda: None),
+        ):
+            patcher = mock.patch(target, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def fire_at(self, now):
+        return scheduler.next_fire_time(self.moment.day_of_week, self.moment.time_of_day, now)
+
+    def test_pops_due_moments_and_reschedules_them_a_week_later(self):
+        fire_at = self.fire_at(timezone.now())
+        self.engine.load(now=fire_at - timedelta(hours=1))
+        self.assertEqual(self.engine.next_fire_time(), fire_at)
+        self.assertEqual(self.engine.pop_due(fire_at - timedelta(seconds=1)), [])
+        self.assertEqual(self.engine.pop_due(fire_at), [self.moment.id])
+        self.assertEqual(self.engine.next_fire_time(), fire_at + timedelta(days=7))
+
+    def test_skips_stale_entries(self):
+        now = timezone.now()
+        self.engine.load(now=now)
+        self.moment.time_of_day = (timezone.localtime(self.fire_at(now)) + timedelta(hours=1)).time()
+        self.engine.schedule(self.moment, now)
+        self.assertEqual(self.engine.next_fire_time(), self.fire_at(now))
+        self.engine.discard(self.moment.id)
+        self.assertIsNone(self.engine.next_fire_time())
+        self.assertEqual(self.engine.pop_due(now + timedelta(days=8)), [])
+
+    def test_resync_fires_moments_due_since_last_wake_up(self):
+        fire_at = self.fire_at(timezone.now())
+        self.engine.resync_interval = 0
+        self.engine.load(now=fire_at - timedelta(minutes=1))
+        with mock.patch('todo.scheduler.activate_scheduled_tasks') as activate:
+            self.assertEqual(self.engine.tick(now=fire_at + timedelta(minutes=1)), [self.moment.id])
+        activate.assert_called_once_with(moment_ids=[self.moment.id])
+        self.assertEqual(self.engine.next_fire_time(), fire_at + timedelta(days=7))
+
+    def test_catches_up_on_start(self):
+        # Due ten minutes ago, while no engine was running
+        due_at = timezone.localtime() - timedelta(minutes=10)
+        ScheduleMoment.objects.filter(id=self.moment.id).update(day_of_week=due_at.weekday(), time_of_day=due_at.time())
+        self.engine.stop()
+        self.engine.run()
+        self.assertFalse(Task.objects.filter(schedule=self.schedule, is_active=False).exists())
+        self.assertEqual(ScheduleOccurrence.objects.filter(moment=self.moment).count(), 1)
+
+    def test_edited_schedule_is_rescheduled(self):
+        self.client.force_login(self.user)
+        url = reverse('schedule_edit', kwargs={'desk_slug': self.desk.slug, 'schedule_id': self.schedule.id})
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(url, {
+                'title': 'Edited',
+                'moments_count': 2,
+                'moment_id_0': self.moment.id, 'day_of_week_0': '2', 'time_of_day_0': '07:30',
+                'day_of_week_1': '4', 'time_of_day_1': '18:00',
+            })
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(self.engine._fire_times, {
+            moment.id: scheduler.next_fire_time(moment.day_of_week, moment.time_of_day, timezone.now())
+            for moment in self.schedule.moments.all()
+        })
+
+
+    def test_starts_embedded_only_when_configured(self):
+        with mock.patch('todo.scheduler.start') as start:
+            with override_settings(TASK_SCHEDULER={'mode': 'poll', 'embedded': True}):
+                self.assertIsNone(scheduler.start_embedded())
+            with override_settings(TASK_SCHEDULER={'mode': 'event', 'embedded': False}):
+                self.assertIsNone(scheduler.start_embedded())
+            with override_settings(TASK_SCHEDULER={'mode': 'event', 'embedded': True}):
+                self.assertIs(scheduler.start_embedded(), start.return_value)
+        start.assert_called_once_with()
+
+class SchedulerRunTests(TestCase):
+    """Every activation run records its scan cost and due-to-activation lag"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('owner', password='password')
+        cls.desk = seed_desk(cls.user, 'Scheduled desk', 30)
+        cls.moment = Schedule.objects.get().moments.get()
+
+    def test_records_run(self):
+        pending = Task.objects.filter(schedule__isnull=False, is_active=False).count()
+        activated = activate_scheduled_tasks(moment_ids=[self.moment.id])
+
+        run = SchedulerRun.objects.get()
+        self.assertEqual(run.trigger, 'event')
+        self.assertEqual(run.scanned, pending)
+        self.assertEqual(run.activated, len(activated))
+        self.assertEqual(run.skipped, 0)
+        self.assertAlmostEqual(run.max_lag, run.mean_lag, places=3)  # One moment, one due time
+        self.assertLess(run.max_lag, timedelta(days=7).total_seconds())
+
+    def test_skips_tasks_activated_meanwhile(self):
+        pending = set(Task.objects.filter(schedule__isnull=False, is_active=False).values_list('id', flat=True))
+        taken = min(pending)
+        active_before = Desk.objects.get(id=self.desk.id).active_task_count
+
+        def activated_by_another_run_first(task_ids, activated_at):
+            Task.objects.filter(id=taken).update(is_active=True)
+            return activate_tasks(task_ids, activated_at)
+
+        with mock.patch('todo.utils.activate_tasks', side_effect=activated_by_another_run_first), \
+                mock.patch('todo.utils.publish_task_changes') as publish:
+            activated = activate_scheduled_tasks(moment_ids=[self.moment.id])
+
+        self.assertEqual(set(activated), pending - {taken})
+        run = SchedulerRun.objects.get()
+        self.assertEqual((run.activated, run.skipped), (len(pending) - 1, 1))
+        self.assertEqual(Desk.objects.get(id=self.desk.id).active_task_count, active_before + len(pending) - 1)
+        self.assertEqual(
+            set(TaskEvent.objects.filter(kind=TaskEvent.SCHEDULED).values_list('task_id', flat=True)),
+            pending - {taken}
+        )
+        published = publish.call_args.args[1]
+        self.assertEqual({task['id'] for task in published}, pending - {taken})
+        versions = dict(Task.objects.filter(id__in=activated).values_list('id', 'version'))
+        self.assertTrue(all(task['version'] == versions[task['id']] for task in published))
+
+    @override_settings(TASK_SCHEDULER={'mode': 'poll', 'history_size': 2})
+    def test_keeps_rolling_history(self):
+        for _ in range(4):
+            activate_scheduled_tasks(moment_ids=[self.moment.id])
+        self.assertEqual(SchedulerRun.objects.count(), 2)
+        self.assertEqual(list(SchedulerRun.objects.values_list('scanned', flat=True)), [0, 0])
+
+
+class ScheduleOccurrenceTests(TestCase):
+    """Each moment fires once per week, so completed tasks stay completed"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('owner', password='password')
+        cls.desk = seed_desk(cls.user, 'Scheduled desk', 30)
+        # Due ten minutes ago, inside the poll's catch-up window
+        due_at = timezone.localtime() - timedelta(minutes=10)
+        cls.moment = Schedule.objects.get().moments.get()
+        cls.moment.day_of_week = due_at.weekday()
+        cls.moment.time_of_day = due_at.time()
+        cls.moment.save()
+
+    def test_fires_once_per_week(self):
+        activated = activate_scheduled_tasks()
+        self.assertTrue(activated)
+        self.assertEqual(ScheduleOccurrence.objects.filter(moment=self.moment).count(), 1)
+
+        Task.objects.filter(id=activated[0]).update(is_active=False)
+        self.assertEqual(activate_scheduled_tasks(), [])
+        self.assertEqual(activate_scheduled_tasks(moment_ids=[self.moment.id]), [])
+        self.assertFalse(Task.objects.get(id=activated[0]).is_active)
+
+    def test_overlapping_runs_claim_a_moment_once(self):
+        self.assertEqual(list(claim_due_moments([self.moment.id])), [self.moment.id])
+        # A second run finds the occurrence already inserted
+        self.assertEqual(claim_due_moments([self.moment.id]), {})
+        self.assertEqual(ScheduleOccurrence.objects.filter(moment=self.moment).count(), 1)
+
+    def test_ignores_moments_outside_catch_up_window(self):
+        ScheduleMoment.objects.filter(id=self.moment.id).update(
+            time_of_day=(timezone.localtime() - timedelta(hours=2)).time()
+        )
+        with override_settings(TASK_SCHEDULER={'mode': 'poll', 'catch_up': 3600}):
+            self.assertEqual(activate_scheduled_tasks(), [])
+        self.assertFalse(ScheduleOccurrence.objects.exists())
+
+
+class TaskImportTests(TestCase):
+    """Bulk imports validate every row and insert all or nothing by default"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('owner', password='password')
+        cls.desk = seed_desk(cls.user, 'Import desk', 0, category_count=1)
+
+    def setUp(self):
+        self.client.force_login(self.user)
+        self.url = reverse('tasks_import', kwargs={'desk_slug': self.desk.slug})
+
+    def post(self, body, content_type='application/x-ndjson', **params):
+        return self.client.post(f"{self.url}?{urlencode(params)}", body, content_type=content_type)
+
+    def test_reports_row_errors(self):
+        body = '\n'.join([
+            json.dumps({'title': 'Valid', 'category': 'Category 0'}),
+            json.dumps({'title': '', 'category': 'Category 0'}),
+            'not json',
+            json.dumps({'title': 'Unknown category', 'category': 'Missing'}),
+            json.dumps({'title': 'Unknown schedule', 'category': 'Category 0', 'schedule': 'Missing'}),
+        ])
+        response = self.post(body)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['created'], 0)
+        self.assertEqual([error['row'] for error in response.json()['errors']], [2, 3, 4, 5])
+        self.assertFalse(Task.objects.exists())
+
+        response = self.post(body, skip_invalid=1)
+        self.assertEqual(response.json()['created'], 1)
+        self.assertEqual(Task.objects.get().title, 'Valid')
+
+    def test_creates_missing_categories(self):
+        response = self.post('title,category\nFirst,New\nSecond,New\n', content_type='text/csv', create_categories=1)
+        self.assertEqual(response.json()['created'], 2)
+        self.assertEqual(Task.objects.filter(category__title='New', category__desk=self.desk).count(), 2)
+
+    def test_uploaded_csv_keeps_quoted_newlines(self):
+        upload = SimpleUploadedFile(
+            'tasks.csv',
+            b'\xef\xbb\xbftitle,description,category\r\nFirst,"Line one\r\nLine two",Category 0\r\n',
+            content_type='text/csv',
+        )
+        response = self.client.post(self.url, {'file': upload})
+        self.assertEqual(response.json()['created'], 1)
+        self.assertEqual(Task.objects.get().description, 'Line one\r\nLine two')
+
+    def test_dry_run(self):
+        response = self.post(json.dumps({'title': 'Valid', 'category': 'Category 0'}), dry_run=1)
+        self.assertTrue(response.json()['success'])
+        self.assertFalse(Task.objects.exists())
+
+
+class DeskExportTests(TestCase):
+    """Exports stream every record and read back through the importer"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('owner', password='password')
+        cls.desk = seed_desk(cls.user, 'Export desk', 25)
+
+    def setUp(self):
+        self.client.force_login(self.user)
+        self.url = reverse('desk_export', kwargs={'desk_slug': self.desk.slug})
+
+    def test_ndjson_record_types(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response['Content-Disposition'], f'attachment; filename="{self.desk.slug}.ndjson"')
+        records = [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+        types = [record['type'] for record in records]
+        self.assertEqual(types.count('desk'), 1)
+        self.assertEqual(types.count('category'), 5)
+        self.assertEqual(types.count('schedule'), 1)
+        self.assertEqual(types.count('moment'), 1)
+        self.assertEqual(types.count('task'), 25)
+
+    def test_csv_round_trip(self):
+        body = b''.join(self.client.get(self.url, {'format': 'csv'}).streaming_content).decode()
+        target = seed_desk(self.user, 'Import target', 0)
+        # Schedules are matched by title within the target desk
+        Schedule.objects.filter(desk=target).update(title=Schedule.objects.get(desk=self.desk).title)
+        response = self.client.post(
+            reverse('tasks_import', kwargs={'desk_slug': target.slug}),
+            body,
+            content_type='text/csv'
+        )
+        self.assertEqual(response.json()['created'], 25)
+
+    def test_asgi_streams_async(self):
+        async def export():
+            await self.async_client.aforce_login(self.user)
+            response = await self.async_client.get(self.url)
+            self.assertTrue(response.is_async)
+            return b''.join([chunk async for chunk in response.streaming_content])
+        self.assertEqual(async_to_sync(export)().count(b'"type": "task"'), 25)
+
+
+class SeedDataCommandTests(TestCase):
+    """seed_data builds a consistent dataset that the benchmarks can run on"""
+
+    def seed(self):
+        call_command(
+            'seed_data', '--users', '2', '--desks-per-user', '1', '--tasks-per-desk', '5',
+            '--batch-size', '3', '--prefix', 'tiny', '--seed', '1', stdout=io.StringIO()
+        )
+
+    def test_seed_data(self):
+        self.seed()
+        self.assertEqual(User.objects.filter(username__startswith='tiny-user-').count(), 2)
+        desks = Desk.objects.filter(slug__startswith='tiny-desk-')
+        self.assertEqual(desks.count(), 2)
+        for desk in desks:
+            self.assertEqual(desk.user_shares.count(), 1)
+            self.assertEqual(Task.objects.filter(category__desk=desk).count(), 5)
+            self.assertEqual(ScheduleMoment.objects.filter(schedule__desk=desk).count(), 9)
+        self.assertEqual(reconcile_task_counts(dry_run=True), (0, 0))
+
+    @override_settings(ALLOWED_HOSTS=['localhost'])
+    def test_benchmark_seeded_desk(self):
+        self.seed()
+        out = io.StringIO()
+        call_command('benchmark_views', '--desk', 'tiny-desk-1-0', '--iterations', '2', stdout=out)
+        report = json.loads(out.getvalue())
+        self.assertEqual(report['tasks'], 5)
+        self.assertGreater(report['results']['desk_view']['queries'], 0)
+
+
+# The commands send their requests as localhost
+@override_settings(ALLOWED_HOSTS=['localhost'])
+class BenchmarkCommandTests(TransactionTestCase):
+    """
+    The benchmark commands run end to end on a small desk. The async one
+    serves its requests from other threads, so the data is committed.
+    """
+
+    def setUp(self):
+        self.user = User.objects.create_user('owner', password='password')
+        seed_desk(self.user, 'Small', 2)
+        self.desk = seed_desk(self.user, 'Largest', 6)
+
+    def run_command(self, *args):
+        out = io.StringIO()
+        call_command(*args, stdout=out)
+        return json.loads(out.getvalue())
+
+    def test_benchmark_views(self):
+        report = self.run_command('benchmark_views', '--iterations', '1')
+        self.assertEqual(report['desk'], self.desk.slug)
+        self.assertEqual(report['tasks'], 6)
+        self.assertIn('activate_scheduled_tasks', report['results'])
+
+    def test_benchmark_async(self):
+        report = self.run_command('benchmark_async', '--requests', '2', '--concurrency', '2')
+        self.assertEqual(report['desk'], self.desk.slug)
+        self.assertEqual(report['results']['sync']['failures'], 0)
+        self.assertEqual(report['results']['async']['failures'], 0)
@@ -11,17 +11,25 @@ urlpatterns = [
     path('<slug:desk_slug>/add-task/', views.add_task, name='tasks_add'),
     path('<slug:desk_slug>/delete-task/<int:task_id>/', views.delete_task, name='tasks_delete'),
     path('<slug:desk_slug>/toggle-task-status/<int:task_id>/', views.toggle_task_status_manual, name='tasks_toggle'),
+    path('<slug:desk_slug>/tasks/batch/', views.batch_tasks, name='tasks_batch'),
     path('<slug:desk_slug>/tasks/status/', views.get_tasks_status, name='tasks_status'),
+    path('<slug:desk_slug>/tasks/events/', views.task_events, name='tasks_events'),
+    path('<slug:desk_slug>/tasks/import/', views.import_tasks, name='tasks_import'),
+    path('<slug:desk_slug>/export/', views.export_desk, name='desk_export'),
+    path('<slug:desk_slug>/stats/', views.desk_stats, name='desk_stats'),
 
-    # Schedule-related URLs
-    path('schedule/delete/<int:schedule_id>/', views.delete_schedule, name='schedule_delete'),
-    path('schedule/edit/<int:schedule_id>/', views.edit_schedule, name='schedule_edit'),
+    # Schedule-related URLs with desk slug
+    path('<slug:desk_slug>/schedule/delete/<int:schedule_id>/', views.delete_schedule, name='schedule_delete'),
+    path('<slug:desk_slug>/schedule/edit/<int:schedule_id>/', views.edit_schedule, name='schedule_edit'),
 
     # Category-related URLs with desk slug
     path('<slug:desk_slug>/manage-categories/', views.manage_categories, name='categories_manage'),
     path('<slug:desk_slug>/add-category/', views.add_category, name='categories_add'),
     path('<slug:desk_slug>/delete-category/<int:category_id>/', views.delete_category, name='categories_delete'),
     
+    # Search across every desk the user can open
+    path('tasks/search/', views.search_tasks, name='tasks_search'),
+
     # User-related URLs
     path('user/profile/', views.profile, name='user_profile'),
 ]
\ No newline at end of file
@@ -1,68 +1,408 @@
-from django.shortcuts import get_object_or_404
-from django.db.models import Q
-from desks.models import Desk, DeskUserShare
-from datetime import datetime
-from .models import Task
+from asgiref.sync import sync_to_async
+from django.http import Http404
+from desks.utils import resolve_desk_access, aresolve_desk_access
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from django.utils.functional import cached_property
+from datetime import datetime, timedelta
+from collections import defaultdict
+from .models import (
+    Task, Category, DeletedTask, SchedulerRun, ScheduleMoment, ScheduleOccurrence, TaskCountChanges, TaskEvent,
+    record_task_events,
+)
+from .pubsub import publish_task_changes
 import logging
+import time
 
 logger = logging.getLogger(__name__)
 
-def get_desk_by_slug(slug, user):
-    """Helper function to get a desk by slug and verify ownership or shared access"""
-    # Get desks where user is owner
-    desk_query = Q(slug=slug) & Q(user=user)
-    
-    # OR get desks shared with this user via DeskUserShare
-    shared_desk_ids = DeskUserShare.objects.filter(user=user).values_list('desk_id', flat=True)
-    if shared_desk_ids:
-        desk_query |= Q(slug=slug) & Q(id__in=shared_desk_ids)
-    
-    desk = get_object_or_404(Desk, desk_query)
-    return desk
+# Maximum number of task IDs per UPDATE when activating scheduled tasks
+ACTIVATION_CHUNK_SIZE = 500
+
+# How long deleted-task tombstones are kept; older status cursors get a full resync
+DELETED_TASK_RETENTION = timedelta(days=1)
+
+# Scheduler runs kept when TASK_SCHEDULER['history_size'] is not set
+SCHEDULER_HISTORY_SIZE = 10000
+
+# Seconds a missed moment may still fire late when TASK_SCHEDULER['catch_up'] is not set
+SCHEDULER_CATCH_UP = 3600
+
+# How long the occurrence ledger is kept; it only needs to cover the catch-up window
+SCHEDULE_OCCURRENCE_RETENTION = timedelta(weeks=2)
+
+# How far status cursors are stepped back to cover writes still being committed
+STATUS_CURSOR_OVERLAP = timedelta(seconds=2)
+
+def get_request_desk_access(request, slug):
+    """
+    Resolve the desk and the requesting user's permission level, memoized on
+    the request so repeated lookups within one request cost nothing.
+
+    Returns:
+        tuple: (desk, permission), or (None, None) without access
+    """
+    memo = request.__dict__.setdefault('_desk_access', {})
+    if slug not in memo:
+        memo[slug] = resolve_desk_access(slug, request.user)
+    return memo[slug]
+
+async def aget_request_desk_access(request, slug):
+    """Async version of get_request_desk_access(), sharing its memo"""
+    memo = request.__dict__.setdefault('_desk_access', {})
+    if slug not in memo:
+        memo[slug] = await aresolve_desk_access(slug, await request.auser())
+    return memo[slug]
+
+def parse_status_cursor(value):
+    """Parse a `since` cursor from the status endpoint, returning None if invalid"""
+    if not value:
+        return None
+    try:
+        since = parse_datetime(value)
+    except ValueError:
+        return None
+    if since is not None and timezone.is_naive(since):
+        since = timezone.make_aware(since)
+    return since
+
+def parse_page_cursor(value):
+    """Parse an `after` task ID cursor of a paged task list, returning None if invalid"""
+    try:
+        after = int(value)
+    except (TypeError, ValueError):
+        return None
+    return after if after >= 0 else None
 
-def toggle_task_status(task_id, desk):
+class TaskPage:
     """
-    Toggle a task's active status
+    One keyset page of tasks in ID order, starting after the task ID `after`.
+
+    Rows are only fetched on first use, so a page handed to a cached
+    template fragment costs no query when the fragment is served from cache.
+    One extra row is read to tell whether another page follows.
+    """
+    def __init__(self, tasks, after=None, page_size=None):
+        self.tasks = tasks
+        self.after = after
+        self.page_size = page_size or settings.TASK_PAGE_SIZE
+
+    def _query(self):
+        tasks = self.tasks if self.after is None else self.tasks.filter(id__gt=self.after)
+        return tasks.order_by('id')[:self.page_size + 1]
+
+    @cached_property
+    def _rows(self):
+        return list(self._query())
+
+    async def aload(self):
+        """Fetch the page's rows with the async ORM; returns the page"""
+        if '_rows' not in self.__dict__:
+            self.__dict__['_rows'] = [row async for row in self._query()]
+        return self
+
+    @property
+    def object_list(self):
+        return self._rows[:self.page_size]
+
+    @property
+    def next_after(self):
+        """ID to pass as `after` for the next page, or None on the last page"""
+        if len(self._rows) <= self.page_size:
+            return None
+        last = self._rows[self.page_size - 1]
+        return last['id'] if isinstance(last, dict) else last.id
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+class TaskVersionConflict(Exception):
+    """The task's version moved on since the client read it"""
+    def __init__(self, is_active, version):
+        super().__init__(f"Task is at version {version}")
+        self.is_active = is_active
+        self.version = version
+
+def toggle_task_status(task_id, desk, is_active=None, expected_version=None):
+    """
+    Toggle a task's active status, or set it, in one conditional UPDATE
+    scoped to the desk that returns the new state (UPDATE ... RETURNING,
+    SQLite 3.35+ or PostgreSQL). Setting the state the task is already in
+    writes nothing and returns it as it is. The task counters of its
+    category and desk move in the same transaction.
     
     Args:
         task_id: ID of the task to toggle
         desk: The desk object the task belongs to
+        is_active: State to set; the current state is flipped when None
+        expected_version: Only write if the task is still at this version
         
     Returns:
-        dict: Dictionary containing the updated task and status information
+        dict: The task's id, title, category__id, new is_active, version and status
+
+    Raises:
+        Http404: The task is not on the desk
+        TaskVersionConflict: The task is no longer at expected_version
     """
-    task = get_object_or_404(Task, id=task_id, category__desk=desk)
-    task.is_active = not task.is_active
-    task.save()
-    status = "completed" if not task.is_active else "active"
-    
-    return {
-        'task': task,
-        'is_active': task.is_active,
-        'status': status
+    new_state = "NOT is_active" if is_active is None else "%s"
+    params = [] if is_active is None else [bool(is_active)]
+    params += [connection.ops.adapt_datetimefield_value(timezone.now()), task_id, desk.pk]
+    sql = (
+        f"UPDATE {Task._meta.db_table} SET is_active = {new_state}, version = version + 1, updated_at = %s "
+        f"WHERE id = %s AND category_id IN (SELECT id FROM {Category._meta.db_table} WHERE desk_id = %s)"
+    )
+    if is_active is not None:
+        # Setting the current state writes nothing, so every write is a flip
+        sql += " AND is_active != %s"
+        params.append(bool(is_active))
+    if expected_version is not None:
+        sql += " AND version = %s"
+        params.append(expected_version)
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            cursor.execute(sql + " RETURNING title, category_id, is_active, version", params)
+            row = cursor.fetchone()
+
+        if row is None:
+            # Nothing written: tell a missing task from a stale version or a
+            # task already in the requested state
+            current = Task.objects.filter(id=task_id, category__desk=desk).values_list(
+                'title', 'category_id', 'is_active', 'version'
+            ).first()
+            if current is None:
+                raise Http404("No Task matches the given query.")
+            title, category_id, current_state, version = current
+            if current_state != is_active or expected_version not in (None, version):
+                raise TaskVersionConflict(current_state, version)
+            return {
+                'id': task_id,
+                'title': title,
+                'is_active': current_state,
+                'category__id': category_id,
+                'version': version,
+                'status': "active" if current_state else "completed",
+            }
+
+        title, category_id, is_active, version = row
+        # The raw UPDATE sends no post_save, so do what Task.save() and its
+        # receiver would
+        counts = TaskCountChanges()
+        counts.add(desk.pk, category_id, active=1 if is_active else -1)
+        counts.apply(bump_generation=True)
+        record_task_events([
+            (task_id, desk.pk, category_id, TaskEvent.ACTIVATED if is_active else TaskEvent.COMPLETED)
+        ])
+    task = {
+        'id': task_id,
+        'title': title,
+        'is_active': bool(is_active),
+        'category__id': category_id,
+        'version': version,
     }
+    publish_task_changes(desk.pk, [task])
+    return dict(task, status="active" if task['is_active'] else "completed")
+
+async def atoggle_task_status(task_id, desk, is_active=None, expected_version=None):
+    """Async version of toggle_task_status(), run in one hop to the database thread"""
+    return await sync_to_async(toggle_task_status)(task_id, desk, is_active, expected_version)
+
+def last_due_time(day_of_week, time_of_day, now):
+    """Return the latest local datetime at or before `now` on the given weekday and time"""
+    now = timezone.localtime(now)
+    days_back = (now.weekday() - day_of_week) % 7
+    due_at = timezone.make_aware(datetime.combine(now.date() - timedelta(days=days_back), time_of_day))
+    if due_at > now:
+        due_at -= timedelta(days=7)
+    return due_at
 
-def activate_scheduled_tasks():
+def week_of(moment_time):
+    """Return the Monday of the week a local datetime falls in"""
+    return moment_time.date() - timedelta(days=moment_time.weekday())
+
+def claim_due_moments(moment_ids=None, now=None):
     """
-    Activates tasks whose schedule moments match the current day and time.
+    Find the moments due and not yet fired this week, and record their
+    occurrences in the ledger (INSERT ... RETURNING, SQLite 3.35+ or
+    PostgreSQL). A moment another run already fired is left out.
+
+    Args:
+        moment_ids: IDs of moments known to be due. Without them, every moment
+            that came due within TASK_SCHEDULER['catch_up'] seconds is checked.
+        now: Time of the run; defaults to now
+
+    Returns:
+        dict: Due time of each claimed moment, keyed by moment ID
+    """
+    now = now or timezone.now()
+    moments = ScheduleMoment.objects.values_list('id', 'day_of_week', 'time_of_day')
+    if moment_ids is not None:
+        moments = moments.filter(id__in=moment_ids)
+        window_start = None
+    else:
+        catch_up = timedelta(seconds=settings.TASK_SCHEDULER.get('catch_up', SCHEDULER_CATCH_UP))
+        window_start = now - catch_up
+        # Only the weekdays the catch-up window covers
+        local_now = timezone.localtime(now)
+        days = {(local_now - timedelta(days=i)).weekday() for i in range(min(catch_up.days + 2, 7))}
+        moments = moments.filter(day_of_week__in=days)
+
+    due_times = {}
+    for moment_id, day_of_week, time_of_day in moments:
+        due_at = last_due_time(day_of_week, time_of_day, now)
+        if window_start is None or due_at > window_start:
+            due_times[moment_id] = due_at
+    if not due_times:
+        return {}
+
+    # The unique (moment, week) constraint settles concurrent runs: only the
+    # rows this run inserts come back, so a moment is claimed by one run
+    occurrences = [(moment_id, week_of(due_at)) for moment_id, due_at in due_times.items()]
+    fired_at = connection.ops.adapt_datetimefield_value(now)
+    sql = (
+        f"INSERT INTO {ScheduleOccurrence._meta.db_table} (moment_id, week, fired_at) VALUES {{}} "
+        f"ON CONFLICT (moment_id, week) DO NOTHING RETURNING moment_id"
+    )
+    claimed = set()
+    with connection.cursor() as cursor:
+        for start in range(0, len(occurrences), ACTIVATION_CHUNK_SIZE):
+            chunk = occurrences[start:start + ACTIVATION_CHUNK_SIZE]
+            cursor.execute(sql.format(', '.join(['(%s, %s, %s)'] * len(chunk))), [
+                value
+                for moment_id, week in chunk
+                for value in (moment_id, connection.ops.adapt_datefield_value(week), fired_at)
+            ])
+            claimed.update(moment_id for moment_id, in cursor.fetchall())
+    return {moment_id: due_at for moment_id, due_at in due_times.items() if moment_id in claimed}
+
+def activate_scheduled_tasks(moment_ids=None):
+    """
+    Activates the tasks of schedule moments that came due and have not fired
+    yet this week, recording the run's cost and activation lag as a
+    SchedulerRun. Tasks completed after their moment fired stay completed.
+
+    Args:
+        moment_ids: Optional IDs of the schedule moments that just came due.
+            When given, only tasks scheduled by those moments are activated.
+
+    Returns:
+        list: IDs of the tasks that were activated
     """
     logger.info("Running activate_scheduled_tasks...")
-    now = datetime.now()
-    current_day = now.weekday()  # Monday is 0, Sunday is 6
-    current_time = now.time()
-
-    # Find tasks with matching schedule moments
-    tasks_to_activate = Task.objects.filter(
-        schedule__moments__day_of_week=current_day,
-        schedule__moments__time_of_day__lte=current_time,
-        is_active=False
-    ).distinct()
-
-    # Activate each task using toggle_task_status
-    for task in tasks_to_activate:
-        try:
-            toggle_task_status(task.id, task.category.desk)
-            logger.info(f"Activated task {task.id}")
-        except Exception as e:
-            # Log the error
-            logger.error(f"Error activating task {task.id}: {e}")
\ No newline at end of file
+    started_at = timezone.now()
+    started = time.perf_counter()
+
+    # Claim the moments, collect the task IDs once, then flip them in
+    # chunked set-based UPDATEs
+    with transaction.atomic():
+        moment_due_times = claim_due_moments(moment_ids, started_at)
+        due_times = {}
+        scanned = 0
+        if moment_due_times:
+            # One row per task and due moment; the moment gives the due time
+            # Locked so exactly these tasks are activated and counted
+            rows = Task.objects.select_for_update(of=('self',)).filter(
+                schedule__moments__id__in=moment_due_times,
+                is_active=False
+            ).values_list('id', 'schedule__moments__id')
+            for task_id, moment_id in rows:
+                scanned += 1
+                due_at = moment_due_times[moment_id]
+                due_times[task_id] = max(due_at, due_times.get(task_id, due_at))
+        task_ids = list(due_times)
+        activated_at = timezone.now()
+        tasks = activate_tasks(task_ids, activated_at)
+        activated = len(tasks)
+
+        # Push the new state to live subscribers of each affected desk
+        tasks_by_desk = defaultdict(list)
+        counts = TaskCountChanges()
+        for task_id, (title, category_id, desk_id, version) in tasks.items():
+            counts.add(desk_id, category_id, active=1)
+            tasks_by_desk[desk_id].append({
+                'id': task_id,
+                'title': title,
+                'category__id': category_id,
+                'is_active': True,
+                'version': version,
+            })
+        counts.apply(bump_generation=True)
+        record_task_events([
+            (task_id, desk_id, category_id, TaskEvent.SCHEDULED)
+            for task_id, (title, category_id, desk_id, version) in tasks.items()
+        ], at=activated_at)
+        for desk_id, desk_tasks in tasks_by_desk.items():
+            publish_task_changes(desk_id, desk_tasks)
+
+    lags = [(activated_at - due_times[task_id]).total_seconds() for task_id in tasks]
+    record_scheduler_run(
+        started_at=started_at,
+        trigger='event' if moment_ids is not None else 'poll',
+        duration=time.perf_counter() - started,
+        scanned=scanned,
+        activated=activated,
+        skipped=len(task_ids) - activated,
+        mean_lag=sum(lags) / len(lags) if lags else None,
+        max_lag=max(lags, default=None),
+    )
+    logger.info(f"Activated {activated} scheduled tasks")
+    activated_ids = [task_id for task_id in task_ids if task_id in tasks]
+    logger.debug(f"Activated task IDs: {activated_ids}")
+    return activated_ids
+
+def activate_tasks(task_ids, activated_at):
+    """
+    Activate the inactive tasks among task_ids in chunked UPDATE ... RETURNING
+    statements. Only the rows each UPDATE flipped come back, so a task
+    activated in the meantime is neither counted nor announced twice.
+
+    Returns:
+        dict: (title, category ID, desk ID, new version) of each task
+        activated, keyed by task ID
+    """
+    tasks = {}
+    sql = (
+        f"UPDATE {Task._meta.db_table} SET is_active = %s, version = version + 1, updated_at = %s "
+        f"WHERE id IN ({{}}) AND NOT is_active "
+        f"RETURNING id, title, category_id, "
+        f"(SELECT desk_id FROM {Category._meta.db_table} WHERE id = category_id), version"
+    )
+    with connection.cursor() as cursor:
+        for start in range(0, len(task_ids), ACTIVATION_CHUNK_SIZE):
+            chunk = task_ids[start:start + ACTIVATION_CHUNK_SIZE]
+            cursor.execute(
+                sql.format(', '.join(['%s'] * len(chunk))),
+                [True, connection.ops.adapt_datetimefield_value(activated_at), *chunk]
+            )
+            for task_id, title, category_id, desk_id, version in cursor.fetchall():
+                tasks[task_id] = (title, category_id, desk_id, version)
+    return tasks
+
+def record_scheduler_run(**fields):
+    """Store a SchedulerRun and drop runs beyond the configured history size"""
+    try:
+        with transaction.atomic():
+            run = SchedulerRun.objects.create(**fields)
+            history_size = settings.TASK_SCHEDULER.get('history_size', SCHEDULER_HISTORY_SIZE)
+            SchedulerRun.objects.filter(id__lte=run.id - history_size).delete()
+    except Exception as e:
+        # Telemetry must never fail the activation itself
+        logger.error(f"Error recording scheduler run: {e}")
+
+def prune_deleted_tasks():
+    """Remove tombstones older than DELETED_TASK_RETENTION."""
+    cutoff = timezone.now() - DELETED_TASK_RETENTION
+    deleted, _ = DeletedTask.objects.filter(deleted_at__lt=cutoff).delete()
+    logger.info(f"Pruned {deleted} deleted task tombstones")
+    return deleted
+
+def prune_schedule_occurrences():
+    """Remove ledger entries older than SCHEDULE_OCCURRENCE_RETENTION."""
+    cutoff = timezone.now() - SCHEDULE_OCCURRENCE_RETENTION
+    deleted, _ = ScheduleOccurrence.objects.filter(fired_at__lt=cutoff).delete()
+    logger.info(f"Pruned {deleted} schedule occurrences")
+    return deleted
\ No newline at end of file
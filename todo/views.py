@@ -1,13 +1,30 @@
+import asyncio
+import csv
+import io
+import json
+import queue
+import time
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.core.serializers.json import DjangoJSONEncoder
 from django.shortcuts import render, get_object_or_404, redirect
-from django.http import JsonResponse, HttpResponseBadRequest
+from django.urls import reverse
+from django.http import HttpResponse, JsonResponse, HttpResponseBadRequest, StreamingHttpResponse
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.utils import timezone
 
-from .utils import toggle_task_status
-from .models import Task, Category, UserProfile, Schedule, ScheduleMoment
+from .utils import (
+    atoggle_task_status, parse_status_cursor, parse_page_cursor, TaskPage, TaskVersionConflict,
+    DELETED_TASK_RETENTION, STATUS_CURSOR_OVERLAP,
+)
+from .models import Task, Category, UserProfile, Schedule, ScheduleMoment, DeletedTask
 from .forms import TaskForm, CategoryForm, ScheduleForm, ScheduleMomentFormSet
-from .decorators import get_desk
+from .decorators import get_desk, desk_conditional
+from .pubsub import get_pubsub, desk_channel
+from . import analytics, exporters, importers, mutations, search
 
 def home(request):
     """Redirect authenticated users to their desks list or login page if not authenticated"""
@@ -20,22 +37,49 @@ def home(request):
 #------------#
 
 @get_desk
+@desk_conditional
 @login_required
 def desk_view(request, desk):
-    # Optimize with prefetch_related
-    tasks = Task.objects.filter(category__desk=desk).select_related('category')
+    """
+    Show the first page of the desk's active and suggested tasks. With
+    `state` and `after` only the following page of that list is rendered,
+    for the page's "load more" items.
+    """
+    tasks = Task.objects.filter(category__desk=desk)
+    state = request.GET.get('state')
+    if state in ('active', 'inactive'):
+        return render(request, 'desk/task-items.html', {
+            'desk': desk,
+            'state': state,
+            'page': TaskPage(tasks.filter(is_active=state == 'active'), parse_page_cursor(request.GET.get('after'))),
+        })
+
+    # Lazy pages: they only hit the database when a cached fragment misses
     categories = Category.objects.filter(desk=desk)
     return render(request, 'desk/task-list.html', {
         'desk': desk,
-        'tasks': tasks,
+        'active_tasks': TaskPage(tasks.filter(is_active=True)),
+        'inactive_tasks': TaskPage(tasks.filter(is_active=False)),
         'categories': categories,
+        'fragment_timeout': settings.TASK_FRAGMENT_TIMEOUT,
+        'stream_poll_interval': settings.TASK_EVENTS.get('stream_poll_interval', 5),
         'show_navbar': True,
         'show_footer': True
     })
 
 @get_desk
+@desk_conditional
 @login_required
 def manage_tasks(request, desk):
+    tasks = Task.objects.filter(category__desk=desk).select_related('category', 'schedule')
+    after = parse_page_cursor(request.GET.get('after'))
+    if request.method == 'GET' and after is not None:
+        # The rows following a "load more" item
+        return render(request, 'desk/task-rows.html', {
+            'desk': desk,
+            'page': TaskPage(tasks, after),
+        })
+
     if request.method == 'POST':
         # Check if it's a schedule form submission
         if 'form_type' in request.POST and request.POST['form_type'] == 'schedule_form':
@@ -43,7 +87,9 @@ def manage_tasks(request, desk):
             moment_formset = ScheduleMomentFormSet(request.POST)
 
             if schedule_form.is_valid() and moment_formset.is_valid():
-                schedule = schedule_form.save()
+                schedule = schedule_form.save(commit=False)
+                schedule.desk = desk
+                schedule.save()
                 moments = moment_formset.save(commit=False)
                 for moment in moments:
                     moment.schedule = schedule
@@ -66,7 +112,7 @@ def manage_tasks(request, desk):
                 
                 # Add schedule if selected
                 if schedule_id:
-                    task.schedule = get_object_or_404(Schedule, id=schedule_id)
+                    task.schedule = get_object_or_404(Schedule, id=schedule_id, desk=desk)
                 
                 task.save()
                 messages.success(request, f"Task '{title}' created successfully.")
@@ -76,15 +122,13 @@ def manage_tasks(request, desk):
         schedule_form = ScheduleForm()
         moment_formset = ScheduleMomentFormSet()
 
-    # Get all schedules
-    schedules = Schedule.objects.prefetch_related('moments').all()
+    # Get the desk's schedules
+    schedules = Schedule.objects.filter(desk=desk).prefetch_related('moments')
 
-    # Get tasks and categories
-    tasks = Task.objects.filter(category__desk=desk).select_related('category', 'schedule')
     categories = Category.objects.filter(desk=desk)
 
     return render(request, 'desk/manage-tasks.html', {
-        'tasks': tasks, 
+        'tasks': TaskPage(tasks),
         'categories': categories,
         'desk': desk,
         'schedule_form': schedule_form,
@@ -125,39 +169,303 @@ def delete_task(request, desk, task_id):
 
 @get_desk
 @login_required
-def toggle_task_status_manual(request, desk, task_id):
-    """Toggle a task's active status on a specific desk"""
+async def toggle_task_status_manual(request, desk, task_id):
+    """
+    Toggle a task's active status on a specific desk, or set it with
+    `is_active`. With `version` the write only happens if the task is still
+    at that version; otherwise 409 is returned with the current state.
+    """
     if request.method == 'POST':
-        result = toggle_task_status(task_id, desk)
+        is_active = request.POST.get('is_active')
+        version = request.POST.get('version')
+        if is_active is not None:
+            is_active = is_active in ('1', 'true', 'on')
+        try:
+            version = int(version) if version else None
+        except ValueError:
+            return JsonResponse({'success': False, 'message': "Invalid version."}, status=400)
+        try:
+            result = await atoggle_task_status(task_id, desk, is_active, version)
+        except TaskVersionConflict as e:
+            return JsonResponse({
+                'success': False,
+                'conflict': True,
+                'is_active': e.is_active,
+                'version': e.version,
+                'message': "Task was changed by someone else."
+            }, status=409)
         return JsonResponse({
             'success': True, 
             'is_active': result['is_active'],
+            'version': result['version'],
             'message': f"Task marked as {result['status']}."
         })
     return JsonResponse({'success': False}, status=400)
 
 @get_desk
 @login_required
-def get_tasks_status(request, desk):
-    """Return the current status of all tasks for a desk."""
-    tasks = Task.objects.filter(category__desk=desk).values(
+def batch_tasks(request, desk):
+    """
+    Apply a JSON list of task operations (set state, move, delete) in one
+    transaction and return a result per operation. See todo.mutations.
+    """
+    if request.method != 'POST':
+        return JsonResponse({'success': False}, status=400)
+    try:
+        operations = mutations.parse_operations(request.body)
+    except mutations.BatchFormatError as e:
+        return JsonResponse({'success': False, 'error': str(e)}, status=400)
+    results = mutations.apply_task_operations(desk, operations)
+    return JsonResponse({'success': all(result['ok'] for result in results), 'results': results})
+
+@get_desk
+@desk_conditional
+@login_required
+async def get_tasks_status(request, desk):
+    """
+    Return the current status of tasks for a desk.
+
+    Without a `since` cursor every task is returned. With one, only tasks
+    changed or deleted after it are, along with the cursor for the next call.
+    Tasks come in pages of TASK_PAGE_SIZE in ID order; `next` is the URL of
+    the following page, if any, and deletions are only listed on the first.
+    Pollers should keep the `cursor` of an update's first page.
+    """
+    page, deleted, since, full, cursor = query_tasks_status(request, desk)
+    await page.aload()
+    deleted = [task_id async for task_id in deleted] if deleted is not None else []
+    return render_tasks_status(request, page, deleted, since, full, cursor)
+
+def query_tasks_status(request, desk):
+    """
+    Build the lazy queries of a status request, shared by the async view
+    and the sync one of the benchmark_async command.
+
+    Returns:
+        tuple: (TaskPage, queryset of deleted task IDs or None, since
+        cursor, whether every task is listed, cursor for the next call)
+    """
+    # Step the cursor back a little so writes still committing are not missed
+    cursor = timezone.now() - STATUS_CURSOR_OVERLAP
+    since = parse_status_cursor(request.GET.get('since'))
+    after = parse_page_cursor(request.GET.get('after'))
+    # Cursors older than the tombstone retention cannot see every deletion
+    full = since is None or since < cursor - DELETED_TASK_RETENTION
+
+    tasks = Task.objects.filter(category__desk=desk)
+    deleted = None
+    if not full:
+        tasks = tasks.filter(updated_at__gte=since)
+        if after is None:
+            deleted = DeletedTask.objects.filter(
+                desk_id=desk.id,
+                deleted_at__gte=since
+            ).values_list('task_id', flat=True)
+
+    page = TaskPage(tasks.values(
         'id', 
         'title', 
         'is_active', 
-        'category__id'
-    )
-    # Add debug information
+        'category__id',
+        'version'
+    ), after)
+    return page, deleted, since, full, cursor
+
+def render_tasks_status(request, page, deleted, since, full, cursor):
+    """Answer a status request from its loaded page and deleted task IDs"""
+    tasks = page.object_list
+    next_url = None
+    if page.next_after is not None:
+        params = {'after': page.next_after}
+        if not full:
+            params['since'] = since.isoformat()
+        next_url = f"{request.path}?{urlencode(params)}"
+    if not full and not tasks and not deleted:
+        # Hand the same cursor back so unchanged polls repeat the same URL
+        # and can be answered with 304 Not Modified
+        cursor = since
     return JsonResponse({
-        'tasks': list(tasks),
+        'tasks': tasks,
+        'deleted': deleted,
+        'full': full,
+        'next': next_url,
+        'cursor': cursor.isoformat(),
         'timestamp': timezone.now().isoformat(),
         'count': len(tasks)
     })
 
+@get_desk
+@login_required
+async def task_events(request, desk):
+    """
+    Stream the desk's task state changes as Server-Sent Events.
+
+    Under WSGI an async stream would be read to its end before anything is
+    sent, so a blocking stream is served instead. It holds a worker thread,
+    and ends after TASK_EVENTS['sync_timeout'] seconds so the browser
+    reconnects; with a timeout of 0 the endpoint answers 204 No Content and
+    clients fall back to polling.
+    """
+    if isinstance(request, ASGIRequest):
+        stream = _task_event_stream(desk.id)
+    else:
+        timeout = settings.TASK_EVENTS.get('sync_timeout', 300)
+        if not timeout:
+            return HttpResponse(status=204)
+        stream = _task_event_stream_sync(desk.id, timeout)
+    response = StreamingHttpResponse(stream, content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # Stop proxies from buffering the stream
+    return response
+
+def _event(message):
+    return f"data: {json.dumps(message, cls=DjangoJSONEncoder)}\n\n"
+
+async def _task_event_stream(desk_id):
+    subscription = get_pubsub().subscribe(desk_channel(desk_id))
+    heartbeat = settings.TASK_EVENTS.get('heartbeat', 15)
+    try:
+        # Ask the browser to wait 5 seconds before reconnecting
+        yield 'retry: 5000\n\n'
+        while True:
+            try:
+                message = await asyncio.wait_for(subscription.get(), timeout=heartbeat)
+            except asyncio.TimeoutError:
+                yield ': keep-alive\n\n'
+                continue
+            yield _event(message)
+    finally:
+        subscription.close()
+
+def _task_event_stream_sync(desk_id, timeout):
+    """Blocking version of _task_event_stream() for WSGI, ending after timeout seconds"""
+    subscription = get_pubsub().subscribe(desk_channel(desk_id), blocking=True)
+    heartbeat = settings.TASK_EVENTS.get('heartbeat', 15)
+    deadline = time.monotonic() + timeout
+    try:
+        yield 'retry: 5000\n\n'
+        while (remaining := deadline - time.monotonic()) > 0:
+            try:
+                message = subscription.get(timeout=min(heartbeat, remaining))
+            except queue.Empty:
+                # Also how a closed connection is noticed, by the failed write
+                yield ': keep-alive\n\n'
+                continue
+            yield _event(message)
+    finally:
+        subscription.close()
+
+@get_desk
+@login_required
+def import_tasks(request, desk):
+    """
+    Bulk import tasks from an uploaded CSV or NDJSON file, or the raw body.
+
+    The format comes from the `format` parameter, else the file name or
+    content type. Pass skip_invalid=1 to insert valid rows despite errors,
+    create_categories=1 to create missing categories and dry_run=1 to
+    validate only.
+    """
+    if request.method != 'POST':
+        return JsonResponse({'success': False}, status=400)
+
+    upload = request.FILES.get('file')
+    if upload is not None:
+        format = request.GET.get('format') or importers.detect_format(upload.name, upload.content_type)
+        lines = io.TextIOWrapper(upload.file, encoding='utf-8-sig', newline='')
+    else:
+        format = request.GET.get('format') or importers.detect_format(content_type=request.content_type)
+        lines = io.StringIO(request.body.decode('utf-8-sig'))
+
+    def flag(name):
+        return request.GET.get(name, request.POST.get(name)) in ('1', 'true', 'on')
+
+    try:
+        result = importers.import_tasks(
+            desk,
+            importers.read_rows(lines, format),
+            create_categories=flag('create_categories'),
+            skip_invalid=flag('skip_invalid'),
+            dry_run=flag('dry_run'),
+        )
+    except (importers.ImportFormatError, UnicodeDecodeError, csv.Error) as e:
+        return JsonResponse({'success': False, 'error': str(e)}, status=400)
+
+    success = result['created'] > 0 or not result['error_count']
+    return JsonResponse(dict(result, success=success), status=200 if success else 400)
+
+@get_desk
+@login_required
+def export_desk(request, desk):
+    """Stream the desk's categories, schedules and tasks as NDJSON or CSV (?format=)"""
+    format = request.GET.get('format', 'ndjson')
+    if format not in exporters.FORMATS:
+        return HttpResponseBadRequest(f"Unknown format, expected one of {', '.join(exporters.FORMATS)}")
+    return exporters.export_response(request, desk, format)
+
+@get_desk
+@login_required
+def desk_stats(request, desk):
+    """
+    Return how often the desk's scheduled tasks are completed on time, per
+    day (?days=, default 30), per hour (?hours=, default 24) and per category,
+    read from the task rollups. See todo.analytics.
+    """
+    ranges = {}
+    for name, default, longest in (('days', 30, analytics.MAX_STATS_DAYS), ('hours', 24, analytics.MAX_STATS_HOURS)):
+        try:
+            ranges[name] = int(request.GET.get(name, default))
+        except ValueError:
+            return HttpResponseBadRequest(f"{name.capitalize()} must be a number")
+        if not 1 <= ranges[name] <= longest:
+            return HttpResponseBadRequest(f"{name.capitalize()} must be between 1 and {longest}")
+
+    stats = analytics.desk_stats(desk, **ranges)
+    return JsonResponse(dict(
+        stats,
+        desk=desk.slug,
+        on_time_window=settings.TASK_ANALYTICS.get('on_time', analytics.ON_TIME_WINDOW),
+    ))
+
+@login_required
+def search_tasks(request):
+    """
+    Search task titles, descriptions and category titles across every desk
+    the user owns or shares (?q=, ?page=), best matches first.
+    """
+    query = request.GET.get('q', '')
+    try:
+        page = int(request.GET.get('page', 1))
+    except ValueError:
+        return HttpResponseBadRequest("Page must be a number")
+    if not 1 <= page <= search.MAX_SEARCH_PAGE:
+        return HttpResponseBadRequest(f"Page must be between 1 and {search.MAX_SEARCH_PAGE}")
+
+    results, has_next = search.search_tasks(request.user, query, page)
+    return JsonResponse({
+        'query': query,
+        'page': page,
+        'results': [
+            {
+                'id': row['id'],
+                'title': row['title'],
+                'description': row['description'],
+                'is_active': row['is_active'],
+                'category': row['category__title'],
+                'desk': row['category__desk__name'],
+                'url': reverse('tasks_list', kwargs={'desk_slug': row['category__desk__slug']}),
+            }
+            for row in results
+        ],
+        'next': f"{request.path}?{urlencode({'q': query, 'page': page + 1})}" if has_next else None,
+    })
+
 #----------------#
 # CATEGORY VIEWS #
 #----------------#
 
 @get_desk
+@desk_conditional
 @login_required
 def manage_categories(request, desk):
     """Manage categories for a specific desk"""
@@ -210,19 +518,21 @@ def delete_category(request, desk, category_id):
 # SCHEDULE VIEWS #
 #-----------------#
 
+@get_desk
 @login_required
-def delete_schedule(request, schedule_id):
-    """Delete a schedule."""
-    schedule = get_object_or_404(Schedule, id=schedule_id)
+def delete_schedule(request, desk, schedule_id):
+    """Delete a schedule from a specific desk."""
+    schedule = get_object_or_404(Schedule, id=schedule_id, desk=desk)
     schedule_name = schedule.title
     schedule.delete()
     messages.success(request, f"Schedule '{schedule_name}' deleted successfully.")
-    return redirect(request.META.get('HTTP_REFERER', 'tasks_manage'))
+    return redirect(request.META.get('HTTP_REFERER') or reverse('tasks_manage', kwargs={'desk_slug': desk.slug}))
 
+@get_desk
 @login_required
-def edit_schedule(request, schedule_id):
-    """Edit an existing schedule."""
-    schedule = get_object_or_404(Schedule, id=schedule_id)
+def edit_schedule(request, desk, schedule_id):
+    """Edit an existing schedule on a specific desk."""
+    schedule = get_object_or_404(Schedule, id=schedule_id, desk=desk)
     
     if request.method == 'POST':
         # Update schedule title
@@ -244,7 +554,7 @@ def edit_schedule(request, schedule_id):
             if day_of_week and time_of_day:
                 if moment_id:
                     # Update existing moment
-                    moment = get_object_or_404(ScheduleMoment, id=moment_id)
+                    moment = get_object_or_404(ScheduleMoment, id=moment_id, schedule=schedule)
                     moment.day_of_week = day_of_week
                     moment.time_of_day = time_of_day
                     moment.save()
@@ -262,7 +572,7 @@ def edit_schedule(request, schedule_id):
         schedule.moments.exclude(id__in=processed_moment_ids).delete()
         
         messages.success(request, f"Schedule '{schedule.title}' updated successfully.")
-        return redirect(request.META.get('HTTP_REFERER', 'tasks_manage'))
+        return redirect(request.META.get('HTTP_REFERER') or reverse('tasks_manage', kwargs={'desk_slug': desk.slug}))
         
     return HttpResponseBadRequest("Invalid request method")
 